@@ -0,0 +1,295 @@
+from logging_config import get_logger, set_hot_path_logging
+from main import initialize_modules, simulation_loop
+from storage import STORAGE_BACKENDS, MemoryStorage
+from collections import defaultdict, namedtuple
+from contextlib import redirect_stdout
+from time import perf_counter
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+
+# Places a crash can be injected:
+# - log_append: the process dies half-way through appending a log entry (a torn entry is left behind).
+# - write_database: the process dies half-way through writing the database file.
+# - after_commit: the commit entry reached the log, but nothing after it (no flush, no lock release) happened.
+# - max_cycles: no injection; the run stops at max_cycles as in a normal simulation.
+CRASH_POINTS = ("log_append", "write_database", "after_commit", "max_cycles")
+
+CrashTrialResult = namedtuple(
+    "CrashTrialResult",
+    ["point", "crash_after", "seed", "crashed", "consistent", "mismatches", "log_records", "log_bytes",
+     "recovery_seconds"]
+)
+RecoveryBenchmarkResult = namedtuple("RecoveryBenchmarkResult", ["cycles", "log_records", "log_bytes",
+                                                                 "recovery_seconds"])
+
+
+class SimulatedCrash(Exception):
+    """Raised by an injected crash point to stop the simulation as if the process had died."""
+
+
+class CrashInjector:
+    def __init__(self, point, crash_after=1):
+        """
+        Initialize the CrashInjector.
+        - point: One of CRASH_POINTS.
+        - crash_after: Crash on this occurrence of the crash point (1 = the first one).
+        """
+        if point not in CRASH_POINTS:
+            raise ValueError(f"Unknown crash point {point!r}; expected one of {CRASH_POINTS}.")
+        self.point = point
+        self.crash_after = crash_after
+        self.occurrences = 0
+        self.logger = get_logger(self.__class__.__name__)
+
+    def attach(self, db_handler, recovery_manager):
+        """
+        Install the crash point on the given module instances.
+        Attach after any CommitOracle so the oracle observes exactly what reached the log.
+        """
+        if self.point == "log_append":
+            self._wrap_log_append(recovery_manager)
+        elif self.point == "write_database":
+            self._wrap_write_database(db_handler)
+        elif self.point == "after_commit":
+            self._wrap_commit(recovery_manager)
+
+    def _due(self):
+        self.occurrences += 1
+        return self.occurrences == self.crash_after
+
+    def _crash(self, detail):
+        self.logger.warning("Injected crash at %s #%s: %s", self.point, self.occurrences, detail)
+        raise SimulatedCrash(f"{self.point} #{self.occurrences}: {detail}")
+
+    def _wrap_log_append(self, recovery_manager):
+        append_entry = recovery_manager._append_entry
+
+        def crashing_append_entry(line, lsn, sync=False):
+            if not self._due():
+                return append_entry(line, lsn, sync=sync)
+            append_entry(line[:len(line) // 2], lsn)
+            self._crash(f"torn log entry {line.strip()!r}")
+
+        recovery_manager._append_entry = crashing_append_entry
+
+    def _wrap_write_database(self, db_handler):
+        write_database = db_handler.write_database
+
+        def crashing_write_database():
+            if not self._due():
+                return write_database()
+            content = ",".join(map(str, db_handler.buffer)) + "\n"
+            with db_handler.storage.open(db_handler.db_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content[:len(content) // 2])
+            self._crash("database file half written")
+
+        db_handler.write_database = crashing_write_database
+
+    def _wrap_commit(self, recovery_manager):
+        write_log = recovery_manager.write_log
+
+        def crashing_write_log(transaction_id, data_id=None, old_value=None, operation=None, prev_lsn=None, items=None):
+            lsn = write_log(transaction_id, data_id=data_id, old_value=old_value, operation=operation,
+                            prev_lsn=prev_lsn, items=items)
+            if operation in ("C", "M") and self._due():
+                self._crash(f"transaction {transaction_id} committed but not flushed")
+            return lsn
+
+        recovery_manager.write_log = crashing_write_log
+
+
+class CommitOracle:
+    def __init__(self, initial_state):
+        """
+        Initialize the CommitOracle.
+        It replays, independently of RecoveryManager, the writes of every transaction whose commit entry
+        was completely appended to the log; that is the state recovery has to reproduce.
+        - initial_state: Database contents when the run started (after the previous recovery).
+        """
+        self.state = list(initial_state)
+        self.pending_writes = defaultdict(list)  # {transaction_id: [(data_id, new_value)]}
+        self.committed = []
+
+    def attach(self, recovery_manager):
+        """Observe every entry the recovery manager appends to the log."""
+        write_log = recovery_manager.write_log
+
+        def observed_write_log(transaction_id, data_id=None, old_value=None, operation=None, prev_lsn=None, items=None):
+            lsn = write_log(transaction_id, data_id=data_id, old_value=old_value, operation=operation,
+                            prev_lsn=prev_lsn, items=items)
+            self.observe(transaction_id, data_id, old_value, operation, items)
+            return lsn
+
+        recovery_manager.write_log = observed_write_log
+
+    def observe(self, transaction_id, data_id, old_value, operation, items=None):
+        """Account for one log entry that reached the log."""
+        if operation == "F":
+            self.pending_writes[transaction_id].append((data_id, 1 if old_value == 0 else 0))
+        elif operation == "U":
+            # A compensation cancels the transaction's newest remaining write on the same data; after a rollback
+            # to a savepoint another transaction may already have written that data and committed
+            pending = self.pending_writes[transaction_id]
+            for position in range(len(pending) - 1, -1, -1):
+                if pending[position][0] == data_id:
+                    del pending[position]
+                    break
+        elif operation in ("C", "M"):
+            # A multi-item commit of a deferred-update transaction carries all of its writes
+            for item_data_id, item_old_value in items or ():
+                self.pending_writes[transaction_id].append((item_data_id, 1 if item_old_value == 0 else 0))
+            for data_id, new_value in self.pending_writes.pop(transaction_id, []):
+                self.state[data_id] = new_value
+            self.committed.append(transaction_id)
+        elif operation == "R":
+            self.pending_writes.pop(transaction_id, None)
+
+    def mismatches(self, recovered_state):
+        """Return the data IDs whose recovered value differs from the committed state."""
+        return [data_id for data_id, value in enumerate(self.state) if recovered_state[data_id] != value]
+
+
+def log_size(recovery_manager):
+    """Return (entries, bytes) of the part of the log recovery has to read, or (0, 0) if there is no log."""
+    if not recovery_manager.wal.exists():
+        return 0, 0
+    recovery_manager._open_log(refresh=True)
+    return (recovery_manager.next_lsn - recovery_manager.wal.first_lsn,
+            sum(length for _, _, length in recovery_manager.wal.spans()))
+
+
+def run_crash_trial(directory, point, crash_after, seed, cycles=200, transaction_size=3, start_prob=0.7,
+                    write_prob=0.5, rollback_prob=0.2, timeout=5, segment_size=None, savepoint_interval=0,
+                    storage=None, deferred=False):
+    """
+    Run one simulation with an injected crash, restart through initialize_modules and compare the
+    recovered database with the oracle.
+    Files are kept in the given directory, so consecutive trials in one directory exercise repeated
+    crash/restart cycles on the same log.
+    - storage: Storage holding the directory (see storage.py); defaults to the local filesystem.
+    - deferred: Run the transactions in deferred-update mode (see TransactionManager).
+    Returns a CrashTrialResult.
+    """
+    db_file = os.path.join(directory, "db")
+    log_file = os.path.join(directory, "log")
+
+    db_handler, recovery_manager, lock_manager, transaction_manager = initialize_modules(
+        timeout, db_file=db_file, log_file=log_file, segment_size=segment_size, storage=storage, deferred=deferred)
+    oracle = CommitOracle(db_handler.buffer)
+    oracle.attach(recovery_manager)
+    CrashInjector(point, crash_after).attach(db_handler, recovery_manager)
+
+    random.seed(seed)
+    crashed = False
+    try:
+        with redirect_stdout(io.StringIO()):  # The loop prints the final database state
+            simulation_loop(db_handler, recovery_manager, lock_manager, transaction_manager, cycles,
+                            transaction_size, start_prob, write_prob, rollback_prob, cycle_delay=0,
+                            savepoint_interval=savepoint_interval)
+    except SimulatedCrash:
+        crashed = True
+
+    start = perf_counter()
+    recovered_db_handler, recovered_recovery_manager = initialize_modules(
+        timeout, db_file=db_file, log_file=log_file, segment_size=segment_size, storage=storage)[:2]
+    recovery_seconds = perf_counter() - start
+
+    log_records, log_bytes = log_size(recovered_recovery_manager)
+    mismatches = oracle.mismatches(recovered_db_handler.buffer)
+    return CrashTrialResult(point, crash_after, seed, crashed, not mismatches, mismatches, log_records, log_bytes,
+                            recovery_seconds)
+
+
+def run_crash_suite(trials, seed=0, cycles=200, storage_backend="file", **simulation_params):
+    """
+    Run crash trials over all crash points, each in a fresh directory.
+    The occurrence to crash on is drawn at random, so crashes land at arbitrary points of the run.
+    - storage_backend: One of STORAGE_BACKENDS; with "memory" every trial gets a MemoryStorage of its own
+      and the filesystem is not touched.
+    Returns a list of CrashTrialResult.
+    """
+    rng = random.Random(seed)
+    results = []
+    for trial in range(trials):
+        point = CRASH_POINTS[trial % len(CRASH_POINTS)]
+        crash_after = rng.randint(1, 5 if point == "write_database" else cycles)
+        trial_seed = rng.randrange(2 ** 32)
+        if storage_backend == "memory":
+            results.append(run_crash_trial("crash", point, crash_after, trial_seed, cycles=cycles,
+                                           storage=MemoryStorage(), **simulation_params))
+            continue
+        with tempfile.TemporaryDirectory(prefix="adbsim-crash-") as directory:
+            results.append(run_crash_trial(directory, point, crash_after, trial_seed, cycles=cycles,
+                                           **simulation_params))
+    return results
+
+
+def benchmark_recovery(cycle_counts, seed=0, **simulation_params):
+    """
+    Measure recovery wall time against log size.
+    For each cycle count, a simulation runs to its simulated crash at max_cycles in a fresh directory and
+    the restart through initialize_modules is timed.
+    Returns a list of RecoveryBenchmarkResult.
+    """
+    results = []
+    for cycles in cycle_counts:
+        with tempfile.TemporaryDirectory(prefix="adbsim-recovery-") as directory:
+            trial = run_crash_trial(directory, "max_cycles", 1, seed, cycles=cycles, **simulation_params)
+            results.append(RecoveryBenchmarkResult(cycles, trial.log_records, trial.log_bytes,
+                                                   trial.recovery_seconds))
+    return results
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Inject crashes into the simulation, verify recovery and time it against log size."
+    )
+    parser.add_argument("--trials", type=int, default=40, help="Number of crash trials (default: 40).")
+    parser.add_argument("--cycles", type=int, default=200, help="Cycles per crash trial (default: 200).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for crash placement and workloads.")
+    parser.add_argument(
+        "--bench-cycles", type=int, nargs="*", default=[500, 2000, 8000],
+        help="Cycle counts for the recovery-time benchmark (default: 500 2000 8000; none to skip)."
+    )
+    parser.add_argument("--output", metavar="CSV", help="Write the benchmark rows to this CSV file.")
+    parser.add_argument("--wal-segment-size", type=int, metavar="BYTES",
+                        help="Run with a segmented WAL of this segment size (default: a single log file).")
+    parser.add_argument("--savepoint-interval", type=int, default=0, metavar="N",
+                        help="Take a savepoint after every N writes of a transaction (default: 0, none).")
+    parser.add_argument("--deferred-writes", action="store_true",
+                        help="Run the transactions in deferred-update mode (see TransactionManager).")
+    parser.add_argument("--storage", default="file", choices=STORAGE_BACKENDS,
+                        help="Run the crash trials on temporary directories or in memory (default: file).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    set_hot_path_logging(False)
+
+    trial_results = run_crash_suite(args.trials, seed=args.seed, cycles=args.cycles, storage_backend=args.storage,
+                                    segment_size=args.wal_segment_size, savepoint_interval=args.savepoint_interval,
+                                    deferred=args.deferred_writes)
+    failures = [result for result in trial_results if not result.consistent]
+    for result in failures:
+        print(f"INCONSISTENT: crash at {result.point} #{result.crash_after} (seed {result.seed}), "
+              f"mismatched data IDs {result.mismatches}")
+    print(f"Crash trials: {len(trial_results)}, consistent: {len(trial_results) - len(failures)}")
+
+    benchmark_rows = benchmark_recovery(args.bench_cycles, seed=args.seed, segment_size=args.wal_segment_size,
+                                        deferred=args.deferred_writes)
+    print(f"{'cycles':>8}{'log records':>14}{'log bytes':>12}{'recovery ms':>14}")
+    for row in benchmark_rows:
+        print(f"{row.cycles:>8}{row.log_records:>14}{row.log_bytes:>12}{row.recovery_seconds * 1000:>14.2f}")
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(RecoveryBenchmarkResult._fields)
+            writer.writerows(benchmark_rows)
+
+    sys.exit(1 if failures else 0)
@@ -1,19 +1,22 @@
-from logging_config import get_logger
-import os
+from logging_config import get_logger, get_hot_path_logger
+from storage import FileStorage
 
 
 class DBHandler:
-    def __init__(self, db_file="db"):
+    def __init__(self, db_file="db", storage=None):
         """
         Initialize the DBHandler.
         - db_file: Name of the file to store the database.
+        - storage: Storage holding the database file (see storage.py); defaults to the local filesystem.
         """
         self.db_file = db_file
+        self.storage = storage or FileStorage()
         self.buffer = [0] * 32  # Simulated database (32 bits, all initialized to 0)
         self.write_count = 0  # Track number of writes since the last flush
         self.flush_threshold = 25  # Flush database to disk after this many writes
         self.logger = get_logger(self.__class__.__name__)
-        self.logger.info(f"DBHandler initialized with database file {self.db_file}.")
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
+        self.logger.info("DBHandler initialized with database file %s.", self.db_file)
 
     def read_database(self):
         """
@@ -21,18 +24,21 @@ class DBHandler:
         If the file is missing or corrupted, initialize with default values.
         """
         try:
-            if not os.path.exists(self.db_file):
+            if not self.storage.exists(self.db_file):
                 self.logger.warning("Database file not found. Initializing with default values.")
                 self.buffer = [0] * 32
                 return
 
-            with open(self.db_file, "r") as f:
+            with self.storage.open(self.db_file, "r") as f:
                 line = f.readline().strip()
                 if not line:  # Empty file
                     self.logger.warning("Database file is empty. Initializing with default values.")
                     self.buffer = [0] * 32
                 else:
-                    self.buffer = list(map(int, line.split(",")))
+                    values = list(map(int, line.split(",")))
+                    if len(values) != len(self.buffer):
+                        raise ValueError(f"expected {len(self.buffer)} values, found {len(values)}")
+                    self.buffer = values
             self.logger.info("Database loaded from file.")
         except (FileNotFoundError, ValueError):
             self.logger.error("Invalid or missing database file. Initializing with default values.")
@@ -42,14 +48,21 @@ class DBHandler:
         """
         Write the current database buffer to the file.
         This function is explicitly called after a recovery or periodic flush.
+        The buffer is written to a temporary file that then replaces the database file, so a crash
+        mid-write leaves the previous database file intact.
+        Returns True if the database file was written.
         """
         try:
-            with open(self.db_file, "w", encoding="utf-8") as f:
+            temp_file = self.db_file + ".tmp"
+            with self.storage.open(temp_file, "w", encoding="utf-8") as f:
                 f.write(",".join(map(str, self.buffer)) + "\n")
+            self.storage.replace(temp_file, self.db_file)
             self.logger.info("Database written to file.")
             self.write_count = 0  # Reset write count after a flush
+            return True
         except Exception as e:
-            self.logger.error(f"Error writing to database file: {e}")
+            self.logger.error("Error writing to database file: %s", e)
+            return False
 
     def update_buffer(self, data_id, new_value):
         """
@@ -59,12 +72,12 @@ class DBHandler:
         - new_value: The new value to assign.
         """
         if data_id < 0 or data_id >= len(self.buffer):
-            self.logger.error(f"Invalid data_id {data_id}. No update performed.")
+            self.logger.error("Invalid data_id %s. No update performed.", data_id)
             return False
 
         old_value = self.buffer[data_id]
         self.buffer[data_id] = new_value
-        self.logger.info(f"Database buffer updated at index {data_id}: {old_value} -> {new_value}.")
+        self.hot_logger.info("Database buffer updated at index %s: %s -> %s.", data_id, old_value, new_value)
         self.write_count += 1
 
         # Flush to disk if threshold is reached
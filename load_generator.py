@@ -0,0 +1,155 @@
+from collections import namedtuple
+from logging_config import setup_logging, shutdown_logging
+from main import initialize_modules
+from storage import MemoryStorage
+from time import perf_counter
+from transaction_server import TransactionServer
+import argparse
+import asyncio
+import random
+import statistics
+
+# One row of a load run; latencies are per transaction, from BEGIN to the response of COMMIT or ROLLBACK.
+LoadResult = namedtuple("LoadResult", [
+    "connections", "transactions", "committed", "rolled_back", "aborted", "seconds", "transactions_per_second",
+    "latency_mean_ms", "latency_p50_ms", "latency_p99_ms"
+])
+
+
+def transaction_requests(rng, trans_size, write_prob, rollback_prob, data_items=32):
+    """Draw the requests of one transaction: BEGIN, 1..trans_size reads or writes, then COMMIT or ROLLBACK."""
+    requests = ["BEGIN"]
+    for _ in range(rng.randint(1, trans_size)):
+        requests.append(f"{'WRITE' if rng.random() < write_prob else 'READ'} {rng.randrange(data_items)}")
+    requests.append("ROLLBACK" if rng.random() < rollback_prob else "COMMIT")
+    return requests
+
+
+async def run_client(host, port, transactions, trans_size, write_prob, rollback_prob, pipeline, rng, latencies,
+                     outcomes):
+    """
+    Run transactions one after another over one connection, recording their latencies and outcomes.
+    - pipeline: Send all requests of a transaction at once instead of waiting for each response.
+    - latencies: List the latency of every transaction is appended to, in seconds.
+    - outcomes: Dict counting "committed", "rolled_back" and "aborted" transactions.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(transactions):
+            requests = transaction_requests(rng, trans_size, write_prob, rollback_prob)
+            start = perf_counter()
+            responses = []
+            if pipeline:
+                writer.write("".join(request + "\n" for request in requests).encode("ascii"))
+                await writer.drain()
+                for _ in requests:
+                    responses.append((await reader.readline()).decode("ascii").strip())
+            else:
+                for request in requests:
+                    writer.write(request.encode("ascii") + b"\n")
+                    await writer.drain()
+                    responses.append((await reader.readline()).decode("ascii").strip())
+                    if responses[-1].startswith("ABORTED"):
+                        break  # The rest of the transaction would be refused
+            latencies.append(perf_counter() - start)
+
+            if any(response.startswith("ABORTED") for response in responses):
+                outcomes["aborted"] += 1
+            elif responses[-1] != "OK":
+                raise RuntimeError(f"Server refused {requests}: {responses}")
+            else:
+                outcomes["rolled_back" if requests[-1] == "ROLLBACK" else "committed"] += 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_load(host, port, connections, transactions, trans_size=3, write_prob=0.5, rollback_prob=0.1,
+                   pipeline=False, seed=None):
+    """
+    Drive a transaction server from many concurrent connections and measure end-to-end latency.
+    - connections: Number of concurrent client connections.
+    - transactions: Number of transactions each connection runs.
+    - seed: Seed of the first connection's random generator; connection i uses seed + i.
+    Returns a LoadResult.
+    """
+    latencies = []
+    outcomes = dict.fromkeys(["committed", "rolled_back", "aborted"], 0)
+    start = perf_counter()
+    await asyncio.gather(*(
+        run_client(host, port, transactions, trans_size, write_prob, rollback_prob, pipeline,
+                   random.Random(None if seed is None else seed + i), latencies, outcomes)
+        for i in range(connections)
+    ))
+    seconds = perf_counter() - start
+    latencies.sort()
+    return LoadResult(
+        connections=connections, transactions=len(latencies), seconds=round(seconds, 4),
+        transactions_per_second=round(len(latencies) / seconds, 1),
+        latency_mean_ms=round(statistics.fmean(latencies) * 1000, 3),
+        latency_p50_ms=round(latencies[len(latencies) // 2] * 1000, 3),
+        latency_p99_ms=round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        **outcomes
+    )
+
+
+async def run_benchmark(args):
+    """Run the load for every connection count, against args.port or an in-process in-memory server."""
+    server = None
+    host, port = args.host, args.port
+    if port is None:
+        storage = MemoryStorage()
+        setup_logging("adbsim.log", storage=storage)
+        server = TransactionServer(*initialize_modules(args.timeout, storage=storage),
+                                   cycle_interval=args.cycle_interval)
+        port = await server.start(host)
+    try:
+        results = []
+        for index, connections in enumerate(args.connections):
+            seed = None if args.seed is None else args.seed + index * connections
+            result = await run_load(host, port, connections, args.transactions, args.trans_size, args.write_prob,
+                                    args.rollback_prob, args.pipeline, seed)
+            print(result)
+            results.append(result)
+        return results
+    finally:
+        if server:
+            await server.close()
+            shutdown_logging()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Measure transaction latency and throughput of a transaction server over many connections."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the server (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int,
+                        help="Port of a running transaction_server.py (default: start an in-memory server).")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrent connections; the load runs once per value (default: 1 4 16).")
+    parser.add_argument("--transactions", type=int, default=200,
+                        help="Transactions per connection (default: 200).")
+    parser.add_argument("--trans-size", type=int, default=3,
+                        help="Maximum operations per transaction (default: 3).")
+    parser.add_argument("--write-prob", type=float, default=0.5,
+                        help="Probability that an operation is a write (default: 0.5).")
+    parser.add_argument("--rollback-prob", type=float, default=0.1,
+                        help="Probability that a transaction ends with ROLLBACK (default: 0.1).")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Send all requests of a transaction without waiting for each response.")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible transactions.")
+    parser.add_argument("--timeout", type=int, default=5,
+                        help="Lock timeout in cycles of the in-memory server (default: 5).")
+    parser.add_argument("--cycle-interval", type=float, default=0.005, metavar="SECONDS",
+                        help="Seconds between cycles of the in-memory server (default: 0.005).")
+
+    parsed_args = parser.parse_args()
+    if min(parsed_args.connections) < 1 or parsed_args.transactions < 1 or parsed_args.trans_size < 1:
+        parser.error("connections, transactions and trans_size must be positive.")
+    if not (0 <= parsed_args.write_prob <= 1 and 0 <= parsed_args.rollback_prob <= 1):
+        parser.error("Probabilities must be between 0 and 1.")
+    return parsed_args
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_arguments()))
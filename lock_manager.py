@@ -1,4 +1,4 @@
-from logging_config import get_logger
+from logging_config import get_logger, get_hot_path_logger
 from collections import defaultdict
 
 
@@ -11,9 +11,10 @@ class LockManager:
         self.transaction_lock_time = {}  # {transaction_id: cycles since lock request}
         self.locked_data_by_transaction = defaultdict(set)  # {transaction_id: set of data_ids}
         self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
         self.deadlock_timeout = timeout_cycles  # Timeout in cycles
         self.current_cycle = 0  # Keep track of simulation cycles
-        self.logger.info("LockManager initialized with timeout of {} cycles.".format(timeout_cycles))
+        self.logger.info("LockManager initialized with timeout of %s cycles.", timeout_cycles)
 
     def acquire_lock(self, transaction_id, data_id, lock_type):
         """
@@ -28,7 +29,7 @@ class LockManager:
         if data_id not in self.locks:
             self.locks[data_id] = (lock_type, {transaction_id})
             self.locked_data_by_transaction[transaction_id].add(data_id)
-            self.logger.info(f"Transaction {transaction_id} acquired {lock_type} lock on {data_id}.")
+            self.hot_logger.info("Transaction %s acquired %s lock on %s.", transaction_id, lock_type, data_id)
             return True
 
         current_lock_type, current_transactions = self.locks[data_id]
@@ -37,7 +38,7 @@ class LockManager:
         if lock_type == "shared" and current_lock_type == "shared":
             self.locks[data_id][1].add(transaction_id)
             self.locked_data_by_transaction[transaction_id].add(data_id)
-            self.logger.info(f"Transaction {transaction_id} acquired shared lock on {data_id}.")
+            self.hot_logger.info("Transaction %s acquired shared lock on %s.", transaction_id, data_id)
             return True
 
         # Check if the transaction already holds the lock
@@ -46,46 +47,75 @@ class LockManager:
                 # Upgrade lock
                 if len(current_transactions) == 1:
                     self.locks[data_id] = (lock_type, current_transactions)
-                    self.logger.info(f"Transaction {transaction_id} upgraded to exclusive lock on {data_id}.")
+                    self.hot_logger.info("Transaction %s upgraded to exclusive lock on %s.", transaction_id, data_id)
                     return True
                 else:
-                    self.logger.info(f"Transaction {transaction_id} cannot upgrade to exclusive lock on {data_id} "
-                                     f"because other transactions hold the lock.")
+                    self.hot_logger.info("Transaction %s cannot upgrade to exclusive lock on %s "
+                                         "because other transactions hold the lock.", transaction_id, data_id)
             else:
                 # Lock already held
                 return True
 
-        # Otherwise, add to the queue
-        self.lock_queue[data_id].append((transaction_id, lock_type))
-        self.logger.warning(f"Transaction {transaction_id} is waiting for {lock_type} lock on {data_id}.")
+        # Otherwise, add to the queue (once; a blocked transaction retries the same request)
+        if (transaction_id, lock_type) not in self.lock_queue[data_id]:
+            self.lock_queue[data_id].append((transaction_id, lock_type))
+        self.hot_logger.warning("Transaction %s is waiting for %s lock on %s.", transaction_id, lock_type, data_id)
         return False
 
     def release_locks(self, transaction_id):
         """
-        Release all locks held by a transaction.
+        Release all locks held by a transaction and withdraw its pending lock requests.
         """
+        self._remove_from_queues(transaction_id)
         if transaction_id not in self.locked_data_by_transaction:
-            self.logger.warning(f"Transaction {transaction_id} has no locks to release.")
+            self.hot_logger.warning("Transaction %s has no locks to release.", transaction_id)
             return
 
         for data_id in self.locked_data_by_transaction[transaction_id]:
-            lock_type, current_transactions = self.locks[data_id]
-            current_transactions.remove(transaction_id)
-            if not current_transactions:
-                # No more transactions holding the lock
-                del self.locks[data_id]
-                self.logger.info(f"Lock on {data_id} has been released.")
-
-                # Try to grant locks to waiting transactions
-                if data_id in self.lock_queue and self.lock_queue[data_id]:
-                    self.logger.info(f"Attempting to grant locks to waiting transactions on {data_id}.")
-                    self._grant_locks(data_id)
+            self._release(transaction_id, data_id)
         del self.locked_data_by_transaction[transaction_id]
         if transaction_id in self.transaction_wait_cycles:
             del self.transaction_wait_cycles[transaction_id]
         if transaction_id in self.transaction_lock_time:
             del self.transaction_lock_time[transaction_id]
-        self.logger.info(f"Transaction {transaction_id} released all locks.")
+        self.hot_logger.info("Transaction %s released all locks.", transaction_id)
+
+    def release_lock(self, transaction_id, data_id):
+        """
+        Release a single lock held by a transaction (used when rolling back to a savepoint undoes every write
+        made under it). Returns False if the transaction does not hold the lock.
+        """
+        if data_id not in self.locked_data_by_transaction.get(transaction_id, ()):
+            self.hot_logger.warning("Transaction %s holds no lock on %s.", transaction_id, data_id)
+            return False
+        self.locked_data_by_transaction[transaction_id].remove(data_id)
+        self._release(transaction_id, data_id)
+        self.hot_logger.info("Transaction %s released its lock on %s.", transaction_id, data_id)
+        return True
+
+    def withdraw_requests(self, transaction_id):
+        """
+        Withdraw the pending lock requests of a transaction that keeps running, and reset its wait time.
+        """
+        self._remove_from_queues(transaction_id)
+        if transaction_id in self.transaction_wait_cycles:
+            self.transaction_wait_cycles[transaction_id] = 0
+
+    def _release(self, transaction_id, data_id):
+        """
+        Remove a transaction from the holders of a lock, granting the lock to waiting transactions once it is free.
+        """
+        lock_type, current_transactions = self.locks[data_id]
+        current_transactions.remove(transaction_id)
+        if not current_transactions:
+            # No more transactions holding the lock
+            del self.locks[data_id]
+            self.hot_logger.info("Lock on %s has been released.", data_id)
+
+            # Try to grant locks to waiting transactions
+            if data_id in self.lock_queue and self.lock_queue[data_id]:
+                self.hot_logger.info("Attempting to grant locks to waiting transactions on %s.", data_id)
+                self._grant_locks(data_id)
 
     def _grant_locks(self, data_id):
         """
@@ -108,9 +138,13 @@ class LockManager:
 
             if can_grant:
                 self.lock_queue[data_id].pop(0)
-                self.acquire_lock(waiting_transaction_id, data_id, requested_lock_type)
-                self.logger.info(f"Granted {requested_lock_type} lock on {data_id} "
-                                 f"to transaction {waiting_transaction_id}.")
+                if not self.acquire_lock(waiting_transaction_id, data_id, requested_lock_type):
+                    # acquire_lock queued the request again at the back; restore its place and stop
+                    self.lock_queue[data_id].remove((waiting_transaction_id, requested_lock_type))
+                    self.lock_queue[data_id].insert(0, (waiting_transaction_id, requested_lock_type))
+                    break
+                self.hot_logger.info("Granted %s lock on %s to transaction %s.",
+                                     requested_lock_type, data_id, waiting_transaction_id)
             else:
                 break
 
@@ -124,27 +158,41 @@ class LockManager:
             for transaction_id, _ in waiting_list:
                 self.transaction_wait_cycles[transaction_id] += 1
 
-    def check_deadlocks(self):
+    def check_deadlocks(self, abort=None):
         """
         Check for deadlocks and abort transactions that have been waiting too long.
+        - abort: Optional callable taking a transaction ID that undoes the victim's writes (e.g.
+          TransactionManager.rollback_transaction). It is called before the victim's locks are released, so
+          no other transaction sees its dirty data. Without it the caller is responsible for the undo.
+        Returns the list of aborted transaction IDs.
         """
         aborted_transactions = []
         for transaction_id, wait_cycles in self.transaction_wait_cycles.items():
             if wait_cycles >= self.deadlock_timeout:
-                self.logger.warning(f"Transaction {transaction_id} aborted due to deadlock (waited {wait_cycles} "
-                                    f"cycles).")
+                self.logger.warning("Transaction %s aborted due to deadlock (waited %s cycles).",
+                                    transaction_id, wait_cycles)
                 aborted_transactions.append(transaction_id)
 
         for transaction_id in aborted_transactions:
-            self.release_locks(transaction_id)
-            # Remove transaction from lock queues
-            for data_id, waiting_list in self.lock_queue.items():
-                self.lock_queue[data_id] = [
-                    (tid, ltype) for tid, ltype in waiting_list if tid != transaction_id
-                ]
+            if abort:
+                abort(transaction_id)
+            if transaction_id in self.locked_data_by_transaction:
+                self.release_locks(transaction_id)
+            else:
+                self._remove_from_queues(transaction_id)
             if transaction_id in self.transaction_wait_cycles:
                 del self.transaction_wait_cycles[transaction_id]
             if transaction_id in self.transaction_lock_time:
                 del self.transaction_lock_time[transaction_id]
         if aborted_transactions:
-            self.logger.info(f"Deadlock resolution: aborted transactions {aborted_transactions}")
\ No newline at end of file
+            self.logger.info("Deadlock resolution: aborted transactions %s", aborted_transactions)
+        return aborted_transactions
+
+    def _remove_from_queues(self, transaction_id):
+        """
+        Remove every pending lock request of a transaction from the lock queues.
+        """
+        for data_id, waiting_list in self.lock_queue.items():
+            self.lock_queue[data_id] = [
+                (tid, ltype) for tid, ltype in waiting_list if tid != transaction_id
+            ]
@@ -0,0 +1,261 @@
+from logging_config import get_logger
+from storage import FileStorage
+from wal_files import open_log_file
+from bisect import bisect_right
+from collections import namedtuple
+
+# One parsed WAL entry. lsn is the 1-based position of the entry in the log; data_id and old_value are None
+# for entries that do not touch data ('S', 'C', 'R', 'M'). prev_lsn points back along the transaction's chain
+# (None for 'S' and 'M' entries and entries written without a pointer); for a compensation entry ('U') it is
+# the next entry still to be undone, so a rollback never undoes the same write twice. items is only set for a
+# multi-item commit ('M', written by deferred-update transactions): the (data_id, old_value) pairs of the
+# whole write set, which the entry writes and commits at once.
+LogRecord = namedtuple("LogRecord", ["lsn", "transaction_id", "operation", "data_id", "old_value", "prev_lsn",
+                                     "items"], defaults=(None, None))
+
+
+def format_entry(transaction_id, data_id=None, old_value=None, operation=None, prev_lsn=None, items=None):
+    """Format a log entry without its trailing newline; parse_record reads it back."""
+    parts = [str(transaction_id)]
+    if data_id is not None:
+        parts.extend([str(data_id), str(old_value)])
+    if operation is not None:
+        parts.append(operation)
+    if items is not None:
+        parts.extend(f"{item_data_id}:{item_old_value}" for item_data_id, item_old_value in items)
+    if prev_lsn is not None:
+        parts.append(str(prev_lsn))
+    return ",".join(parts)
+
+
+def parse_record(lsn, line):
+    """
+    Parse one log line ('tid,op' or 'tid,data_id,old_value,op', optionally followed by ',prev_lsn', or
+    'tid,M,data_id:old_value,...') into a LogRecord.
+    Returns None for lines that are not valid entries.
+    """
+    parts = line.strip().split(",")
+    try:
+        if len(parts) > 2 and parts[1] == "M":
+            items = tuple(tuple(map(int, item.split(":"))) for item in parts[2:])
+            if any(len(item) != 2 for item in items):
+                return None
+            return LogRecord(lsn, int(parts[0]), "M", None, None, None, items)
+        if len(parts) in (2, 3):
+            prev_lsn = int(parts[2]) if len(parts) == 3 else None
+            return LogRecord(lsn, int(parts[0]), parts[1], None, None, prev_lsn)
+        if len(parts) in (4, 5):
+            prev_lsn = int(parts[4]) if len(parts) == 5 else None
+            return LogRecord(lsn, int(parts[0]), parts[3], int(parts[1]), int(parts[2]), prev_lsn)
+    except ValueError:
+        pass
+    return None
+
+
+class LogReader:
+    def __init__(self, log_file, chunk_size=64 * 1024, spans=None, storage=None):
+        """
+        Initialize the LogReader.
+        Entries are read in fixed-size chunks, so memory use does not depend on the size of the log.
+        - log_file: Path of the WAL log file.
+        - chunk_size: Number of bytes read from the file at a time.
+        - spans: Optional callable returning the parts of a log kept in several files, as
+          (path, logical offset of its first byte, length) tuples in log order. Offsets passed to and
+          returned by the reader are logical offsets. Defaults to the whole of log_file. Archived
+          (compressed) segments are decompressed transparently.
+        - storage: Storage holding the log files; defaults to the local filesystem.
+        """
+        self.log_file = log_file
+        self.storage = storage or FileStorage()
+        self.chunk_size = chunk_size
+        self.spans = spans or self._file_spans
+
+    def _file_spans(self):
+        if not self.storage.exists(self.log_file):
+            return []
+        return [(self.log_file, 0, self.storage.size(self.log_file))]
+
+    def lines(self, start_offset=0):
+        """
+        Stream complete lines from the given logical offset onwards.
+        Yields (offset, line) pairs; a line without a newline at the end of a span (a torn entry) is not
+        yielded.
+        """
+        for path, base, length in self.spans():
+            if base + length <= start_offset:
+                continue
+            yield from self._span_lines(path, base, max(start_offset - base, 0), length)
+
+    def _span_lines(self, path, base, local_offset, length):
+        with open_log_file(self.storage, path) as f:
+            f.seek(local_offset)
+            offset = base + local_offset
+            remaining = length - local_offset
+            remainder = b""
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                data = remainder + chunk
+                start = 0
+                end = data.find(b"\n")
+                while end != -1:
+                    yield offset + start, data[start:end].decode("ascii", "replace")
+                    start = end + 1
+                    end = data.find(b"\n", start)
+                offset += start
+                remainder = data[start:]
+
+    def records(self, start_offset=0, start_lsn=1):
+        """
+        Stream parsed entries starting at a logical offset whose entry has the LSN start_lsn.
+        Yields (offset, LogRecord) pairs; invalid lines are skipped but still consume an LSN.
+        """
+        lsn = start_lsn
+        for offset, line in self.lines(start_offset):
+            record = parse_record(lsn, line)
+            if record is not None:
+                yield offset, record
+            lsn += 1
+
+    def reverse_records(self, end_offset, last_lsn):
+        """
+        Stream parsed entries newest first, reading the log backwards in chunks.
+        - end_offset: Logical offset just past the last complete entry.
+        - last_lsn: LSN of the entry that ends at end_offset.
+        Yields (offset, LogRecord) pairs.
+        """
+        lsn = last_lsn
+        for path, base, length in reversed(self.spans()):
+            if base >= end_offset:
+                continue
+            for offset, line in self._span_lines_reversed(path, base, min(length, end_offset - base)):
+                record = parse_record(lsn, line)
+                if record is not None:
+                    yield offset, record
+                lsn -= 1
+
+    def _span_lines_reversed(self, path, base, length):
+        if length == 0:
+            return
+        with open_log_file(self.storage, path) as f:
+            position = length
+            pending = b""  # Bytes from position onwards not yielded yet; always ends with a newline
+            while position > 0:
+                read_size = min(self.chunk_size, position)
+                position -= read_size
+                f.seek(position)
+                pending = f.read(read_size) + pending
+                end = len(pending) - 1  # Newline terminating the newest pending line
+                start = pending.rfind(b"\n", 0, end)
+                while start != -1:
+                    yield base + position + start + 1, pending[start + 1:end].decode("ascii", "replace")
+                    end = start
+                    start = pending.rfind(b"\n", 0, end)
+                pending = pending[:end + 1]
+            if pending:
+                yield base, pending[:-1].decode("ascii", "replace")
+
+
+class LogIndex:
+    def __init__(self, index_file, interval=64, storage=None):
+        """
+        Initialize the LogIndex, a sparse on-disk map from LSNs and transaction IDs to log file offsets.
+        The index only holds one entry per `interval` log entries plus one per transaction, and it is a
+        hint: a missing or stale index is rebuilt from the log.
+        - index_file: Path of the index file.
+        - interval: Number of log entries between LSN entries.
+        - storage: Storage holding the index file; defaults to the local filesystem.
+        """
+        self.index_file = index_file
+        self.storage = storage or FileStorage()
+        self.interval = interval
+        self.lsns = []  # Sorted LSNs with a known offset
+        self.offsets = []  # Offsets matching self.lsns
+        self.transaction_starts = {}  # {transaction_id: (lsn, offset) of its first entry}
+        self.last_indexed_lsn = 0
+        self.logger = get_logger(self.__class__.__name__)
+
+    def load(self):
+        """Load the index file; malformed lines are ignored."""
+        self.lsns, self.offsets, self.transaction_starts = [], [], {}
+        self.last_indexed_lsn = 0
+        if not self.storage.exists(self.index_file):
+            return
+        with self.storage.open(self.index_file, "r") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                try:
+                    if parts[0] == "L" and len(parts) == 3:
+                        self._add_lsn(int(parts[1]), int(parts[2]))
+                    elif parts[0] == "T" and len(parts) == 4:
+                        lsn = int(parts[2])
+                        self.transaction_starts[int(parts[1])] = (lsn, int(parts[3]))
+                        self.last_indexed_lsn = max(self.last_indexed_lsn, lsn)
+                except ValueError:
+                    continue
+        self.logger.info("Loaded log index %s with %s LSN and %s transaction entries.",
+                         self.index_file, len(self.lsns), len(self.transaction_starts))
+
+    def reset(self, remove_file=True):
+        """Discard the index in memory and, if remove_file is set, on disk."""
+        self.lsns, self.offsets, self.transaction_starts = [], [], {}
+        self.last_indexed_lsn = 0
+        if remove_file and self.storage.exists(self.index_file):
+            self.storage.remove(self.index_file)
+
+    def add(self, lsn, offset, transaction_id, operation):
+        """
+        Record a log entry if it falls on the index interval or starts a transaction.
+        Entries at or below the last indexed LSN are already known and ignored.
+        """
+        if lsn <= self.last_indexed_lsn:
+            return
+        lines = []
+        if (lsn - 1) % self.interval == 0:
+            self._add_lsn(lsn, offset)
+            lines.append(f"L,{lsn},{offset}\n")
+        if operation == "S":
+            self.transaction_starts[transaction_id] = (lsn, offset)
+            lines.append(f"T,{transaction_id},{lsn},{offset}\n")
+        if lines:
+            with self.storage.open(self.index_file, "a") as f:
+                f.writelines(lines)
+            self.last_indexed_lsn = lsn
+
+    def prune(self, first_lsn):
+        """
+        Drop entries for LSNs below first_lsn (released from the log) and rewrite the index file.
+        """
+        keep = bisect_right(self.lsns, first_lsn - 1)
+        self.lsns, self.offsets = self.lsns[keep:], self.offsets[keep:]
+        self.transaction_starts = {transaction_id: position for transaction_id, position
+                                   in self.transaction_starts.items() if position[0] >= first_lsn}
+        lines = [f"L,{lsn},{offset}\n" for lsn, offset in zip(self.lsns, self.offsets)]
+        lines.extend(f"T,{transaction_id},{lsn},{offset}\n"
+                     for transaction_id, (lsn, offset) in self.transaction_starts.items())
+        temp_file = self.index_file + ".tmp"
+        with self.storage.open(temp_file, "w") as f:
+            f.writelines(lines)
+        self.storage.replace(temp_file, self.index_file)
+
+    def locate(self, lsn):
+        """Return (lsn, offset) of the closest indexed entry at or before the given LSN."""
+        position = bisect_right(self.lsns, lsn) - 1
+        if position < 0:
+            return 1, 0
+        return self.lsns[position], self.offsets[position]
+
+    def last_position(self):
+        """Return (lsn, offset) of the newest LSN entry, or (1, 0) if there is none."""
+        if not self.lsns:
+            return 1, 0
+        return self.lsns[-1], self.offsets[-1]
+
+    def _add_lsn(self, lsn, offset):
+        if self.lsns and lsn <= self.lsns[-1]:
+            return
+        self.lsns.append(lsn)
+        self.offsets.append(offset)
+        self.last_indexed_lsn = max(self.last_indexed_lsn, lsn)
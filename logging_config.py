@@ -1,16 +1,145 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+# Suffix of the child logger each component uses for per-operation (hot path) messages.
+HOT_PATH_SUFFIX = "hotpath"
+
+# Level used to switch a hot-path logger off; above CRITICAL so isEnabledFor() is always False.
+_HOT_PATH_OFF = logging.CRITICAL + 1
+
+_root_handler = None  # Handler installed on the root logger by setup_logging
+_queue_listener = None  # Background listener when the queue handler is in use
+_active_config = None  # (log_file, use_queue, storage) of the current configuration
+_hot_path_default = True  # Applied to hot-path loggers without an explicit setting
+_hot_path_overrides = {}  # {component name: enabled}
+
+
+class _BackgroundQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+    The stock QueueHandler runs the full Formatter (timestamps included) on the caller's thread;
+    here only the message itself is resolved, so its arguments are captured at call time.
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class _StorageStreamHandler(logging.StreamHandler):
+    """Stream handler for a log file opened through a storage; closing the handler closes the file."""
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush()
+            self.stream.close()
+        finally:
+            self.release()
+            super().close()
 
-def setup_logging(log_file="adbsim.log"):
-    log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
-    file_handler = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=5)
+def setup_logging(log_file="adbsim.log", level=logging.DEBUG, use_queue=False, storage=None):
+    """
+    Configure the root logger to write to a rotating log file.
+    Calling this again with the same file, mode and storage is a no-op; calling it with a different one
+    replaces the previous handler instead of adding a second one.
+    - log_file: Path of the log file.
+    - level: Minimum level of records passed to the handler.
+    - use_queue: Hand records to a background thread that performs the file writes.
+    - storage: Storage to keep the log file in (see storage.py); defaults to the local filesystem. A storage
+      that is not backed by files (MemoryStorage) gets a plain, non-rotating stream instead.
+    """
+    global _root_handler, _queue_listener, _active_config
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    if _active_config == (log_file, use_queue, storage):
+        return
+
+    shutdown_logging()
+
+    log_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    local_path = storage.local_path(log_file) if storage is not None else log_file
+    if local_path is not None:
+        file_handler = RotatingFileHandler(local_path, maxBytes=1_000_000, backupCount=5)
+    else:
+        file_handler = _StorageStreamHandler(storage.open(log_file, "a", encoding="utf-8"))
     file_handler.setFormatter(log_formatter)
 
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        _queue_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _queue_listener.start()
+        _root_handler = _BackgroundQueueHandler(log_queue)
+    else:
+        _root_handler = file_handler
+
+    root_logger.addHandler(_root_handler)
+    _active_config = (log_file, use_queue, storage)
+
+
+def shutdown_logging():
+    """
+    Remove the handler installed by setup_logging, draining the background queue if one is in use.
+    """
+    global _root_handler, _queue_listener, _active_config
+
+    if _root_handler is not None:
+        logging.getLogger().removeHandler(_root_handler)
+    if _queue_listener is not None:
+        _queue_listener.stop()  # Processes everything still queued before returning
+        for handler in _queue_listener.handlers:
+            handler.close()
+        _queue_listener = None
+    elif _root_handler is not None:
+        _root_handler.close()
+    _root_handler = None
+    _active_config = None
+
+
+atexit.register(shutdown_logging)
+
+
+@contextmanager
+def redirected_logging(log_file="adbsim.log", level=logging.DEBUG, storage=None, hot_paths=True):
+    """
+    Send log records to another log file for the duration of a with block (see setup_logging), then restore
+    the caller's configuration: the root logger's handlers and level, and the hot-path settings. The caller's
+    handlers are detached while the block runs, not closed.
+    - hot_paths: Emit hot-path messages inside the block.
+    """
+    global _root_handler, _queue_listener, _active_config, _hot_path_default
+
+    root_logger = logging.getLogger()
+    saved_handlers, saved_level = list(root_logger.handlers), root_logger.level
+    saved_config = (_root_handler, _queue_listener, _active_config)
+    saved_hot_paths = (_hot_path_default, dict(_hot_path_overrides))
+    for handler in saved_handlers:
+        root_logger.removeHandler(handler)
+    _root_handler = _queue_listener = _active_config = None
+    try:
+        setup_logging(log_file, level=level, storage=storage)
+        set_hot_path_logging(hot_paths)
+        yield
+    finally:
+        shutdown_logging()
+        for handler in saved_handlers:
+            root_logger.addHandler(handler)
+        root_logger.setLevel(saved_level)
+        _root_handler, _queue_listener, _active_config = saved_config
+        _hot_path_default = saved_hot_paths[0]
+        _hot_path_overrides.clear()
+        _hot_path_overrides.update(saved_hot_paths[1])
+        _apply_hot_path_levels()
 
 
 def get_logger(name):
@@ -18,3 +147,50 @@ def get_logger(name):
     if not logger.handlers:
         logger.addHandler(logging.NullHandler())  # Ensure handlers exist
     return logger
+
+
+def get_hot_path_logger(name):
+    """
+    Return the logger a component uses for per-operation messages (lock grants, buffer updates,
+    log appends). It is a child of get_logger(name), so records reach the same handlers, but it
+    can be switched off on its own with set_hot_path_logging.
+    """
+    logger = get_logger(f"{name}.{HOT_PATH_SUFFIX}")
+    _apply_hot_path_level(name, logger)
+    return logger
+
+
+def set_hot_path_logging(enabled, *names):
+    """
+    Enable or disable hot-path logging.
+    - enabled: True to emit hot-path messages, False to drop them before any formatting happens.
+    - names: Component names (e.g. "LockManager"). With no names, the setting becomes the default
+      for every component, including ones created later, and clears per-component settings.
+    """
+    global _hot_path_default
+
+    if names:
+        for name in names:
+            _hot_path_overrides[name] = enabled
+    else:
+        _hot_path_default = enabled
+        _hot_path_overrides.clear()
+
+    _apply_hot_path_levels()
+
+
+def hot_path_logging_enabled(name):
+    """Return whether hot-path messages of the given component are currently emitted."""
+    return _hot_path_overrides.get(name, _hot_path_default)
+
+
+def _apply_hot_path_levels():
+    """Apply the current hot-path settings to every existing hot-path logger."""
+    prefix_length = len(HOT_PATH_SUFFIX) + 1
+    for logger_name, logger in list(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger_name.endswith("." + HOT_PATH_SUFFIX):
+            _apply_hot_path_level(logger_name[:-prefix_length], logger)
+
+
+def _apply_hot_path_level(name, logger):
+    logger.setLevel(logging.NOTSET if hot_path_logging_enabled(name) else _HOT_PATH_OFF)
@@ -1,43 +1,60 @@
 from db_handler import DBHandler
 from lock_manager import LockManager
-from logging_config import setup_logging, get_logger
+from logging_config import setup_logging, get_logger, get_hot_path_logger, set_hot_path_logging
+from profiler import Profiler, profiling_session
 from recovery_manager import RecoveryManager
+from storage import STORAGE_BACKENDS, make_storage
 from transaction_manager import TransactionManager
+from wal_files import ARCHIVE_CODECS
 import argparse
+import logging
 import random
 from time import sleep
 from typing import Tuple
 
 
-def initialize_modules(timeout_cycles) -> Tuple[DBHandler, RecoveryManager, LockManager, TransactionManager]:
+def initialize_modules(timeout_cycles, profiler=None, db_file="db", log_file="log", segment_size=None, storage=None,
+                       archive=None, snapshots=0,
+                       deferred=False) -> Tuple[DBHandler, RecoveryManager, LockManager, TransactionManager]:
     """
     Initialize the database, logs, and all necessary modules for the simulation.
+    Logging is expected to be configured by the caller (see setup_logging).
+    - profiler: Optional Profiler; the hot-path methods are instrumented before recovery runs.
+    - db_file: Path of the database file.
+    - log_file: Path of the WAL log file (base name of the segments when segment_size is set).
+    - segment_size: Size in bytes of WAL segments; None keeps the WAL in the single file log_file.
+    - storage: Storage holding the database and log files (see storage.py); defaults to the local filesystem.
+    - archive: With segment_size, compress released WAL segments with this codec ("zlib" or "lzma") instead
+      of recycling them.
+    - snapshots: Number of checkpoint snapshots kept for point-in-time recovery (0 keeps none).
+    - deferred: Run transactions in deferred-update mode (see TransactionManager).
     Returns:
         Tuple of initialized modules: (database_handler, recovery_mgr, lock_mgr, transaction_mgr)
     """
     logger = get_logger("Initializer")
     logger.info("Starting module initialization...")
 
-    # Initialize logging
-    setup_logging()
-    logger.info("Logging system initialized.")
-
     # Initialize the database handler
-    database_handler = DBHandler()
+    database_handler = DBHandler(db_file=db_file, storage=storage)
     database_handler.read_database()  # Load database from file or initialize to defaults
     logger.info("Database handler initialized and database state loaded.")
 
     # Initialize the recovery manager and apply logs
-    recovery_mgr = RecoveryManager(database_handler)
+    recovery_mgr = RecoveryManager(database_handler, log_file=log_file, segment_size=segment_size, archive=archive,
+                                   snapshots=snapshots)
+    if profiler:
+        profiler.instrument_modules(db_handler=database_handler, recovery_manager=recovery_mgr)
     recovery_mgr.apply_logs()
     logger.info("Recovery manager initialized and logs applied.")
 
     # Initialize the lock manager
     lock_mgr = LockManager(timeout_cycles)
+    if profiler:
+        profiler.instrument_modules(lock_manager=lock_mgr)
     logger.info("Lock manager initialized.")
 
     # Initialize the transaction manager
-    transaction_mgr = TransactionManager(lock_mgr, recovery_mgr, database_handler)
+    transaction_mgr = TransactionManager(lock_mgr, recovery_mgr, database_handler, deferred=deferred)
     logger.info("Transaction manager initialized.")
 
     logger.info("Module initialization complete.")
@@ -50,8 +67,6 @@ def parse_arguments():
     Returns:
         Namespace containing all validated parameters.
     """
-    parser_logger = get_logger("ArgumentParser")  # Use a distinct name for the logger
-
     parser = argparse.ArgumentParser(
         description="Simulate recovery and locking with strict 2PL and WAL."
     )
@@ -81,6 +96,76 @@ def parse_arguments():
         "timeout", type=int,
         help="Timeout in cycles for transactions waiting for resources (integer >= 0)."
     )
+    parser.add_argument(
+        "--log-level", default="DEBUG", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="Minimum level written to adbsim.log (default: DEBUG)."
+    )
+    parser.add_argument(
+        "--log-queue", action="store_true",
+        help="Write adbsim.log from a background thread instead of the simulation thread."
+    )
+    parser.add_argument(
+        "--quiet-hot-paths", nargs="*", metavar="COMPONENT",
+        help="Disable per-operation logging for the given components (e.g. LockManager), "
+             "or for all components if none are given."
+    )
+    parser.add_argument(
+        "--wal-segment-size", type=int, metavar="BYTES",
+        help="Split the WAL into preallocated segments of this size that are recycled after checkpoints "
+             "(default: a single log file)."
+    )
+    parser.add_argument(
+        "--wal-archive", choices=sorted(ARCHIVE_CODECS),
+        help="With --wal-segment-size, compress released segments in the background instead of recycling "
+             "them, keeping the log history (default: recycle)."
+    )
+    parser.add_argument(
+        "--pitr-snapshots", type=int, default=0, metavar="N",
+        help="Keep a database snapshot from each of the last N checkpoints and mark the log position of every "
+             "cycle, for point_in_time.py (default: 0)."
+    )
+    parser.add_argument(
+        "--storage", default="file", choices=STORAGE_BACKENDS,
+        help="Keep the db, log and adbsim.log files on disk or in memory (default: file)."
+    )
+    parser.add_argument(
+        "--data-dir", metavar="DIR",
+        help="Directory of the db, log and adbsim.log files with --storage file (default: the current directory)."
+    )
+    parser.add_argument(
+        "--fsync-latency", type=float, default=0.0, metavar="SECONDS",
+        help="Add this delay to every fsync to model a slow disk (default: 0)."
+    )
+    parser.add_argument(
+        "--savepoint-interval", type=int, default=0, metavar="N",
+        help="Take a savepoint after every N writes of a transaction; rollbacks then return to the latest "
+             "savepoint instead of aborting (default: 0, no savepoints)."
+    )
+    parser.add_argument(
+        "--deferred-writes", action="store_true",
+        help="Keep each transaction's writes in a private write set and log them as one entry at commit; "
+             "rollbacks then log nothing."
+    )
+    parser.add_argument(
+        "--cycle-delay", type=float, default=0.1,
+        help="Seconds to sleep at the end of each cycle (default: 0.1; use 0 when profiling)."
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Time the lock, log and database hot paths and print a per-component breakdown."
+    )
+    parser.add_argument(
+        "--profile-output", metavar="CSV",
+        help="With --profile, also write the per-cycle breakdown to this CSV file."
+    )
+    parser.add_argument(
+        "--cprofile", metavar="FILE",
+        help="Run the simulation under cProfile and dump the statistics to FILE."
+    )
+    parser.add_argument(
+        "--tracemalloc", action="store_true",
+        help="Track memory allocations with tracemalloc and print the largest allocation sites."
+    )
 
     # Parse the arguments
     parsed_args = parser.parse_args()  # Use a distinct name for the parsed arguments
@@ -94,54 +179,114 @@ def parse_arguments():
         parser.error("rollback_prob must be between 0 and 1.")
     if parsed_args.write_prob + parsed_args.rollback_prob > 1:
         parser.error("write_prob + rollback_prob must not exceed 1.")
-
-    # Log the parsed arguments
-    parser_logger.info(f"Parsed arguments: {vars(parsed_args)}")
+    if parsed_args.wal_segment_size is not None and parsed_args.wal_segment_size < 1024:
+        parser.error("wal_segment_size must be at least 1024 bytes.")
+    if parsed_args.wal_archive and parsed_args.wal_segment_size is None:
+        parser.error("--wal-archive requires --wal-segment-size.")
+    if parsed_args.pitr_snapshots < 0:
+        parser.error("pitr_snapshots must not be negative.")
+    if parsed_args.savepoint_interval < 0:
+        parser.error("savepoint_interval must not be negative.")
+    if parsed_args.data_dir and parsed_args.storage != "file":
+        parser.error("--data-dir requires --storage file.")
+    if parsed_args.fsync_latency < 0:
+        parser.error("fsync_latency must not be negative.")
+    if parsed_args.cycle_delay < 0:
+        parser.error("cycle_delay must not be negative.")
+    if parsed_args.profile_output and not parsed_args.profile:
+        parser.error("--profile-output requires --profile.")
 
     return parsed_args
 
 
+def end_cycle(db_handler, recovery_manager, lock_manager, transaction_manager):
+    """
+    Do the work that closes every cycle: retry the lock requests of blocked transactions, advance the lock
+    manager's cycle, roll back the transactions that waited longer than the lock timeout, and flush the log
+    and database after every 25 writes, checkpointing the log, and mark the end of the cycle in the log.
+    Returns the IDs of the transactions aborted as deadlock victims.
+    """
+    # Unblock transactions if possible
+    transaction_manager.unblock_transactions()
+
+    # Increment cycle in lock manager for deadlock detection
+    lock_manager.increment_cycle()
+
+    # Resolve deadlocks with lock_timeout; the victims' writes are undone before their locks are released
+    victims = lock_manager.check_deadlocks(abort=transaction_manager.rollback_transaction)
+
+    # Flush logs and database after every 25 writes, then checkpoint the log
+    if recovery_manager.write_count >= 25:
+        recovery_manager.flush_logs()
+        if db_handler.write_database():
+            recovery_manager.checkpoint(transaction_manager.oldest_active_lsn())
+
+    # Remember where the cycle ended for point-in-time recovery
+    recovery_manager.mark_cycle(lock_manager.current_cycle)
+    return victims
+
+
 def simulation_loop(
         db_handler, recovery_manager, lock_manager, transaction_manager,
         max_cycles, max_transaction_size, prob_start_transaction, prob_write,
-        prob_rollback
+        prob_rollback, cycle_delay=0.1, profiler=None, savepoint_interval=0
 ):
     """
     Run the simulation loop for managing transactions, locks, and recovery.
+    - cycle_delay: Seconds to sleep at the end of each cycle.
+    - savepoint_interval: If set, transactions take a savepoint after every this many writes, and a rollback
+      (or a blocked transaction drawing one) goes back to the latest savepoint instead of aborting.
+    - profiler: Optional Profiler that records a timing breakdown for every cycle.
+    Returns a dict of counters describing the run (transactions started, commits, rollbacks, ...).
     """
     logger = get_logger("SimulationLoop")
+    hot_logger = get_hot_path_logger("SimulationLoop")
     logger.info("Starting simulation loop...")
 
     active_transactions = {}
     current_cycle = 0
-    transaction_counter = 0  # To assign unique transaction IDs
+    transaction_counter = recovery_manager.last_transaction_id  # IDs stay unique across restarts
+    stats = dict.fromkeys(["started", "committed", "rolled_back", "savepoint_rollbacks", "deadlock_aborts",
+                           "writes", "blocked_writes"], 0)
 
     while current_cycle < max_cycles:
-        logger.info(f"Cycle {current_cycle + 1} begins.")
+        hot_logger.info("Cycle %s begins.", current_cycle + 1)
+        if profiler:
+            profiler.begin_cycle(current_cycle)
 
         # Start a new transaction based on prob_start_transaction
         if random.random() <= prob_start_transaction:
             transaction_counter += 1
             transaction_id = transaction_counter
             transaction_manager.start_transaction(transaction_id)
+            stats["started"] += 1
             active_transactions[transaction_id] = {
                 "operations_count": 0,
                 "is_blocked": False,
                 "start_cycle": current_cycle,
-                "waiting_cycles": 0
+                "waiting_cycles": 0,
+                "savepoint": None  # (name, operations_count) of the latest savepoint
             }
-            logger.info(f"Started transaction {transaction_id}.")
+            hot_logger.info("Started transaction %s.", transaction_id)
 
         # Process active transactions
         for transaction_id in list(active_transactions.keys()):
             transaction_data = active_transactions[transaction_id]
             if transaction_manager.transactions[transaction_id]["blocked"]:
-                logger.debug(f"Transaction {transaction_id} is blocked, skipping.")
+                if transaction_data["savepoint"] and random.random() <= prob_rollback:
+                    # Give up the conflicting request and the work since the savepoint, keep the rest
+                    savepoint_name, transaction_data["operations_count"] = transaction_data["savepoint"]
+                    transaction_manager.rollback_to_savepoint(transaction_id, savepoint_name)
+                    transaction_data["is_blocked"] = False
+                    stats["savepoint_rollbacks"] += 1
+                else:
+                    hot_logger.debug("Transaction %s is blocked, skipping.", transaction_id)
                 continue
 
             if transaction_data["operations_count"] >= max_transaction_size:
                 transaction_manager.commit_transaction(transaction_id)
-                logger.info(f"Committed transaction {transaction_id}.")
+                stats["committed"] += 1
+                hot_logger.info("Committed transaction %s.", transaction_id)
                 del active_transactions[transaction_id]
                 continue
 
@@ -153,43 +298,53 @@ def simulation_loop(
             else:
                 operation_type = "noop"
 
-            if operation_type == "rollback":
+            if operation_type == "rollback" and transaction_data["savepoint"]:
+                savepoint_name, transaction_data["operations_count"] = transaction_data["savepoint"]
+                transaction_manager.rollback_to_savepoint(transaction_id, savepoint_name)
+                stats["savepoint_rollbacks"] += 1
+                hot_logger.info("Transaction %s rolled back to savepoint %s.", transaction_id, savepoint_name)
+            elif operation_type == "rollback":
                 transaction_manager.rollback_transaction(transaction_id)
-                logger.info(f"Transaction {transaction_id} rolled back.")
+                stats["rolled_back"] += 1
+                hot_logger.info("Transaction %s rolled back.", transaction_id)
                 del active_transactions[transaction_id]
             elif operation_type == "write":
                 data_id = random.randint(0, 31)
                 success = transaction_manager.submit_operation(transaction_id, data_id, "F")
                 if success:
                     transaction_data["operations_count"] += 1
-                    logger.info(f"Transaction {transaction_id} wrote to data {data_id}.")
+                    stats["writes"] += 1
+                    hot_logger.info("Transaction %s wrote to data %s.", transaction_id, data_id)
+                    if savepoint_interval and transaction_data["operations_count"] % savepoint_interval == 0:
+                        savepoint_name = f"sp{transaction_data['operations_count']}"
+                        transaction_manager.create_savepoint(transaction_id, savepoint_name)
+                        transaction_data["savepoint"] = (savepoint_name, transaction_data["operations_count"])
                 else:
                     transaction_data["is_blocked"] = True
+                    stats["blocked_writes"] += 1
             else:
-                logger.info(f"Transaction {transaction_id} performed no operation.")
+                hot_logger.info("Transaction %s performed no operation.", transaction_id)
 
-        # Unblock transactions if possible
-        transaction_manager.unblock_transactions()
+        # Close the cycle and forget the deadlock victims
+        for transaction_id in end_cycle(db_handler, recovery_manager, lock_manager, transaction_manager):
+            if active_transactions.pop(transaction_id, None) is not None:
+                stats["deadlock_aborts"] += 1
+                hot_logger.info("Transaction %s rolled back after deadlock abort.", transaction_id)
 
-        # Increment cycle in lock manager for deadlock detection
-        lock_manager.increment_cycle()
-
-        # Resolve deadlocks with lock_timeout
-        lock_manager.check_deadlocks()
-
-        # Flush logs and database after every 25 writes
-        if recovery_manager.write_count >= 25:
-            recovery_manager.flush_logs()
-            db_handler.write_database()
+        if profiler:
+            profiler.end_cycle()
 
         # Increment cycle count
         current_cycle += 1
-        sleep(0.1)  # Simulate delay
+        if cycle_delay:
+            sleep(cycle_delay)  # Simulate delay
 
     logger.info("Simulation loop complete.")
 
     # Output the current state of the database
     print("Final database state:", db_handler.buffer)
+    stats["cycles"] = current_cycle
+    stats["active_at_end"] = len(active_transactions)
 
     # Since the system crashes here, we should not write any more to the log or database
     # Do not flush logs or write database
@@ -197,33 +352,62 @@ def simulation_loop(
     # The final database state is printed above
 
     logger.info("Simulation ended due to reaching maximum cycles (simulated crash).")
+    return stats
 
 
 if __name__ == "__main__":
-    # Set up logging
-    setup_logging()
-    main_logger = get_logger("main")
-    main_logger.info("Logging is set up and working correctly.")
-
     # Parse command-line arguments
     simulation_args = parse_arguments()
 
-    # Initialize modules
-    db_handler_instance, recovery_manager_instance, lock_manager_instance, transaction_manager_instance = \
-        initialize_modules(simulation_args.timeout)
-
-    # Simulation parameters from parsed arguments
-    total_cycles = simulation_args.cycles
-    transaction_size = simulation_args.trans_size
-    start_probability = simulation_args.start_prob
-    write_probability = simulation_args.write_prob
-    rollback_probability = simulation_args.rollback_prob
+    simulation_storage = make_storage(simulation_args.storage, root=simulation_args.data_dir,
+                                      sync_latency=simulation_args.fsync_latency)
 
-    # Start the simulation loop
-    simulation_loop(
-        db_handler_instance, recovery_manager_instance, lock_manager_instance, transaction_manager_instance,
-        total_cycles, transaction_size, start_probability, write_probability, rollback_probability
-    )
+    # Set up logging (the only place it is configured for a command-line run)
+    setup_logging(level=getattr(logging, simulation_args.log_level), use_queue=simulation_args.log_queue,
+                  storage=simulation_storage)
+    if simulation_args.quiet_hot_paths is not None:
+        set_hot_path_logging(False, *simulation_args.quiet_hot_paths)
+    main_logger = get_logger("main")
+    main_logger.info("Logging is set up and working correctly.")
+    get_logger("ArgumentParser").info("Parsed arguments: %s", vars(simulation_args))
+
+    simulation_profiler = Profiler() if simulation_args.profile else None
+
+    with profiling_session(simulation_args.cprofile, simulation_args.tracemalloc):
+        # Initialize modules
+        db_handler_instance, recovery_manager_instance, lock_manager_instance, transaction_manager_instance = \
+            initialize_modules(simulation_args.timeout, profiler=simulation_profiler,
+                               segment_size=simulation_args.wal_segment_size, storage=simulation_storage,
+                               archive=simulation_args.wal_archive, snapshots=simulation_args.pitr_snapshots,
+                               deferred=simulation_args.deferred_writes)
+
+        # Simulation parameters from parsed arguments
+        total_cycles = simulation_args.cycles
+        transaction_size = simulation_args.trans_size
+        start_probability = simulation_args.start_prob
+        write_probability = simulation_args.write_prob
+        rollback_probability = simulation_args.rollback_prob
+
+        # Start the simulation loop
+        simulation_loop(
+            db_handler_instance, recovery_manager_instance, lock_manager_instance, transaction_manager_instance,
+            total_cycles, transaction_size, start_probability, write_probability, rollback_probability,
+            cycle_delay=simulation_args.cycle_delay, profiler=simulation_profiler,
+            savepoint_interval=simulation_args.savepoint_interval
+        )
+
+    if simulation_profiler:
+        print(simulation_profiler.report())
+        if simulation_args.profile_output:
+            simulation_profiler.write_cycles_csv(simulation_args.profile_output)
+    if simulation_args.fsync_latency:
+        print(f"fsyncs: {simulation_storage.sync_count}, {simulation_storage.sync_seconds:.3f} s")
+    if simulation_args.wal_archive:
+        recovery_manager_instance.wal.wait_for_archive()
+        archived_bytes, compressed_bytes = recovery_manager_instance.wal.archive_sizes()
+        if compressed_bytes:
+            print(f"WAL archive: {archived_bytes} bytes of log in {compressed_bytes} bytes "
+                  f"({archived_bytes / compressed_bytes:.1f}x)")
 
     main_logger.info("Simulation successfully completed.")
     print("Modules successfully initialized and simulation completed.")
@@ -0,0 +1,68 @@
+from db_handler import DBHandler
+from logging_config import setup_logging
+from recovery_manager import RecoveryManager
+from storage import FileStorage
+from time import perf_counter
+from wal_files import manifest_segment_size
+import argparse
+import logging
+
+
+def recover_point(directory=None, db_file="db", log_file="log", lsn=None, transaction_id=None, cycle=None,
+                  run=None, output=None):
+    """
+    Rebuild the database of a finished or crashed simulation as of an earlier point, leaving its files as
+    they are (see RecoveryManager.recover_to).
+    - directory: Directory holding the simulation's files (None for the current directory).
+    - lsn, transaction_id, cycle: The point, exactly one of them.
+    - run: With cycle, the run of the simulation the cycle belongs to (default: the latest).
+    - output: If set, write the recovered database to this file in the directory, in the db file format.
+    Returns (buffer, lsn): the recovered values and the LSN of the last entry replayed.
+    """
+    storage = FileStorage(directory)
+    db_handler = DBHandler(db_file=db_file, storage=storage)
+    segment_size = manifest_segment_size(log_file, storage)  # None for a single log file
+    # Reading the snapshot catalog never takes or deletes snapshots, so the number kept does not matter here
+    recovery_manager = RecoveryManager(db_handler, log_file=log_file, segment_size=segment_size, snapshots=1)
+    buffer, point_lsn = recovery_manager.recover_to(lsn=lsn, transaction_id=transaction_id, cycle=cycle, run=run)
+    if output:
+        db_handler.db_file = output
+        db_handler.buffer = buffer
+        db_handler.write_database()
+    return buffer, point_lsn
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Show the database of a simulation as of an earlier LSN, transaction or cycle."
+    )
+    point = parser.add_mutually_exclusive_group(required=True)
+    point.add_argument("--lsn", type=int, help="Recover to just after the log entry with this LSN.")
+    point.add_argument("--transaction", type=int, metavar="ID",
+                       help="Recover to just after this transaction committed or rolled back.")
+    point.add_argument("--cycle", type=int,
+                       help="Recover to the end of this cycle (needs a run with --pitr-snapshots).")
+    parser.add_argument("--run", type=int,
+                        help="With --cycle, the run of the simulation (each restart is a new run; default: the "
+                             "latest).")
+    parser.add_argument("--data-dir", metavar="DIR",
+                        help="Directory of the db and log files (default: the current directory).")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Also write the recovered database to FILE in the data directory.")
+    parsed_args = parser.parse_args()
+    if parsed_args.run is not None and parsed_args.cycle is None:
+        parser.error("--run requires --cycle.")
+    return parsed_args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    setup_logging(level=logging.INFO, storage=FileStorage(args.data_dir))
+    start = perf_counter()
+    try:
+        recovered, recovered_lsn = recover_point(args.data_dir, lsn=args.lsn, transaction_id=args.transaction,
+                                                 cycle=args.cycle, run=args.run, output=args.output)
+    except ValueError as e:
+        raise SystemExit(f"Cannot recover: {e}")
+    print(f"Database as of LSN {recovered_lsn} (recovered in {perf_counter() - start:.4f} s):")
+    print(recovered)
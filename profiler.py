@@ -0,0 +1,165 @@
+from logging_config import get_logger
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+import cProfile
+import csv
+import pstats
+import sys
+import tracemalloc
+
+# Methods timed by instrument_modules, as (attribute holding the module, method name).
+HOT_PATH_METHODS = (
+    ("lock_manager", "acquire_lock"),
+    ("lock_manager", "release_locks"),
+    ("recovery_manager", "write_log"),
+    ("recovery_manager", "undo_transaction"),
+    ("db_handler", "update_buffer"),
+    ("db_handler", "write_database"),
+    ("recovery_manager", "apply_logs"),
+)
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Initialize the Profiler.
+        Timings are exclusive: when one timed method calls another (e.g. update_buffer triggering
+        write_database), the inner call is charged to its own component only, so the components of a
+        cycle add up to at most the cycle's wall time.
+        """
+        self.total_ns = defaultdict(int)  # {component: exclusive nanoseconds}
+        self.call_counts = defaultdict(int)  # {component: number of calls}
+        self.cycles = []  # [(cycle, wall nanoseconds, {component: exclusive nanoseconds})]
+        self._cycle = None  # Number of the cycle being timed, None outside the loop
+        self._cycle_start = 0
+        self._cycle_ns = defaultdict(int)
+        self._child_ns = []  # Stack of time spent in nested timed calls, one slot per active call
+        self.logger = get_logger(self.__class__.__name__)
+
+    def instrument(self, target, method_name, component=None):
+        """
+        Replace a method on a single object with a timed wrapper.
+        - target: The object whose method is timed (only this instance is affected).
+        - method_name: Name of the method to wrap.
+        - component: Name to report the time under (defaults to method_name).
+        """
+        component = component or method_name
+        method = getattr(target, method_name)
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            self._child_ns.append(0)
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                own = elapsed - self._child_ns.pop()
+                if self._child_ns:
+                    self._child_ns[-1] += elapsed
+                self.total_ns[component] += own
+                self.call_counts[component] += 1
+                if self._cycle is not None:
+                    self._cycle_ns[component] += own
+
+        setattr(target, method_name, timed)
+
+    def instrument_modules(self, **modules):
+        """
+        Time the standard hot-path methods on the given modules.
+        Accepts any of db_handler, recovery_manager and lock_manager as keyword arguments.
+        """
+        for module_name, method_name in HOT_PATH_METHODS:
+            if module_name in modules:
+                self.instrument(modules[module_name], method_name)
+
+    def begin_cycle(self, cycle):
+        """Start timing a simulation cycle."""
+        self._cycle = cycle
+        self._cycle_ns = defaultdict(int)
+        self._cycle_start = perf_counter_ns()
+
+    def end_cycle(self):
+        """Finish timing the current simulation cycle and record its breakdown."""
+        if self._cycle is None:
+            return
+        self.cycles.append((self._cycle, perf_counter_ns() - self._cycle_start, dict(self._cycle_ns)))
+        self._cycle = None
+
+    def components(self):
+        """Return the names of all components seen so far, in a stable order."""
+        known = [method_name for _, method_name in HOT_PATH_METHODS]
+        return [name for name in known if name in self.call_counts] + \
+            sorted(name for name in self.call_counts if name not in known)
+
+    def report(self, slowest=5):
+        """
+        Build a text report with the per-component totals and the slowest cycles.
+        - slowest: Number of slowest cycles to break down individually.
+        """
+        loop_ns = sum(wall_ns for _, wall_ns, _ in self.cycles)
+        lines = ["Component timings (exclusive):",
+                 f"  {'component':<16}{'calls':>10}{'total ms':>12}{'mean us':>12}{'% of loop':>11}"]
+        for component in self.components():
+            calls = self.call_counts[component]
+            total_ns = self.total_ns[component]
+            share = 100.0 * total_ns / loop_ns if loop_ns else 0.0
+            lines.append(f"  {component:<16}{calls:>10}{total_ns / 1e6:>12.3f}{total_ns / calls / 1e3:>12.2f}"
+                         f"{share:>10.1f}%")
+
+        if self.cycles:
+            walls = [wall_ns for _, wall_ns, _ in self.cycles]
+            lines.append(f"Cycles: {len(self.cycles)}, mean {sum(walls) / len(walls) / 1e3:.1f} us, "
+                         f"max {max(walls) / 1e3:.1f} us")
+            lines.append(f"Slowest {min(slowest, len(self.cycles))} cycles:")
+            for cycle, wall_ns, breakdown in sorted(self.cycles, key=lambda entry: entry[1], reverse=True)[:slowest]:
+                parts = ", ".join(f"{name} {ns / 1e3:.1f} us" for name, ns in
+                                  sorted(breakdown.items(), key=lambda item: item[1], reverse=True))
+                lines.append(f"  cycle {cycle + 1}: {wall_ns / 1e3:.1f} us ({parts or 'no timed calls'})")
+        return "\n".join(lines)
+
+    def write_cycles_csv(self, path):
+        """
+        Write the per-cycle breakdown as CSV: cycle, wall time, then one column per component (all in ns).
+        """
+        components = self.components()
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cycle", "wall_ns"] + components)
+            for cycle, wall_ns, breakdown in self.cycles:
+                writer.writerow([cycle + 1, wall_ns] + [breakdown.get(name, 0) for name in components])
+        self.logger.info("Per-cycle profile written to %s.", path)
+
+
+@contextmanager
+def profiling_session(cprofile_output=None, trace_memory=False, stream=None, top=15):
+    """
+    Run the enclosed block under cProfile and/or tracemalloc and print the results when it ends.
+    - cprofile_output: File to dump cProfile statistics to (readable with pstats), or None to skip cProfile.
+    - trace_memory: Track allocations with tracemalloc and report the largest allocation sites.
+    - stream: Where to print the summaries (defaults to stdout).
+    - top: Number of entries shown in each summary.
+    """
+    stream = stream or sys.stdout
+    profile = cProfile.Profile() if cprofile_output else None
+    if trace_memory:
+        tracemalloc.start()
+    if profile:
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(cprofile_output)
+            print(f"cProfile statistics written to {cprofile_output}.", file=stream)
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(top)
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"tracemalloc: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", file=stream)
+            for statistic in snapshot.statistics("lineno")[:top]:
+                print(f"  {statistic}", file=stream)
@@ -1,97 +1,438 @@
-from logging_config import get_logger
-import os
+from logging_config import get_logger, get_hot_path_logger
+from log_reader import LogIndex, LogReader, format_entry, parse_record
+from snapshots import SnapshotCatalog
+from wal_files import SegmentedLog, SingleFileLog
+
+
+def track_outcome(record, open_writes, newest_lsns):
+    """
+    Account for one log record in the tables of unfinished transactions kept by recovery.
+    - open_writes: {transaction_id: LSNs of its writes not compensated so far}, until it finishes.
+    - newest_lsns: {transaction_id: LSN of its newest entry}, until it finishes.
+    """
+    newest_lsns[record.transaction_id] = record.lsn
+    if record.operation == "F":
+        open_writes.setdefault(record.transaction_id, []).append(record.lsn)
+    elif record.operation == "U":
+        # Rollbacks undo a transaction's writes newest first, so a 'U' compensates its newest open write
+        if open_writes.get(record.transaction_id):
+            open_writes[record.transaction_id].pop()
+    elif record.operation in ("C", "R", "M"):
+        open_writes.pop(record.transaction_id, None)
+        del newest_lsns[record.transaction_id]
 
 
 class RecoveryManager:
-    def __init__(self, db_handler, log_file="log"):
-        """Initialize the RecoveryManager."""
+    def __init__(self, db_handler, log_file="log", index_interval=64, segment_size=None, sync_commits=True,
+                 storage=None, archive=None, snapshots=0):
+        """
+        Initialize the RecoveryManager.
+        - db_handler: DBHandler whose buffer is recovered.
+        - log_file: Path of the WAL log file; its sparse index is kept next to it in <log_file>.idx.
+        - index_interval: Number of log entries between LSN entries of the index.
+        - segment_size: If set, the WAL is split into preallocated segments of this many bytes
+          (<log_file>.000001, ...) that are recycled after checkpoints; otherwise it is the single file log_file.
+        - sync_commits: Force the log to stable storage when a commit entry is written.
+        - storage: Storage holding the log and its index; defaults to the database handler's storage.
+        - archive: With segment_size, compress released segments with this codec ("zlib" or "lzma") in the
+          background instead of recycling them, keeping the whole log history for replay (see iter_history).
+        - snapshots: Keep a copy of the database from each of the last this many checkpoints, and the log
+          position at the end of every cycle, so recover_to can start close to the requested point.
+        """
         self.db_handler = db_handler
         self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
         self.log_file = log_file
+        self.storage = storage or db_handler.storage
+        self.wal = (SegmentedLog(log_file, segment_size, storage=self.storage, archive=archive) if segment_size
+                    else SingleFileLog(log_file, storage=self.storage))
+        self.reader = LogReader(log_file, spans=self.wal.spans, storage=self.storage)
+        self.index = LogIndex(log_file + ".idx", interval=index_interval, storage=self.storage)
+        self.sync_commits = sync_commits
+        self.next_lsn = None  # LSN of the next entry; None until the log has been opened
+        self.end_offset = 0  # Logical offset just past the last complete entry
+        self.log_repaired = False  # Whether the log was opened for writing (see _open_log)
         self.write_count = 0  # Track the number of writes since the last flush
+        self.last_transaction_id = 0  # Highest transaction ID seen in the log
+        self.snapshots = None
+        if snapshots:
+            self.snapshots = SnapshotCatalog(db_handler.db_file, keep=snapshots, storage=self.storage)
+            self.snapshots.load()
         self.logger.info("RecoveryManager initialized.")
 
-    def write_log(self, transaction_id, data_id=None, old_value=None, operation=None):
+    def write_log(self, transaction_id, data_id=None, old_value=None, operation=None, prev_lsn=None, items=None):
         """
         Write an operation to the WAL log.
         - transaction_id: ID of the transaction performing the operation.
         - data_id: ID of the data involved (if applicable).
         - old_value: The old value of the data (if applicable).
-        - operation: The type of operation ('S', 'F', 'R', 'C').
+        - operation: The type of operation ('S', 'F', 'U', 'R', 'C', or 'M' for a multi-item commit).
+        - prev_lsn: LSN of the transaction's previous entry, chaining its entries backwards (for 'U', the
+          next entry to undo).
+        - items: For 'M', the (data_id, old_value) pairs of the write set.
+        Returns the LSN of the new entry.
         """
-        log_entry = [str(transaction_id)]
-        if data_id is not None:
-            log_entry.extend([str(data_id), str(old_value)])
-        if operation is not None:
-            log_entry.append(operation)
+        log_entry = format_entry(transaction_id, data_id, old_value, operation, prev_lsn, items)
+        line = log_entry + "\n"
+        self._open_log(refresh=self.next_lsn is not None and not self.log_repaired)
+        lsn = self.next_lsn
+        offset = self._append_entry(line, lsn, sync=self.sync_commits and operation in ("C", "M"))
+        self.next_lsn += 1
+        self.end_offset = offset + len(line)
+        self.index.add(lsn, offset, transaction_id, operation)
 
-        # Write to the log file
-        with open(self.log_file, "a") as f:
-            f.write(",".join(log_entry) + "\n")
-
-        self.logger.info(f"Log entry added: {log_entry}")
+        self.hot_logger.info("Log entry %s added: %s", lsn, log_entry)
         self.write_count += 1
+        self.last_transaction_id = max(self.last_transaction_id, transaction_id)
+        return lsn
 
-        # Flush logs every 25 write operations
-        if self.write_count >= 25:
-            self.flush_logs()
+    def _append_entry(self, line, lsn, sync=False):
+        """
+        Append one formatted entry to the log.
+        Returns the logical offset of the entry.
+        """
+        return self.wal.append(line, lsn, sync=sync)
 
     def flush_logs(self):
         """
         Flush log entries to ensure durability.
-        (In this implementation, logs are flushed after every write.)
+        (Entries are written through on every append; this forces them to stable storage.)
+        The simulation loop calls this together with DBHandler.write_database.
         """
+        if self.wal.exists():
+            self.wal.sync()
         self.logger.info("Logs flushed to disk.")
         self.write_count = 0  # Reset the write count
 
+    def _open_log(self, refresh=False, repair=True):
+        """
+        Establish the next LSN and the end of the log, using the index to avoid scanning the whole log.
+        A torn last entry, left behind when the process stopped in the middle of an append, is cut off so
+        new entries start on a line of their own. A stale index (pointing past the end of the log or into
+        the middle of an entry) is rebuilt.
+        - refresh: Re-read the state from disk even if the log was opened before.
+        - repair: With False, only read: the torn entry is left in place and the index is neither rebuilt nor
+          extended (nor are interrupted segment archivals finished). write_log opens such a log again.
+        """
+        if self.next_lsn is not None and not refresh:
+            return
+        self.wal.open(repair=repair)
+        self.last_transaction_id = max(self.last_transaction_id, self.wal.last_transaction_id)
+        self.index.load()
+        spans = self.wal.spans()
+        data_end = spans[-1][1] + spans[-1][2] if spans else self.wal.start_offset
+        lsn, offset = self._seek_position(*self.index.last_position())
+        if offset > data_end or not self.wal.starts_entry(offset):
+            self.logger.warning("Log index %s does not match the log. %s it.", self.index.index_file,
+                                "Rebuilding" if repair else "Ignoring")
+            self.index.reset(remove_file=repair)
+            lsn, offset = self.wal.first_lsn, self.wal.start_offset
+
+        end_offset = offset
+        for line_offset, line in self.reader.lines(offset):
+            record = parse_record(lsn, line)
+            if record is not None:
+                if repair:
+                    self.index.add(lsn, line_offset, record.transaction_id, record.operation)
+                self.last_transaction_id = max(self.last_transaction_id, record.transaction_id)
+            end_offset = line_offset + len(line) + 1
+            lsn += 1
+
+        if data_end > end_offset and repair:
+            self.wal.truncate(end_offset)
+            self.logger.warning("Discarded a torn entry (%s bytes) at the end of log %s.",
+                                data_end - end_offset, self.log_file)
+        self.next_lsn = lsn
+        self.end_offset = end_offset
+        self.log_repaired = repair
+
+    def _seek_position(self, lsn, offset):
+        """Move a position that points before the start of the log (into released segments) to its start."""
+        if offset < self.wal.start_offset:
+            return self.wal.first_lsn, self.wal.start_offset
+        return lsn, offset
+
+    def rebuild_index(self):
+        """Discard the index and rebuild it with a full scan of the log."""
+        self.index.reset()
+        self._open_log(refresh=True)
+
+    def iter_log(self, start_lsn=1):
+        """
+        Stream log entries as LogRecord tuples, starting at the given LSN.
+        The index is used to seek close to start_lsn, so at most `index_interval` entries are skipped.
+        """
+        self._open_log()
+        lsn, offset = self._seek_position(*self.index.locate(start_lsn))
+        for _, record in self.reader.records(offset, lsn):
+            if record.lsn >= start_lsn:
+                yield record
+
+    def iter_log_reverse(self):
+        """Stream log entries as LogRecord tuples, newest first."""
+        self._open_log()
+        for _, record in self.reader.reverse_records(self.end_offset, self.next_lsn - 1):
+            yield record
+
+    def iter_history(self, start_lsn=1):
+        """
+        Stream log entries as LogRecord tuples from the given LSN like iter_log, reading archived segments
+        for entries released by checkpoints. Entries released without an archive are gone; the stream then
+        starts at the oldest entry still available.
+        """
+        self._open_log()
+        if start_lsn >= self.wal.first_lsn:
+            yield from self.iter_log(start_lsn)
+            return
+        lsn, offset = self.wal.archive_position(start_lsn) or (self.wal.first_lsn, self.wal.start_offset)
+        if lsn > start_lsn:
+            self.logger.warning("Log entries before LSN %s are no longer kept.", lsn)
+        reader = LogReader(self.log_file, spans=lambda: self.wal.spans(archived=True), storage=self.storage)
+        for _, record in reader.records(offset, lsn):
+            if record.lsn >= start_lsn:
+                yield record
+
+    def record_at(self, lsn):
+        """Return the LogRecord with the given LSN, or None if there is no such entry."""
+        for record in self.iter_log(lsn):
+            return record if record.lsn == lsn else None
+        return None
+
+    def iter_transaction(self, transaction_id):
+        """
+        Stream the entries of one transaction, seeking directly to its start entry through the index.
+        Stops after the transaction's commit ('C' or 'M') or rollback ('R') entry.
+        """
+        self._open_log()
+        lsn, offset = self._seek_position(*self.index.transaction_starts.get(transaction_id, (1, 0)))
+        for _, record in self.reader.records(offset, lsn):
+            if record.transaction_id == transaction_id:
+                yield record
+                if record.operation in ("C", "R", "M"):
+                    return
+
+    def undo_transaction(self, transaction_id, last_lsn, stop_lsn=None):
+        """
+        Undo the writes of a transaction by walking its log chain backwards from last_lsn.
+        For every 'F' entry a compensation entry ('U') is written before the old value is restored; its chain
+        pointer skips to the entry before the undone write, so compensated writes are never visited again.
+        Only the transaction's own entries are read, each found through the index.
+        - transaction_id: ID of the transaction to undo.
+        - last_lsn: LSN of the transaction's newest entry.
+        - stop_lsn: Undo only the writes after this LSN (a savepoint); None undoes the whole transaction.
+        Returns the LSN of the transaction's newest entry afterwards (the last compensation entry written).
+        """
+        lsn = last_lsn
+        while lsn is not None and (stop_lsn is None or lsn > stop_lsn):
+            record = self.record_at(lsn)
+            if record is None or record.transaction_id != transaction_id:
+                self.logger.error("Log chain of transaction %s is broken at LSN %s.", transaction_id, lsn)
+                break
+            if record.operation == "F":
+                undone_value = 1 if record.old_value == 0 else 0
+                last_lsn = self.write_log(transaction_id, data_id=record.data_id, old_value=undone_value,
+                                          operation="U", prev_lsn=record.prev_lsn)
+                self.db_handler.update_buffer(record.data_id, record.old_value)
+                self.hot_logger.info("Transaction %s: Undid write on %s (LSN %s): %s -> %s.", transaction_id,
+                                     record.data_id, lsn, undone_value, record.old_value)
+            elif record.operation == "S":
+                break
+            lsn = record.prev_lsn
+        return last_lsn
+
     def read_log(self):
         """
         Read and parse the WAL log.
+        This loads the whole log into memory; iter_log streams it instead.
         Returns:
             List of log entries (each entry is a list).
         """
-        if not os.path.exists(self.log_file):
-            self.logger.warning(f"Log file {self.log_file} does not exist. No logs to read.")
+        if not self.wal.exists():
+            self.logger.warning("Log file %s does not exist. No logs to read.", self.log_file)
             return []
 
-        log_entries = []
-        with open(self.log_file, "r") as f:
-            for line in f:
-                parts = line.strip().split(",")
-                log_entries.append(parts)
-        self.logger.info(f"Read {len(log_entries)} log entries from the log file.")
+        self._open_log()
+        log_entries = [line.strip().split(",") for _, line in self.reader.lines(self.wal.start_offset)]
+        self.logger.info("Read %s log entries from the log file.", len(log_entries))
         return log_entries
 
     def apply_logs(self):
-        if not os.path.exists(self.log_file):
-            self.logger.warning(f"Log file {self.log_file} does not exist. No logs to apply.")
-            return
+        """
+        Recover the database buffer from the WAL: redo every write since the last checkpoint, then undo the
+        writes of transactions that never finished, logging the undo like a rollback (see ReadMe, section 7).
+        With snapshots enabled for the first time, the recovered database is saved as the base snapshot.
+        """
+        if self.wal.exists():
+            self._open_log(refresh=True)
+            open_writes, newest_lsns = self.analyze_log()
+            self.redo_log()
+            self.undo_unfinished(open_writes, newest_lsns)
+            self.db_handler.write_database()
+            self.logger.info("Database state recovered and flushed to disk.")
+        else:
+            self.logger.warning("Log file %s does not exist. No logs to apply.", self.log_file)
+        if self.snapshots and self.snapshots.base_lsn is None:
+            # No transaction is active after recovery, so the buffer is a valid starting image for recover_to
+            self._open_log()
+            self.snapshots.take_base(self.db_handler.buffer, self.next_lsn)
+
+    def analyze_log(self):
+        """
+        Find the writes of unfinished transactions that have not been compensated (the first pass of
+        apply_logs), streaming the whole log.
+        Returns (open_writes, newest_lsns): {transaction_id: LSNs of its writes not compensated so far} and
+        {transaction_id: LSN of its newest entry}, both for unfinished transactions only.
+        """
+        open_writes, newest_lsns = {}, {}
+        for record in self.iter_log():
+            self.last_transaction_id = max(self.last_transaction_id, record.transaction_id)
+            track_outcome(record, open_writes, newest_lsns)
+        return open_writes, newest_lsns
+
+    def redo_log(self):
+        """Redo every 'F', 'U' and 'M' entry since the checkpoint in log order."""
+        for record in self.iter_log(max(self.wal.checkpoint_lsn, 1)):
+            self.redo_record(record)
+
+    def redo_record(self, record):
+        """Apply the after-image of an 'F', 'U' or 'M' entry to the buffer; other entries are ignored."""
+        if record.operation == "M":
+            for data_id, old_value in record.items:
+                self.db_handler.update_buffer(data_id, 1 if old_value == 0 else 0)
+            self.hot_logger.info("Transaction %s: Applied 'M' log entry on data_ids %s.", record.transaction_id,
+                                 [data_id for data_id, _ in record.items])
+        elif record.operation in ("F", "U"):
+            # Toggle the value since new_value is not stored in the log
+            new_value = 1 if record.old_value == 0 else 0
+            self.db_handler.update_buffer(record.data_id, new_value)
+            self.hot_logger.info("Transaction %s: Applied '%s' log entry on data_id %s: %s -> %s",
+                                 record.transaction_id, record.operation, record.data_id, record.old_value,
+                                 new_value)
+
+    def undo_unfinished(self, open_writes, newest_lsns):
+        """
+        Undo the remaining writes of unfinished transactions newest first, logging a compensation entry for
+        each and an 'R' entry per transaction (the last pass of apply_logs).
+        - open_writes, newest_lsns: As returned by analyze_log.
+        """
+        undo_lsns = {lsn for lsns in open_writes.values() for lsn in lsns}
+        oldest_undo_lsn = min(undo_lsns, default=None)
+        newest_lsns = dict(newest_lsns)
+        for record in self.iter_log_reverse() if undo_lsns else ():
+            if record.lsn < oldest_undo_lsn:
+                break
+            if record.lsn in undo_lsns:
+                undone_value = 1 if record.old_value == 0 else 0
+                newest_lsns[record.transaction_id] = self.write_log(
+                    record.transaction_id, data_id=record.data_id, old_value=undone_value, operation="U",
+                    prev_lsn=record.prev_lsn)
+                self.db_handler.update_buffer(record.data_id, record.old_value)
+                self.hot_logger.info("Transaction %s: Undid 'F' log entry on data_id %s (restored %s).",
+                                     record.transaction_id, record.data_id, record.old_value)
+        for transaction_id, newest_lsn in newest_lsns.items():
+            self.write_log(transaction_id, operation="R", prev_lsn=newest_lsn)
+        if newest_lsns:
+            self.logger.info("Rolled back %s unfinished transactions.", len(newest_lsns))
+
+    def checkpoint(self, oldest_active_lsn=None):
+        """
+        Release log entries the database file no longer depends on.
+        Call right after a successful DBHandler.write_database: every transaction that finished before the
+        next LSN then has its outcome in the database file, so recovery can skip those transactions and
+        segments holding only entries older than oldest_active_lsn are recycled (a single-file log is kept
+        whole). With snapshots enabled, the database is also saved as a snapshot for recover_to.
+        - oldest_active_lsn: First LSN of the oldest active transaction (None if there is none).
+        Returns True if any part of the log was released.
+        """
+        self._open_log()
+        keep_from = self.next_lsn if oldest_active_lsn is None else oldest_active_lsn
+        if self.snapshots:
+            self.snapshots.take(self.db_handler.buffer, self.next_lsn, keep_from)
+        if not self.wal.release_before(keep_from, self.next_lsn, self.last_transaction_id):
+            return False
+        self.index.prune(self.wal.first_lsn)
+        self.logger.info("Checkpoint: log now starts at LSN %s.", self.wal.first_lsn)
+        return True
+
+    def mark_cycle(self, cycle):
+        """Remember the log position at the end of a simulation cycle for recover_to (only with snapshots)."""
+        if self.snapshots:
+            self._open_log()
+            self.snapshots.mark_cycle(cycle, self.next_lsn - 1)
+
+    def recover_to(self, lsn=None, transaction_id=None, cycle=None, run=None):
+        """
+        Rebuild the database as of an earlier point in the log, without changing the database file or the
+        log. The point is given by exactly one of:
+        - lsn: Just after the entry with this LSN.
+        - transaction_id: Just after the commit or rollback entry of this transaction.
+        - cycle: At the end of this simulation cycle (cycles are only marked with snapshots enabled). Every
+          run counts its cycles from 1; run picks the run (see SnapshotCatalog) and defaults to the latest.
+        Replay starts from the newest snapshot taken at or before the point (the base snapshot if no checkpoint
+        snapshot is old enough) and redoes the entries up to the point, reading archived segments as needed.
+        The writes of transactions still unfinished at the point are then undone, as a crash recovery there would.
+        Returns (buffer, lsn): the recovered database values and the LSN of the last entry replayed.
+        Raises ValueError if the point is unknown, no snapshot holds the database at or before it, or the
+        entries it needs are no longer kept.
+        """
+        self._open_log(repair=False)
+        target = self._point_lsn(lsn, transaction_id, cycle, run)
+        snapshot = self.snapshots.nearest(target) if self.snapshots else None
+        if snapshot is None:
+            raise ValueError(f"No database snapshot was taken at or before LSN {target}; point-in-time recovery "
+                             f"only reaches back to when snapshots were enabled.")
+        buffer = self.snapshots.read(snapshot[0])
+        redo_from, analyze_from = snapshot[0], min(snapshot)
+        oldest_kept = (self.wal.archive_position(1) or (self.wal.first_lsn,))[0]
+        if analyze_from < oldest_kept:
+            raise ValueError(f"Recovering to LSN {target} needs log entries from LSN {analyze_from}, but the log "
+                             f"only keeps entries from LSN {oldest_kept}; archive segments or keep snapshots.")
+
+        # One pass: redo after the snapshot, and remember the open writes of unfinished transactions
+        open_writes, newest_lsns, writes = {}, {}, {}
+        for record in self.iter_history(analyze_from):
+            if record.lsn > target:
+                break
+            if record.lsn >= redo_from and record.operation in ("F", "U"):
+                buffer[record.data_id] = 1 if record.old_value == 0 else 0
+            elif record.lsn >= redo_from and record.operation == "M":
+                for data_id, old_value in record.items:
+                    buffer[data_id] = 1 if old_value == 0 else 0
+            if record.operation == "F":
+                writes.setdefault(record.transaction_id, {})[record.lsn] = record
+            elif record.operation in ("C", "R", "M"):
+                writes.pop(record.transaction_id, None)
+            track_outcome(record, open_writes, newest_lsns)
+
+        undo = sorted((write_lsn, transaction_id) for transaction_id, lsns in open_writes.items() for write_lsn in lsns)
+        for write_lsn, transaction_id in reversed(undo):
+            record = writes[transaction_id][write_lsn]
+            buffer[record.data_id] = record.old_value
+        self.logger.info("Recovered the database as of LSN %s from the snapshot at LSN %s, undoing %s unfinished "
+                         "transactions.", target, redo_from, len(newest_lsns))
+        return buffer, target
+
+    def _point_lsn(self, lsn, transaction_id, cycle, run=None):
+        """Translate the point given to recover_to into the LSN of the last entry to replay."""
+        if [lsn, transaction_id, cycle].count(None) != 2:
+            raise ValueError("Give exactly one of lsn, transaction_id and cycle.")
+        if cycle is not None:
+            lsn = self.snapshots.cycle_end(cycle, run) if self.snapshots else None
+            if lsn is None:
+                raise ValueError(f"Cycle {cycle} is not marked in the log.")
+        elif transaction_id is not None:
+            lsn = self._transaction_end(transaction_id)
+            if lsn is None:
+                raise ValueError(f"Transaction {transaction_id} has no commit or rollback entry in the log.")
+        if not 0 <= lsn < self.next_lsn:
+            raise ValueError(f"LSN {lsn} is beyond the end of the log (LSN {self.next_lsn - 1}).")
+        return lsn
 
-        log_entries = self.read_log()
-
-        # Determine committed transactions
-        committed_transactions = set()
-        for parts in log_entries:
-            if len(parts) >= 2 and parts[-1] == "C":
-                transaction_id = int(parts[0])
-                committed_transactions.add(transaction_id)
-
-        # Apply 'F' entries only for committed transactions
-        for parts in log_entries:
-            if len(parts) >= 4 and parts[-1] == "F":
-                transaction_id = int(parts[0])
-                if transaction_id in committed_transactions:
-                    data_id = int(parts[1])
-                    old_value = int(parts[2])
-                    # Toggle the value since new_value is not stored in the log
-                    new_value = 1 if old_value == 0 else 0
-                    self.db_handler.update_buffer(data_id, new_value)
-                    self.logger.info(
-                        f"Transaction {transaction_id}: Applied 'F' log entry on data_id {data_id}: {old_value} "
-                        f"-> {new_value}")
-                else:
-                    self.logger.info(
-                        f"Transaction {transaction_id}: 'F' log entry skipped (transaction not committed).")
-
-        self.db_handler.write_database()
-        self.logger.info("Database state recovered and flushed to disk.")
+    def _transaction_end(self, transaction_id):
+        """Return the LSN of a transaction's commit or rollback entry, or None if it has none."""
+        records = (self.iter_transaction(transaction_id) if transaction_id in self.index.transaction_starts
+                   else self.iter_history())
+        for record in records:
+            if record.transaction_id == transaction_id and record.operation in ("C", "R", "M"):
+                return record.lsn
+        return None
@@ -0,0 +1,441 @@
+from db_handler import DBHandler
+from lock_manager import LockManager
+from log_reader import format_entry, parse_record
+from logging_config import get_logger, get_hot_path_logger, set_hot_path_logging
+from main import initialize_modules, simulation_loop
+from recovery_manager import RecoveryManager, track_outcome
+from storage import FileStorage
+from transaction_manager import TransactionManager
+from collections import deque, namedtuple
+from contextlib import redirect_stdout
+from statistics import mean
+from time import perf_counter
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import threading
+
+FailoverBenchmarkResult = namedtuple(
+    "FailoverBenchmarkResult",
+    ["cycles", "synchronous", "committed", "commits_per_second", "lag_mean_ms", "lag_p99_ms", "lag_max_ms",
+     "shipped_entries", "promotion_ms", "recovery_ms", "consistent"]
+)
+
+
+class ReplicationError(Exception):
+    """Raised when a standby cannot continue from a primary's log (a gap, a diverged log or a promoted standby)."""
+
+
+class LogShipper:
+    def __init__(self, recovery_manager, connection, synchronous=False):
+        """
+        Initialize the LogShipper, which streams a primary's WAL to a Standby over a connected socket.
+        Entries are sent once they have been appended to the primary's log, and the stream is flushed at the
+        end of every transaction ('C', 'M' and 'R' entries). The standby acknowledges each commit entry once it is
+        in its own log; the time from appending a commit entry to its acknowledgement is the replication lag.
+        If the standby goes away the primary carries on without it.
+        - recovery_manager: The primary's RecoveryManager.
+        - connection: Socket connected to a standby (see Standby.serve).
+        - synchronous: Make write_log wait for the acknowledgement of every commit entry, so a commit is only
+          reported once the standby has it.
+        """
+        self.recovery_manager = recovery_manager
+        self.connection = connection
+        self.synchronous = synchronous
+        self.reader = connection.makefile("rb")
+        self.writer = connection.makefile("wb")
+        self.connected = False
+        self.shipped = 0  # Number of entries sent
+        self.acked_lsn = 0  # LSN of the newest commit entry the standby acknowledged
+        self.lag_samples = []  # Seconds from appending a commit entry to its acknowledgement
+        self._unacked = deque()  # (lsn, append time) of commit entries not acknowledged yet
+        self._acked = threading.Condition()
+        self._ack_thread = None
+        self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
+
+    def attach(self):
+        """
+        Perform the handshake, send the entries the standby does not have yet (from archived segments if
+        needed) and ship every entry appended from now on.
+        Raises ReplicationError if the standby needs entries the primary no longer keeps, or if it has entries
+        the primary does not; the standby is told why and the connection is closed.
+        """
+        hello = self.reader.readline().split()
+        if len(hello) != 2 or hello[0] != b"HELLO":
+            self._refuse(f"Unexpected handshake {hello!r} from the standby.")
+        standby_lsn = int(hello[1])
+        recovery_manager = self.recovery_manager
+        recovery_manager._open_log()
+        # Archived segments still hold entries released from the log
+        oldest_lsn = (recovery_manager.wal.archive_position(1) or (recovery_manager.wal.first_lsn,))[0]
+        if standby_lsn < oldest_lsn:
+            self._refuse(f"The standby needs LSN {standby_lsn}, but the log now starts at LSN {oldest_lsn}; it has "
+                         f"to be seeded again.")
+        if standby_lsn > recovery_manager.next_lsn:
+            self._refuse(f"The standby is at LSN {standby_lsn}, past the end of the log "
+                         f"(LSN {recovery_manager.next_lsn}).")
+
+        # Acknowledgements are read from the start, so neither side blocks on a full socket during catch-up
+        self.connected = True
+        self._ack_thread = threading.Thread(target=self._read_acks, name="LogShipperAcks", daemon=True)
+        self._ack_thread.start()
+        backlog = 0
+        for record in recovery_manager.iter_history(standby_lsn):
+            self._send(record.lsn, format_entry(record.transaction_id, record.data_id, record.old_value,
+                                                record.operation, record.prev_lsn, record.items))
+            backlog += 1
+        self._flush()
+        self.logger.info("Standby attached at LSN %s; sent %s entries of backlog.", standby_lsn, backlog)
+
+        append_entry = recovery_manager._append_entry
+
+        def shipping_append_entry(line, lsn, sync=False):
+            offset = append_entry(line, lsn, sync=sync)
+            self.ship(lsn, line.rstrip("\n"))
+            return offset
+
+        recovery_manager._append_entry = shipping_append_entry
+
+    def ship(self, lsn, entry):
+        """
+        Send one entry that has been appended to the primary's log.
+        - lsn: LSN of the entry.
+        - entry: The entry without its trailing newline.
+        """
+        if not self.connected:
+            return
+        operation = parse_record(lsn, entry).operation
+        commit = operation in ("C", "M")
+        if commit:
+            with self._acked:
+                self._unacked.append((lsn, perf_counter()))
+        self._send(lsn, entry)
+        if commit or operation == "R":
+            self._flush()
+        if commit and self.synchronous:
+            with self._acked:
+                self._acked.wait_for(lambda: self.acked_lsn >= lsn or not self.connected)
+
+    def close(self):
+        """
+        Stop shipping: send what is still buffered, close the connection and wait until the standby has
+        acknowledged everything it received.
+        """
+        self._flush()
+        try:
+            self.connection.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        if self._ack_thread is not None:
+            self._ack_thread.join()
+        self.connected = False
+        for stream in (self.writer, self.reader, self.connection):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.logger.info("Log shipping stopped after %s entries.", self.shipped)
+
+    def _refuse(self, message):
+        """Tell the standby why it cannot be attached, close the connection and raise ReplicationError."""
+        try:
+            self.writer.write(f"ERROR {message}\n".encode("ascii", "replace"))
+            self.writer.flush()
+        except OSError:
+            pass
+        self.close()
+        raise ReplicationError(message)
+
+    def _send(self, lsn, entry):
+        try:
+            self.writer.write(f"{lsn} {entry}\n".encode("ascii"))
+            self.shipped += 1
+        except OSError as e:
+            self._disconnect(e)
+
+    def _flush(self):
+        if not self.connected:
+            return
+        try:
+            self.writer.flush()
+        except OSError as e:
+            self._disconnect(e)
+
+    def _disconnect(self, error):
+        if self.connected:
+            self.logger.warning("Lost the standby (%s); continuing without log shipping.", error)
+        with self._acked:
+            self.connected = False
+            self._acked.notify_all()
+
+    def _read_acks(self):
+        try:
+            for message in self.reader:
+                parts = message.split()
+                if parts[:1] == [b"ERROR"]:
+                    self.logger.error("The standby stopped: %s", message[6:].decode("ascii", "replace").strip())
+                    break
+                if len(parts) != 2 or parts[0] != b"ACK":
+                    continue
+                lsn = int(parts[1])
+                now = perf_counter()
+                with self._acked:
+                    self.acked_lsn = max(self.acked_lsn, lsn)
+                    while self._unacked and self._unacked[0][0] <= lsn:
+                        self.lag_samples.append(now - self._unacked.popleft()[1])
+                    self._acked.notify_all()
+                self.hot_logger.info("Standby acknowledged LSN %s.", lsn)
+        except (OSError, ValueError) as e:
+            self._disconnect(e)
+            return
+        with self._acked:  # The standby closed the connection
+            self.connected = False
+            self._acked.notify_all()
+
+
+class Standby:
+    def __init__(self, db_file="db", log_file="log", segment_size=None, storage=None, checkpoint_interval=25):
+        """
+        Initialize the Standby, which keeps a copy of a primary's log and database up to date.
+        Shipped entries are appended to the standby's own log under the same LSNs and redone right away, as
+        the redo pass of recovery would (history is repeated, uncommitted writes included), while the
+        unfinished transactions are tracked as in the analysis pass. Promotion then only has to undo the
+        transactions that were in flight, so a failover does not wait for a full recovery.
+        A restarted standby redoes its own log since its last checkpoint and asks for the entries after it.
+        - db_file, log_file, segment_size, storage: The standby's files, as for initialize_modules.
+        - checkpoint_interval: Number of applied entries between database writes (and log checkpoints).
+        """
+        self.db_handler = DBHandler(db_file=db_file, storage=storage)
+        self.db_handler.read_database()
+        self.recovery_manager = RecoveryManager(self.db_handler, log_file=log_file, segment_size=segment_size)
+        self.recovery_manager._open_log(refresh=True)
+        self.open_writes, self.newest_lsns = self.recovery_manager.analyze_log()
+        self.recovery_manager.redo_log()
+        self.checkpoint_interval = checkpoint_interval
+        self.promoted = False
+        self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
+        self.logger.info("Standby ready at LSN %s with %s unfinished transactions.", self.recovery_manager.next_lsn,
+                         len(self.newest_lsns))
+
+    @property
+    def next_lsn(self):
+        return self.recovery_manager.next_lsn
+
+    def apply_entry(self, lsn, entry):
+        """
+        Append one shipped entry to the standby's log and redo it.
+        - lsn: LSN of the entry in the primary's log.
+        - entry: The entry without its trailing newline.
+        Returns the LogRecord, or None if the standby already had the entry.
+        Raises ReplicationError on a gap in the LSNs, a malformed entry or after promotion.
+        """
+        if self.promoted:
+            raise ReplicationError("The standby has been promoted and no longer accepts log entries.")
+        recovery_manager = self.recovery_manager
+        if lsn < recovery_manager.next_lsn:
+            return None
+        if lsn > recovery_manager.next_lsn:
+            raise ReplicationError(f"Gap in the shipped log: expected LSN {recovery_manager.next_lsn}, got {lsn}.")
+        record = parse_record(lsn, entry)
+        if record is None:
+            raise ReplicationError(f"Malformed log entry {entry!r} at LSN {lsn}.")
+
+        recovery_manager.write_log(record.transaction_id, data_id=record.data_id, old_value=record.old_value,
+                                   operation=record.operation, prev_lsn=record.prev_lsn, items=record.items)
+        track_outcome(record, self.open_writes, self.newest_lsns)
+        recovery_manager.redo_record(record)
+        if recovery_manager.write_count >= self.checkpoint_interval:
+            self.checkpoint()
+        return record
+
+    def checkpoint(self):
+        """Write the database and release the log entries the standby no longer needs."""
+        recovery_manager = self.recovery_manager
+        recovery_manager.flush_logs()
+        if self.db_handler.write_database():
+            starts = recovery_manager.index.transaction_starts
+            first_lsn = recovery_manager.wal.first_lsn
+            recovery_manager.checkpoint(min((starts.get(transaction_id, (first_lsn,))[0]
+                                             for transaction_id in self.newest_lsns), default=None))
+
+    def serve(self, connection):
+        """
+        Receive and apply a primary's log over a connected socket until the primary closes the connection,
+        acknowledging every commit entry once it is in the standby's log.
+        Returns the number of entries applied.
+        Raises ReplicationError if the primary refuses the standby or sends an entry the standby cannot apply;
+        the primary is told why (an ERROR line) and the connection is closed.
+        """
+        reader = connection.makefile("rb")
+        writer = connection.makefile("wb")
+        applied = 0
+        try:
+            writer.write(f"HELLO {self.next_lsn}\n".encode("ascii"))
+            writer.flush()
+            for message in reader:
+                if not message.endswith(b"\n"):
+                    break  # Cut short when the primary stopped
+                lsn, _, entry = message.decode("ascii").rstrip("\n").partition(" ")
+                if lsn == "ERROR":
+                    raise ReplicationError(f"The primary refused the standby: {entry}")
+                if not lsn.isdigit():
+                    raise ReplicationError(f"Malformed message {message!r} from the primary.")
+                record = self.apply_entry(int(lsn), entry)
+                if record is None:
+                    continue
+                applied += 1
+                if record.operation in ("C", "M"):
+                    writer.write(f"ACK {record.lsn}\n".encode("ascii"))
+                    writer.flush()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self.logger.warning("Connection to the primary lost: %s", e)
+        except ReplicationError as e:
+            self.logger.error("Stopped replicating at LSN %s: %s", self.next_lsn, e)
+            try:
+                writer.write(f"ERROR {e}\n".encode("ascii", "replace"))
+                writer.flush()
+            except OSError:
+                pass
+            raise
+        finally:
+            for stream in (writer, reader, connection):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        self.logger.info("Primary disconnected; applied %s entries, standby at LSN %s.", applied, self.next_lsn)
+        return applied
+
+    def promote(self, timeout_cycles):
+        """
+        Turn the standby into a primary: undo the transactions the old primary left unfinished, write the
+        database and build the remaining modules.
+        - timeout_cycles: Lock timeout of the new LockManager.
+        Returns (db_handler, recovery_manager, lock_manager, transaction_manager), like initialize_modules.
+        """
+        self.recovery_manager.undo_unfinished(self.open_writes, self.newest_lsns)
+        self.open_writes, self.newest_lsns = {}, {}
+        if self.db_handler.write_database():
+            self.recovery_manager.checkpoint()
+        self.promoted = True
+        self.logger.info("Standby promoted at LSN %s.", self.next_lsn)
+        lock_manager = LockManager(timeout_cycles)
+        transaction_manager = TransactionManager(lock_manager, self.recovery_manager, self.db_handler)
+        return self.db_handler, self.recovery_manager, lock_manager, transaction_manager
+
+
+def listen(host="127.0.0.1", port=0):
+    """Return a listening TCP socket for a standby; port 0 picks a free port (see getsockname)."""
+    server = socket.create_server((host, port))
+    server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return server
+
+
+def connect(address):
+    """Connect a primary to a standby listening at address (host, port)."""
+    connection = socket.create_connection(address)
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return connection
+
+
+def _standby_process(directory, segment_size, timeout, ports, results):
+    """Run a standby in its own process: serve one primary, then promote and report the promotion time."""
+    set_hot_path_logging(False)
+    standby = Standby(segment_size=segment_size, storage=FileStorage(directory))
+    with listen() as server:
+        ports.put(server.getsockname()[1])
+        connection, _ = server.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        applied = standby.serve(connection)
+    except ReplicationError as e:
+        results.put(e)
+        return
+    start = perf_counter()
+    db_handler = standby.promote(timeout)[0]
+    results.put((applied, perf_counter() - start, db_handler.buffer))
+
+
+def run_failover_benchmark(directory, cycles, synchronous=False, seed=0, transaction_size=3, start_prob=0.7,
+                           write_prob=0.5, rollback_prob=0.2, timeout=5, segment_size=None):
+    """
+    Run a primary with a standby in a second process, then compare promoting the standby with recovering
+    the primary after its crash at max_cycles.
+    The primary's files are kept in directory/primary, the standby's in directory/standby.
+    Returns a FailoverBenchmarkResult; consistent tells whether the promoted standby and the recovered
+    primary hold the same database.
+    Raises ReplicationError if the standby stopped replicating.
+    """
+    primary_storage = FileStorage(os.path.join(directory, "primary"))
+    context = multiprocessing.get_context()
+    ports, results = context.Queue(), context.Queue()
+    standby_process = context.Process(target=_standby_process, daemon=True,
+                                      args=(os.path.join(directory, "standby"), segment_size, timeout, ports,
+                                            results))
+    standby_process.start()
+    try:
+        modules = initialize_modules(timeout, segment_size=segment_size, storage=primary_storage)
+        shipper = LogShipper(modules[1], connect(("127.0.0.1", ports.get(timeout=30))), synchronous=synchronous)
+        shipper.attach()
+        random.seed(seed)
+        start = perf_counter()
+        with redirect_stdout(io.StringIO()):  # The loop prints the final database state
+            stats = simulation_loop(*modules, cycles, transaction_size, start_prob, write_prob, rollback_prob,
+                                    cycle_delay=0)
+        elapsed = perf_counter() - start
+        shipper.close()
+        result = results.get(timeout=60)
+        if isinstance(result, ReplicationError):
+            raise result
+        applied, promotion_seconds, standby_buffer = result
+    finally:
+        standby_process.join(timeout=10)
+
+    recovery_start = perf_counter()
+    recovered_buffer = initialize_modules(timeout, segment_size=segment_size, storage=primary_storage)[0].buffer
+    recovery_seconds = perf_counter() - recovery_start
+
+    lags = sorted(shipper.lag_samples) or [0.0]
+    return FailoverBenchmarkResult(
+        cycles, synchronous, stats["committed"], stats["committed"] / elapsed if elapsed else 0.0,
+        mean(lags) * 1000, lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, lags[-1] * 1000, applied,
+        promotion_seconds * 1000, recovery_seconds * 1000, standby_buffer == recovered_buffer)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Ship the WAL to a standby process and benchmark replication lag and failover time."
+    )
+    parser.add_argument("--cycles", type=int, nargs="+", default=[1000, 4000],
+                        help="Cycle counts of the primary's runs (default: 1000 4000).")
+    parser.add_argument("--mode", nargs="+", choices=["async", "sync"], default=["async", "sync"],
+                        help="Shipping modes to benchmark (default: async sync).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the workload (default: 0).")
+    parser.add_argument("--wal-segment-size", type=int, metavar="BYTES",
+                        help="Run with a segmented WAL of this segment size (default: a single log file).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    set_hot_path_logging(False)
+
+    print(f"{'cycles':>8}{'mode':>7}{'commits':>9}{'commits/s':>11}{'lag ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'shipped':>9}{'promote ms':>12}{'recover ms':>12}{'consistent':>12}")
+    inconsistent = False
+    for cycle_count in args.cycles:
+        for mode in args.mode:
+            with tempfile.TemporaryDirectory(prefix="adbsim-replication-") as run_directory:
+                row = run_failover_benchmark(run_directory, cycle_count, synchronous=mode == "sync", seed=args.seed,
+                                             segment_size=args.wal_segment_size)
+            inconsistent = inconsistent or not row.consistent
+            print(f"{row.cycles:>8}{mode:>7}{row.committed:>9}{row.commits_per_second:>11.0f}"
+                  f"{row.lag_mean_ms:>9.3f}{row.lag_p99_ms:>9.3f}{row.lag_max_ms:>9.3f}{row.shipped_entries:>9}"
+                  f"{row.promotion_ms:>12.2f}{row.recovery_ms:>12.2f}{str(row.consistent):>12}")
+    raise SystemExit(1 if inconsistent else 0)
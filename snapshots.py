@@ -0,0 +1,157 @@
+from bisect import bisect_right
+from logging_config import get_logger
+from storage import FileStorage
+
+
+class SnapshotCatalog:
+    def __init__(self, db_file, keep=4, storage=None):
+        """
+        Initialize the SnapshotCatalog, the checkpoint snapshots and cycle marks used for point-in-time
+        recovery (see RecoveryManager.recover_to).
+        A snapshot <db_file>.ckpt.<lsn> is a copy of the database taken at a checkpoint: it holds the effect of
+        every log entry before <lsn>, committed or not. <db_file>.snapshots lists the snapshots with the first
+        LSN of the oldest transaction active when each was taken, plus the LSN of the last entry written by
+        the end of each cycle of each run. Every run of the simulation counts its cycles from 1, so the marks
+        are kept per run: a run is one use of a loaded catalog, numbered from 1. The base snapshot
+        <db_file>.base is the database as it was when snapshots were first enabled; it is never deleted, so
+        points before the oldest checkpoint snapshot still have a starting image.
+        - db_file: Path of the database file the snapshots are named after.
+        - keep: Number of snapshots kept; older ones are deleted.
+        - storage: Storage holding the snapshots and the catalog; defaults to the local filesystem.
+        """
+        self.db_file = db_file
+        self.storage = storage or FileStorage()
+        self.catalog_file = db_file + ".snapshots"
+        self.keep = keep
+        self.snapshots = []  # [(lsn, first LSN of the oldest transaction active at the snapshot)], oldest first
+        self.base_lsn = None  # LSN of the base snapshot, None until it is taken
+        self.cycles = {}  # {run: sorted cycle numbers with a mark}
+        self.cycle_lsns = {}  # {run: LSN of the last entry written by the end of the matching cycle}
+        self.run = 1  # Run whose cycles are marked from now on
+        self.logger = get_logger(self.__class__.__name__)
+
+    def snapshot_path(self, lsn):
+        return f"{self.db_file}.ckpt.{lsn}"
+
+    @property
+    def base_path(self):
+        return self.db_file + ".base"
+
+    def load(self):
+        """Load the catalog; malformed lines and snapshots whose file is missing are ignored."""
+        self.snapshots, self.cycles, self.cycle_lsns = [], {}, {}
+        self.base_lsn = None
+        self.run = 1
+        if not self.storage.exists(self.catalog_file):
+            return
+        with self.storage.open(self.catalog_file, "r") as f:
+            for line in f:
+                parts = line.strip().split(",")
+                try:
+                    if parts[0] == "snapshot" and self.storage.exists(self.snapshot_path(int(parts[1]))):
+                        self.snapshots.append((int(parts[1]), int(parts[2])))
+                    elif parts[0] == "base" and self.storage.exists(self.base_path):
+                        self.base_lsn = int(parts[1])
+                    elif parts[0] == "cycle":
+                        self._add_cycle(int(parts[1]), int(parts[2]), int(parts[3]))
+                except (IndexError, ValueError):
+                    continue
+        self.snapshots.sort()
+        self.run = max(self.cycles, default=0) + 1
+
+    def take_base(self, buffer, lsn):
+        """
+        Save the base snapshot, taken when no transaction is active.
+        - lsn: LSN of the next log entry; the buffer holds the effect of every entry before it.
+        """
+        self._write_buffer(self.base_path, buffer)
+        self.base_lsn = lsn
+        with self.storage.open(self.catalog_file, "a") as f:
+            f.write(f"base,{lsn}\n")
+        self.logger.info("Took base database snapshot at LSN %s.", lsn)
+
+    def take(self, buffer, lsn, min_lsn):
+        """
+        Save a snapshot of the database buffer, deleting the oldest snapshots beyond `keep`.
+        - lsn: LSN of the next log entry; the buffer holds the effect of every entry before it.
+        - min_lsn: First LSN of the oldest active transaction (lsn if there is none).
+        """
+        self._write_buffer(self.snapshot_path(lsn), buffer)
+        self.snapshots = [snapshot for snapshot in self.snapshots if snapshot[0] != lsn] + [(lsn, min_lsn)]
+        if len(self.snapshots) > self.keep:
+            for old_lsn, _ in self.snapshots[:-self.keep]:
+                self.storage.remove(self.snapshot_path(old_lsn))
+            self.snapshots = self.snapshots[-self.keep:]
+            self._write_catalog()
+        else:
+            with self.storage.open(self.catalog_file, "a") as f:
+                f.write(f"snapshot,{lsn},{min_lsn}\n")
+        self.logger.info("Took database snapshot at LSN %s.", lsn)
+
+    def mark_cycle(self, cycle, lsn):
+        """
+        Record that the entries up to LSN lsn were written by the end of a cycle of the current run. Only
+        changes are written: a cycle without log entries shares the mark of an earlier cycle. A cycle number at
+        or below the last one marked (the cycle count started again without reloading the catalog) starts a
+        new run; the marks of earlier runs are kept.
+        """
+        cycles = self.cycles.get(self.run)
+        if cycles and cycle <= cycles[-1]:
+            self.run += 1
+        elif cycles and self.cycle_lsns[self.run][-1] == lsn:
+            return
+        self._add_cycle(self.run, cycle, lsn)
+        with self.storage.open(self.catalog_file, "a") as f:
+            f.write(f"cycle,{self.run},{cycle},{lsn}\n")
+
+    def cycle_end(self, cycle, run=None):
+        """
+        Return the LSN of the last entry written by the end of a cycle, or None if the cycle is unknown.
+        - run: Run the cycle belongs to; defaults to the latest run with marks.
+        """
+        if run is None:
+            run = max(self.cycles, default=None)
+        position = bisect_right(self.cycles.get(run, []), cycle) - 1
+        return self.cycle_lsns[run][position] if position >= 0 else None
+
+    def nearest(self, lsn):
+        """
+        Return (snapshot LSN, min LSN) of the newest snapshot holding no entry after the given LSN, falling
+        back to the base snapshot, or None if there is none.
+        """
+        usable = [snapshot for snapshot in self.snapshots if snapshot[0] <= lsn + 1]
+        if usable:
+            return usable[-1]
+        if self.base_lsn is not None and self.base_lsn <= lsn + 1:
+            return self.base_lsn, self.base_lsn
+        return None
+
+    def read(self, lsn):
+        """Return the database buffer saved in the snapshot at the given LSN (checkpoint or base snapshot)."""
+        path = self.snapshot_path(lsn)
+        if lsn == self.base_lsn and lsn not in (snapshot[0] for snapshot in self.snapshots):
+            path = self.base_path
+        with self.storage.open(path, "r") as f:
+            return list(map(int, f.readline().strip().split(",")))
+
+    def _write_buffer(self, path, buffer):
+        """Write a database buffer to a snapshot file atomically."""
+        temp_file = path + ".tmp"
+        with self.storage.open(temp_file, "w", encoding="utf-8") as f:
+            f.write(",".join(map(str, buffer)) + "\n")
+        self.storage.replace(temp_file, path)
+
+    def _add_cycle(self, run, cycle, lsn):
+        self.cycles.setdefault(run, []).append(cycle)
+        self.cycle_lsns.setdefault(run, []).append(lsn)
+
+    def _write_catalog(self):
+        """Rewrite the catalog atomically."""
+        lines = [f"base,{self.base_lsn}\n"] if self.base_lsn is not None else []
+        lines.extend(f"snapshot,{lsn},{min_lsn}\n" for lsn, min_lsn in self.snapshots)
+        lines.extend(f"cycle,{run},{cycle},{lsn}\n" for run in sorted(self.cycles)
+                     for cycle, lsn in zip(self.cycles[run], self.cycle_lsns[run]))
+        temp_file = self.catalog_file + ".tmp"
+        with self.storage.open(temp_file, "w") as f:
+            f.writelines(lines)
+        self.storage.replace(temp_file, self.catalog_file)
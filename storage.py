@@ -0,0 +1,233 @@
+from logging_config import get_logger
+from time import perf_counter, sleep
+import io
+import os
+
+# Backends make_storage can create.
+STORAGE_BACKENDS = ("file", "memory")
+
+# fdatasync skips the metadata update when only file contents changed, which is the case for appends
+# into a preallocated file. Not every platform has it.
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+class FileStorage:
+    def __init__(self, root=None):
+        """
+        Initialize the FileStorage, which keeps the simulation's files on the local filesystem.
+        Every component reaches its files through a storage object, so the same code runs on real files,
+        in memory (MemoryStorage) or on a simulated slow disk (LatencyStorage).
+        - root: Directory relative file names are resolved against, created if missing; None uses the current
+          directory.
+        """
+        self.root = root
+        if root:
+            os.makedirs(root, exist_ok=True)
+        self.logger = get_logger(self.__class__.__name__)
+
+    def local_path(self, name):
+        """Return the filesystem path of a file (None for storages that are not backed by files)."""
+        return os.path.join(self.root, name) if self.root else name
+
+    def exists(self, name):
+        return os.path.exists(self.local_path(name))
+
+    def size(self, name):
+        return os.path.getsize(self.local_path(name))
+
+    def open(self, name, mode="r", encoding=None):
+        """Open a file like the built-in open(); binary modes return binary file objects."""
+        return open(self.local_path(name), mode, encoding=encoding)
+
+    def replace(self, source, destination):
+        """Rename source to destination, atomically replacing destination if it exists."""
+        os.replace(self.local_path(source), self.local_path(destination))
+
+    def remove(self, name):
+        os.remove(self.local_path(name))
+
+    def sync(self, f, data_only=False):
+        """
+        Force what was written through an open file object to stable storage.
+        - data_only: Skip the metadata update where the platform allows it (fdatasync).
+        """
+        f.flush()
+        (_datasync if data_only else os.fsync)(f.fileno())
+
+    def allocate(self, f, size):
+        """Reserve size bytes for an open, empty binary file; the space reads as zero bytes."""
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+                return
+            except OSError:
+                pass  # Not supported by this filesystem
+        f.truncate(size)
+
+
+class _MemoryFile(io.RawIOBase):
+    """Unbuffered binary file object over a bytearray held by a MemoryStorage."""
+
+    def __init__(self, data, readable, writable, append):
+        super().__init__()
+        self._data = data
+        self._readable = readable
+        self._writable = writable
+        self._append = append
+        self._position = len(data) if append else 0
+
+    def readable(self):
+        return self._readable
+
+    def writable(self):
+        return self._writable
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._data[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def write(self, data):
+        if not self._writable:
+            raise io.UnsupportedOperation("not writable")
+        if self._append:
+            self._position = len(self._data)
+        elif self._position > len(self._data):
+            self._data.extend(bytes(self._position - len(self._data)))
+        size = len(data)
+        self._data[self._position:self._position + size] = data
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def truncate(self, size=None):
+        """Cut the file at size, or extend it with zero bytes up to size."""
+        size = self._position if size is None else size
+        if size < len(self._data):
+            del self._data[size:]
+        else:
+            self._data.extend(bytes(size - len(self._data)))
+        return size
+
+
+class MemoryStorage:
+    def __init__(self):
+        """
+        Initialize the MemoryStorage, which keeps every file as a bytearray in a dict.
+        Nothing touches the filesystem, so many simulations can run in one process side by side; syncs only
+        flush the file object. An open file keeps its contents after the name is replaced or removed, as on
+        a POSIX filesystem.
+        """
+        self.files = {}  # {normalized name: bytearray}
+        self.logger = get_logger(self.__class__.__name__)
+
+    def local_path(self, name):
+        return None
+
+    def exists(self, name):
+        return os.path.normpath(name) in self.files
+
+    def size(self, name):
+        return len(self._data(name))
+
+    def open(self, name, mode="r", encoding=None):
+        """Open a file like the built-in open() for the modes r, w, a and x, with optional b and +."""
+        key = os.path.normpath(name)
+        if "r" in mode:
+            data = self._data(name)
+        elif "x" in mode and key in self.files:
+            raise FileExistsError(f"File exists: {name!r}")
+        elif "a" in mode:
+            data = self.files.setdefault(key, bytearray())
+        else:
+            data = self.files[key] = bytearray()
+        raw = _MemoryFile(data, readable="r" in mode or "+" in mode, writable="r" not in mode or "+" in mode,
+                          append="a" in mode)
+        if "b" in mode:
+            return raw
+        if raw.readable() and raw.writable():
+            buffered = io.BufferedRandom(raw)
+        elif raw.readable():
+            buffered = io.BufferedReader(raw)
+        else:
+            buffered = io.BufferedWriter(raw)
+        return io.TextIOWrapper(buffered, encoding=encoding or "utf-8")
+
+    def replace(self, source, destination):
+        self.files[os.path.normpath(destination)] = self._data(source)
+        del self.files[os.path.normpath(source)]
+
+    def remove(self, name):
+        self._data(name)
+        del self.files[os.path.normpath(name)]
+
+    def sync(self, f, data_only=False):
+        f.flush()
+
+    def allocate(self, f, size):
+        f.truncate(size)
+
+    def _data(self, name):
+        try:
+            return self.files[os.path.normpath(name)]
+        except KeyError:
+            raise FileNotFoundError(f"No such file: {name!r}") from None
+
+
+class LatencyStorage:
+    def __init__(self, storage, sync_latency=0.005):
+        """
+        Initialize the LatencyStorage, which models a slow disk by delaying every sync of another storage.
+        Everything else is passed through, so the effect of fsync latency on commit throughput can be
+        measured without special hardware.
+        - storage: The storage holding the files (e.g. a MemoryStorage).
+        - sync_latency: Seconds every sync takes on top of the wrapped storage's own time.
+        """
+        self.storage = storage
+        self.sync_latency = sync_latency
+        self.sync_count = 0  # Number of syncs performed
+        self.sync_seconds = 0.0  # Total time spent in syncs, simulated latency included
+        self.logger = get_logger(self.__class__.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def sync(self, f, data_only=False):
+        start = perf_counter()
+        self.storage.sync(f, data_only=data_only)
+        if self.sync_latency:
+            sleep(self.sync_latency)
+        self.sync_count += 1
+        self.sync_seconds += perf_counter() - start
+
+
+def make_storage(backend="file", root=None, sync_latency=0.0):
+    """
+    Create the storage selected by configuration.
+    - backend: One of STORAGE_BACKENDS.
+    - root: Directory of a "file" storage (None for the current directory).
+    - sync_latency: If set, wrap the storage in a LatencyStorage adding this many seconds to every sync.
+    """
+    if backend == "file":
+        storage = FileStorage(root)
+    elif backend == "memory":
+        storage = MemoryStorage()
+    else:
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {STORAGE_BACKENDS}.")
+    return LatencyStorage(storage, sync_latency) if sync_latency else storage
@@ -0,0 +1,202 @@
+from logging_config import redirected_logging
+from main import initialize_modules, simulation_loop
+from storage import STORAGE_BACKENDS, LatencyStorage, make_storage
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import product
+from time import perf_counter
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+
+# Simulation parameters a sweep varies, in the order of main.py's positional arguments.
+SWEEP_PARAMETERS = ("cycles", "trans_size", "start_prob", "write_prob", "rollback_prob", "timeout")
+
+# Counters returned by simulation_loop, in the column order of the result table.
+STAT_COLUMNS = ("started", "committed", "rolled_back", "savepoint_rollbacks", "deadlock_aborts", "writes",
+                "blocked_writes", "active_at_end")
+
+RESULT_COLUMNS = SWEEP_PARAMETERS + ("sync_latency", "repeat", "seed") + STAT_COLUMNS + (
+    "log_entries", "syncs", "elapsed_seconds", "commits_per_second")
+
+
+def parameter_grid(cycles, trans_size, start_prob, write_prob, rollback_prob, timeout):
+    """
+    Build the cross product of the given parameter values as a list of dicts keyed by SWEEP_PARAMETERS.
+    Combinations main.py would reject (write_prob + rollback_prob above 1) are left out.
+    """
+    return [dict(zip(SWEEP_PARAMETERS, values))
+            for values in product(cycles, trans_size, start_prob, write_prob, rollback_prob, timeout)
+            if values[3] + values[4] <= 1]
+
+
+def run_point(point, seed, directory=None, log_level=logging.WARNING, segment_size=None, savepoint_interval=0,
+              storage="file", sync_latency=0.0):
+    """
+    Run one simulation in a directory of its own and return its result row.
+    Logging goes to a file in that directory while the run lasts, so runs never share the db, log or
+    adbsim.log files; the caller's logging configuration is restored afterwards.
+    - point: Dict with a value for every name in SWEEP_PARAMETERS.
+    - seed: Seed for the simulation's random choices.
+    - directory: Directory to keep the run's files in; a temporary directory (removed afterwards) if None.
+    - log_level: Minimum level written to the run's adbsim.log.
+    - segment_size: WAL segment size, or None for a single log file.
+    - savepoint_interval: Passed on to simulation_loop.
+    - storage: One of STORAGE_BACKENDS; with "memory" the run's files are kept in memory and directory is
+      ignored.
+    - sync_latency: Seconds added to every fsync to model a slow disk.
+    Returns a dict keyed by RESULT_COLUMNS (without "repeat", which run_sweep adds).
+    """
+    if directory is None and storage == "file":
+        with tempfile.TemporaryDirectory(prefix="adbsim-sweep-") as temp_dir:
+            return run_point(point, seed, temp_dir, log_level, segment_size, savepoint_interval, storage,
+                             sync_latency)
+
+    # The latency wrapper also counts the run's syncs when no latency is added
+    run_storage = LatencyStorage(make_storage(storage, root=directory), sync_latency)
+    # adbsim.log is closed before the directory is removed, and the caller's logging is restored afterwards
+    with redirected_logging("adbsim.log", level=log_level, storage=run_storage, hot_paths=log_level <= logging.INFO):
+        db_handler, recovery_manager, lock_manager, transaction_manager = initialize_modules(
+            point["timeout"], db_file="db", log_file="log", segment_size=segment_size, storage=run_storage)
+        random.seed(seed)
+        start = perf_counter()
+        with redirect_stdout(io.StringIO()):  # The loop prints the final database state
+            stats = simulation_loop(db_handler, recovery_manager, lock_manager, transaction_manager,
+                                    point["cycles"], point["trans_size"], point["start_prob"], point["write_prob"],
+                                    point["rollback_prob"], cycle_delay=0, savepoint_interval=savepoint_interval)
+        elapsed = perf_counter() - start
+
+    row = dict(point, sync_latency=sync_latency, seed=seed)
+    row.update((name, stats[name]) for name in STAT_COLUMNS)
+    row["log_entries"] = recovery_manager.next_lsn - 1
+    row["syncs"] = run_storage.sync_count
+    row["elapsed_seconds"] = elapsed
+    row["commits_per_second"] = stats["committed"] / elapsed if elapsed else 0.0
+    return row
+
+
+def run_sweep(points, repeats=1, seed=0, workers=None, keep_dir=None, **run_options):
+    """
+    Run every point of a parameter grid `repeats` times on a process pool.
+    Run i (counting points times repeats in order) uses seed + i, so a sweep is reproducible whatever the
+    number of workers.
+    - points: List of parameter dicts, e.g. from parameter_grid.
+    - workers: Number of worker processes (defaults to the number of CPUs); 0 runs everything in this
+      process, one run after the other (with storage="memory", no file is touched at all).
+    - keep_dir: Keep each run's files in keep_dir/run-<i> instead of a removed temporary directory.
+    - run_options: Passed on to run_point (log_level, segment_size, savepoint_interval, storage, sync_latency).
+    Returns the result rows in grid order.
+    """
+    runs = [(point, repeat) for point in points for repeat in range(repeats)]
+    directories = [os.path.join(keep_dir, f"run-{index:05d}") if keep_dir else None for index in range(len(runs))]
+    if workers == 0:
+        results = [run_point(point, seed + index, directories[index], **run_options)
+                   for index, (point, repeat) in enumerate(runs)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_point, point, seed + index, directories[index], **run_options)
+                       for index, (point, repeat) in enumerate(runs)]
+            results = [future.result() for future in futures]
+    rows = []
+    for (point, repeat), row in zip(runs, results):
+        row["repeat"] = repeat
+        rows.append({column: row[column] for column in RESULT_COLUMNS})
+    return rows
+
+
+def write_csv(rows, path):
+    """Write result rows to a CSV file with one column per entry of RESULT_COLUMNS."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json(rows, path):
+    """Write result rows to a JSON file as a list of objects."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Run the simulation over a grid of parameters in parallel and collect the results."
+    )
+    parser.add_argument("--cycles", type=int, nargs="+", default=[200], help="Values of cycles (default: 200).")
+    parser.add_argument("--trans-size", type=int, nargs="+", default=[3], help="Values of trans_size (default: 3).")
+    parser.add_argument("--start-prob", type=float, nargs="+", default=[0.7],
+                        help="Values of start_prob (default: 0.7).")
+    parser.add_argument("--write-prob", type=float, nargs="+", default=[0.5],
+                        help="Values of write_prob (default: 0.5).")
+    parser.add_argument("--rollback-prob", type=float, nargs="+", default=[0.2],
+                        help="Values of rollback_prob (default: 0.2).")
+    parser.add_argument("--timeout", type=int, nargs="+", default=[5], help="Values of timeout (default: 5).")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per grid point (default: 1).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first run (default: 0).")
+    parser.add_argument("--workers", type=int,
+                        help="Number of worker processes; 0 runs in this process (default: number of CPUs).")
+    parser.add_argument("--storage", default="file", choices=STORAGE_BACKENDS,
+                        help="Keep each run's files in a directory or in memory (default: file).")
+    parser.add_argument("--fsync-latency", type=float, nargs="+", default=[0.0], metavar="SECONDS",
+                        help="Values of the delay added to every fsync to model a slow disk (default: 0).")
+    parser.add_argument("--wal-segment-size", type=int, metavar="BYTES",
+                        help="Run with a segmented WAL of this segment size (default: a single log file).")
+    parser.add_argument("--savepoint-interval", type=int, default=0, metavar="N",
+                        help="Take a savepoint after every N writes of a transaction (default: 0, none).")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                        help="Minimum level written to each run's adbsim.log (default: WARNING).")
+    parser.add_argument("--keep-dir", metavar="DIR", help="Keep each run's files in DIR/run-<n>.")
+    parser.add_argument("--output-csv", metavar="CSV", help="Write the result table to this CSV file.")
+    parser.add_argument("--output-json", metavar="JSON", help="Write the result table to this JSON file.")
+
+    parsed_args = parser.parse_args()
+    for name in ("start_prob", "write_prob", "rollback_prob"):
+        if not all(0 <= value <= 1 for value in getattr(parsed_args, name)):
+            parser.error(f"{name} values must be between 0 and 1.")
+    if parsed_args.repeats < 1:
+        parser.error("repeats must be at least 1.")
+    if parsed_args.workers is not None and parsed_args.workers < 0:
+        parser.error("workers must not be negative.")
+    if any(value < 0 for value in parsed_args.fsync_latency):
+        parser.error("fsync_latency values must not be negative.")
+    if parsed_args.keep_dir and parsed_args.storage != "file":
+        parser.error("--keep-dir requires --storage file.")
+    return parsed_args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    grid = parameter_grid(args.cycles, args.trans_size, args.start_prob, args.write_prob, args.rollback_prob,
+                          args.timeout)
+    if not grid:
+        raise SystemExit("No valid parameter combinations (write_prob + rollback_prob must not exceed 1).")
+
+    sweep_start = perf_counter()
+    results = []
+    for latency in args.fsync_latency:
+        # Every latency replays the same seeds, so the workloads only differ in the simulated disk
+        latency_dir = os.path.join(args.keep_dir, f"fsync-{latency:g}") if args.keep_dir else None
+        results.extend(run_sweep(grid, repeats=args.repeats, seed=args.seed, workers=args.workers,
+                                 keep_dir=latency_dir, log_level=getattr(logging, args.log_level),
+                                 segment_size=args.wal_segment_size, savepoint_interval=args.savepoint_interval,
+                                 storage=args.storage, sync_latency=latency))
+    print(f"{len(results)} runs of {len(grid) * len(args.fsync_latency)} configurations in "
+          f"{perf_counter() - sweep_start:.2f} s")
+
+    print(f"{'cycles':>7}{'size':>6}{'start':>7}{'write':>7}{'rollb':>7}{'tmo':>5}{'fsync ms':>10}"
+          f"{'commits':>9}{'rollbk':>8}{'aborts':>8}{'syncs':>7}{'commits/s':>11}")
+    for result in results:
+        print(f"{result['cycles']:>7}{result['trans_size']:>6}{result['start_prob']:>7.2f}{result['write_prob']:>7.2f}"
+              f"{result['rollback_prob']:>7.2f}{result['timeout']:>5}{result['sync_latency'] * 1000:>10.2f}"
+              f"{result['committed']:>9}{result['rolled_back']:>8}{result['deadlock_aborts']:>8}{result['syncs']:>7}"
+              f"{result['commits_per_second']:>11.0f}")
+
+    if args.output_csv:
+        write_csv(results, args.output_csv)
+    if args.output_json:
+        write_json(results, args.output_json)
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from crash_injection import CRASH_POINTS, CommitOracle, CrashInjector, SimulatedCrash, run_crash_trial
+from db_handler import DBHandler
+from recovery_manager import RecoveryManager
+
+
+class TestCrashInjection(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def test_recovery_matches_oracle_at_every_crash_point(self):
+        for point in CRASH_POINTS:
+            for crash_after in (1, 3, 17):
+                with self.subTest(point=point, crash_after=crash_after):
+                    result = run_crash_trial(self.directory, point, crash_after, seed=crash_after, cycles=60)
+                    self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_repeated_crashes_on_the_same_log(self):
+        for seed in range(6):
+            result = run_crash_trial(self.directory, "log_append", 5 + seed, seed=seed, cycles=40)
+            self.assertTrue(result.crashed)
+            self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_recovery_with_savepoints(self):
+        for point in CRASH_POINTS:
+            for crash_after in (2, 11):
+                with self.subTest(point=point, crash_after=crash_after):
+                    result = run_crash_trial(self.directory, point, crash_after, seed=crash_after, cycles=80,
+                                             transaction_size=6, savepoint_interval=2)
+                    self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_recovery_with_deferred_writes(self):
+        for point in CRASH_POINTS:
+            for crash_after in (2, 11):
+                with self.subTest(point=point, crash_after=crash_after):
+                    result = run_crash_trial(self.directory, point, crash_after, seed=crash_after, cycles=80,
+                                             transaction_size=6, savepoint_interval=2, deferred=True)
+                    self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_torn_log_entry_is_left_behind(self):
+        db_handler = DBHandler(db_file=os.path.join(self.directory, "db"))
+        recovery_manager = RecoveryManager(db_handler, log_file=os.path.join(self.directory, "log"))
+        CrashInjector("log_append", crash_after=2).attach(db_handler, recovery_manager)
+        recovery_manager.write_log(1, operation="S")
+        with self.assertRaises(SimulatedCrash):
+            recovery_manager.write_log(1, data_id=0, old_value=0, operation="F")
+        with open(recovery_manager.log_file, "r") as f:
+            self.assertEqual(f.read(), "1,S\n1,0,")
+
+    def test_oracle_ignores_uncommitted_writes(self):
+        oracle = CommitOracle([0] * 32)
+        oracle.observe(1, 0, 0, "F")
+        oracle.observe(2, 1, 0, "F")
+        oracle.observe(1, None, None, "C")
+        oracle.observe(2, None, None, "R")
+        self.assertEqual(oracle.committed, [1])
+        self.assertEqual(oracle.mismatches([1] + [0] * 31), [])
+        self.assertEqual(oracle.mismatches([1, 1] + [0] * 30), [1])
+        oracle.observe(3, None, None, "M", items=((1, 0), (2, 0)))
+        self.assertEqual(oracle.mismatches([1, 1, 1] + [0] * 29), [])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
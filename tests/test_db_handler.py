@@ -44,6 +44,17 @@ class TestDBHandler(unittest.TestCase):
             content = f.readline().strip()
         self.assertEqual(content, "1," + ",".join(["0"] * 31))
 
+    def test_truncated_database_file(self):
+        """A database file with too few values is treated as corrupted."""
+        with open(self.db_handler.db_file, "w") as f:
+            f.write("1,1,1")
+        self.db_handler.read_database()
+        self.assertEqual(self.db_handler.buffer, [0] * 32)
+
+    def test_write_database_leaves_no_temporary_file(self):
+        self.db_handler.write_database()
+        self.assertFalse(os.path.exists(self.db_handler.db_file + ".tmp"))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -40,6 +40,25 @@ class TestLockManager(unittest.TestCase):
         self.assertNotIn(1, self.lock_manager.transaction_wait_cycles)
         self.assertNotIn(2, self.lock_manager.transaction_wait_cycles)
 
+    def test_release_withdraws_pending_requests(self):
+        self.lock_manager.acquire_lock(1, "data1", "exclusive")
+        self.assertFalse(self.lock_manager.acquire_lock(2, "data1", "exclusive"))
+        self.assertFalse(self.lock_manager.acquire_lock(2, "data1", "exclusive"))  # Retry is not queued twice
+        self.assertEqual(self.lock_manager.lock_queue["data1"], [(2, "exclusive")])
+        self.lock_manager.acquire_lock(2, "data2", "exclusive")
+        self.lock_manager.release_locks(2)
+        self.assertEqual(self.lock_manager.lock_queue["data1"], [])
+        self.lock_manager.increment_cycle()  # Must not fail on the finished transaction
+
+    def test_release_single_lock(self):
+        self.lock_manager.acquire_lock(1, "data1", "exclusive")
+        self.lock_manager.acquire_lock(1, "data2", "exclusive")
+        self.assertFalse(self.lock_manager.acquire_lock(2, "data2", "exclusive"))
+        self.assertTrue(self.lock_manager.release_lock(1, "data2"))
+        self.assertEqual(self.lock_manager.locks["data2"], ("exclusive", {2}))
+        self.assertEqual(self.lock_manager.locked_data_by_transaction[1], {"data1"})
+        self.assertFalse(self.lock_manager.release_lock(1, "data2"))
+
 
 if __name__ == "__main__":
     unittest.main()
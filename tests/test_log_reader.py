@@ -0,0 +1,67 @@
+import os
+import unittest
+from log_reader import LogIndex, LogReader, LogRecord, parse_record
+
+
+class TestLogReader(unittest.TestCase):
+    def setUp(self):
+        self.log_file = "test_reader_log"
+        self.index_file = "test_reader_log.idx"
+        self.lines = ["1,S", "1,4,0,F", "", "2,S", "garbage", "2,7,1,F", "1,C", "2,R"]
+        with open(self.log_file, "w") as f:
+            f.write("".join(line + "\n" for line in self.lines))
+
+    def test_parse_record(self):
+        self.assertEqual(parse_record(3, "5,2,1,F\n"), LogRecord(3, 5, "F", 2, 1))
+        self.assertEqual(parse_record(4, "5,C"), LogRecord(4, 5, "C", None, None))
+        self.assertEqual(parse_record(7, "5,2,0,U,3"), LogRecord(7, 5, "U", 2, 0, 3))
+        self.assertEqual(parse_record(8, "5,R,7"), LogRecord(8, 5, "R", None, None, 7))
+        self.assertEqual(parse_record(9, "5,M,2:1,7:0"), LogRecord(9, 5, "M", None, None, None, ((2, 1), (7, 0))))
+        self.assertIsNone(parse_record(9, "5,M,2:1,7"))
+        self.assertIsNone(parse_record(5, "5,x,1,F"))
+        self.assertIsNone(parse_record(9, "5,C,x"))
+        self.assertIsNone(parse_record(6, ""))
+
+    def test_streaming_matches_file_contents(self):
+        for chunk_size in (1, 3, 64 * 1024):
+            reader = LogReader(self.log_file, chunk_size=chunk_size)
+            records = [record for _, record in reader.records()]
+            self.assertEqual([record.lsn for record in records], [1, 2, 4, 6, 7, 8])
+            self.assertEqual(records[3], LogRecord(6, 2, "F", 7, 1))
+
+    def test_reverse_streaming(self):
+        end_offset = os.path.getsize(self.log_file)
+        for chunk_size in (1, 5, 64 * 1024):
+            reader = LogReader(self.log_file, chunk_size=chunk_size)
+            forward = list(reader.records())
+            self.assertEqual(list(reader.reverse_records(end_offset, len(self.lines))), forward[::-1])
+
+    def test_torn_last_line_is_not_returned(self):
+        with open(self.log_file, "a") as f:
+            f.write("3,1,0")
+        records = [record for _, record in LogReader(self.log_file).records()]
+        self.assertEqual(records[-1].lsn, 8)
+
+    def test_index_entries(self):
+        index = LogIndex(self.index_file, interval=2)
+        offset = 0
+        for lsn, line in enumerate(self.lines, start=1):
+            record = parse_record(lsn, line)
+            if record:
+                index.add(lsn, offset, record.transaction_id, record.operation)
+            offset += len(line) + 1
+        reloaded = LogIndex(self.index_file, interval=2)
+        reloaded.load()
+        self.assertEqual(reloaded.lsns, [1, 7])  # LSNs 3 and 5 are not valid entries
+        self.assertEqual(reloaded.locate(6), (1, 0))
+        self.assertEqual(reloaded.locate(8), (7, index.offsets[-1]))
+        self.assertEqual(reloaded.transaction_starts, {1: (1, 0), 2: (4, 13)})
+
+    def tearDown(self):
+        for file in [self.log_file, self.index_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import logging
+import os
+import unittest
+from logging_config import (setup_logging, shutdown_logging, get_logger, get_hot_path_logger, set_hot_path_logging,
+                            hot_path_logging_enabled)
+
+
+class TestLoggingConfig(unittest.TestCase):
+    def setUp(self):
+        self.log_file = "test_logging_config.log"
+        shutdown_logging()
+
+    def _read_log(self):
+        with open(self.log_file, "r") as f:
+            return f.read()
+
+    def test_setup_is_idempotent(self):
+        root_logger = logging.getLogger()
+        handlers_before = len(root_logger.handlers)
+        setup_logging(log_file=self.log_file)
+        setup_logging(log_file=self.log_file)
+        self.assertEqual(len(root_logger.handlers), handlers_before + 1)
+
+        get_logger("TestComponent").info("written once")
+        shutdown_logging()
+        self.assertEqual(self._read_log().count("written once"), 1)
+
+    def test_hot_path_switch(self):
+        setup_logging(log_file=self.log_file)
+        logger = get_logger("TestHotComponent")
+        hot_logger = get_hot_path_logger("TestHotComponent")
+
+        set_hot_path_logging(False, "TestHotComponent")
+        self.assertFalse(hot_path_logging_enabled("TestHotComponent"))
+        self.assertFalse(hot_logger.isEnabledFor(logging.INFO))
+        hot_logger.info("hot message %s", 1)
+        logger.info("regular message")
+
+        set_hot_path_logging(True)
+        self.assertTrue(hot_logger.isEnabledFor(logging.INFO))
+        hot_logger.info("hot message %s", 2)
+        shutdown_logging()
+
+        content = self._read_log()
+        self.assertNotIn("hot message 1", content)
+        self.assertIn("hot message 2", content)
+        self.assertIn("regular message", content)
+
+    def test_hot_path_default_applies_to_new_loggers(self):
+        set_hot_path_logging(False)
+        try:
+            self.assertFalse(get_hot_path_logger("TestLateComponent").isEnabledFor(logging.CRITICAL))
+        finally:
+            set_hot_path_logging(True)
+
+    def test_queue_handler_writes_in_background(self):
+        setup_logging(log_file=self.log_file, use_queue=True)
+        values = [1, 2]
+        get_logger("TestQueueComponent").info("queued %s", values)
+        values.append(3)  # Arguments are captured when the call is made
+        shutdown_logging()
+        self.assertIn("queued [1, 2]", self._read_log())
+
+    def tearDown(self):
+        shutdown_logging()
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
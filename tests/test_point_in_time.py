@@ -0,0 +1,173 @@
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from db_handler import DBHandler
+from main import initialize_modules, simulation_loop
+from point_in_time import recover_point
+from snapshots import SnapshotCatalog
+from storage import FileStorage, MemoryStorage
+
+
+def committed_state(records, lsn):
+    """
+    Database as of an LSN, computed independently of recovery: under strict 2PL, every data ID holds the
+    after-image of its last write ('F' or 'U') by a transaction that committed by then.
+    """
+    commits = {record.transaction_id: record.lsn for record in records if record.operation == "C"}
+    buffer = [0] * 32
+    for record in records:
+        if record.lsn > lsn:
+            break
+        if record.operation in ("F", "U") and commits.get(record.transaction_id, lsn + 1) <= lsn:
+            buffer[record.data_id] = 1 if record.old_value == 0 else 0
+    return buffer
+
+
+class TestPointInTimeRecovery(unittest.TestCase):
+    def run_simulation(self, modules, cycles, seed):
+        random.seed(seed)
+        with redirect_stdout(StringIO()):
+            return simulation_loop(*modules, cycles, 3, 0.7, 0.5, 0.2, cycle_delay=0, savepoint_interval=2)
+
+    def test_matches_committed_state(self):
+        modules = initialize_modules(5, segment_size=1024, storage=MemoryStorage(), archive="zlib", snapshots=3)
+        recovery_manager = modules[1]
+        self.run_simulation(modules, 200, seed=8)
+        recovery_manager.wal.wait_for_archive()
+        self.assertEqual(len(recovery_manager.snapshots.snapshots), 3)
+        self.assertGreater(recovery_manager.wal.first_lsn, recovery_manager.snapshots.snapshots[0][0])
+
+        records = list(recovery_manager.iter_history())
+        self.assertEqual([record.lsn for record in records], list(range(1, recovery_manager.next_lsn)))
+        for lsn in list(range(0, len(records), 23)) + [len(records)]:
+            with self.subTest(lsn=lsn):
+                self.assertEqual(recovery_manager.recover_to(lsn=lsn), (committed_state(records, lsn), lsn))
+
+    def test_cycle_and_transaction_points(self):
+        modules = initialize_modules(5, storage=MemoryStorage(), snapshots=2)
+        recovery_manager = modules[1]
+        self.run_simulation(modules, 60, seed=3)
+        cycle_end = recovery_manager.snapshots.cycle_end(30)
+        self.assertEqual(recovery_manager.recover_to(cycle=30), recovery_manager.recover_to(lsn=cycle_end))
+        self.assertEqual(recovery_manager.snapshots.cycle_end(60), recovery_manager.next_lsn - 1)
+
+        commit = next(record for record in recovery_manager.iter_log() if record.operation == "C")
+        self.assertEqual(recovery_manager.recover_to(transaction_id=commit.transaction_id)[1], commit.lsn)
+        with self.assertRaises(ValueError):
+            recovery_manager.recover_to(cycle=0)
+        with self.assertRaises(ValueError):
+            recovery_manager.recover_to(lsn=recovery_manager.next_lsn)
+        with self.assertRaises(ValueError):
+            recovery_manager.recover_to(lsn=1, cycle=1)
+
+    def test_cycles_before_a_restart_stay_reachable(self):
+        storage = MemoryStorage()
+        modules = initialize_modules(5, storage=storage, snapshots=2)
+        self.run_simulation(modules, 40, seed=7)
+        first_run_end = modules[1].snapshots.cycle_end(20)
+        restarted = initialize_modules(5, storage=storage, snapshots=2)
+        self.run_simulation(restarted, 40, seed=8)
+
+        recovery_manager = restarted[1]
+        self.assertEqual(recovery_manager.snapshots.cycle_end(20, run=1), first_run_end)
+        self.assertGreater(recovery_manager.snapshots.cycle_end(20), first_run_end)
+        self.assertEqual(recovery_manager.recover_to(cycle=20, run=1), recovery_manager.recover_to(lsn=first_run_end))
+
+    def test_released_entries_are_reported(self):
+        modules = initialize_modules(5, segment_size=1024, storage=MemoryStorage(), snapshots=1)
+        self.run_simulation(modules, 150, seed=2)
+        with self.assertRaises(ValueError):
+            modules[1].recover_to(lsn=5)
+
+    def test_crash_recovery_matches_last_point(self):
+        storage = MemoryStorage()
+        modules = initialize_modules(5, storage=storage, snapshots=2)
+        self.run_simulation(modules, 80, seed=5)
+        crash_lsn = modules[1].next_lsn - 1
+        restarted = initialize_modules(5, storage=storage, snapshots=2)
+        self.assertEqual(restarted[1].recover_to(lsn=crash_lsn)[0], restarted[0].buffer)
+
+    def test_base_snapshot_of_a_database_that_did_not_start_empty(self):
+        storage = MemoryStorage()
+        self.run_simulation(initialize_modules(5, storage=storage), 30, seed=4)  # No snapshots yet
+        modules = initialize_modules(5, storage=storage, snapshots=2)
+        recovery_manager = modules[1]
+        base_lsn, base = recovery_manager.snapshots.base_lsn, list(modules[0].buffer)
+        self.assertEqual(recovery_manager.recover_to(lsn=base_lsn - 1), (base, base_lsn - 1))
+        with self.assertRaises(ValueError):
+            recovery_manager.recover_to(lsn=base_lsn - 2)
+
+        self.run_simulation(modules, 60, seed=9)
+        self.assertEqual(recovery_manager.recover_to(lsn=base_lsn - 1)[0], base)
+        reloaded = SnapshotCatalog("db", storage=storage)
+        reloaded.load()
+        self.assertEqual(reloaded.base_lsn, base_lsn)
+
+    def test_recover_point_leaves_files_alone(self):
+        with tempfile.TemporaryDirectory() as directory:
+            modules = initialize_modules(5, storage=FileStorage(directory), snapshots=2)
+            self.run_simulation(modules, 40, seed=6)
+            with open(os.path.join(directory, "log"), "rb") as f:
+                log_before = f.read()
+            buffer, lsn = recover_point(directory, cycle=20, output="db.cycle20")
+            with open(os.path.join(directory, "log"), "rb") as f:
+                self.assertEqual(f.read(), log_before)
+            restored = DBHandler(db_file="db.cycle20", storage=FileStorage(directory))
+            restored.read_database()
+            self.assertEqual(restored.buffer, buffer)
+            self.assertEqual(lsn, modules[1].snapshots.cycle_end(20))
+
+
+    def test_recover_point_keeps_a_torn_tail(self):
+        with tempfile.TemporaryDirectory() as directory:
+            modules = initialize_modules(5, storage=FileStorage(directory), snapshots=2)
+            self.run_simulation(modules, 40, seed=6)
+            with open(os.path.join(directory, "log"), "a") as f:
+                f.write("99,S\n99,3,")  # An entry the index does not know yet, then a torn one
+            files_before = {}
+            for name in ("log", "log.idx"):
+                with open(os.path.join(directory, name), "rb") as f:
+                    files_before[name] = f.read()
+            _, lsn = recover_point(directory, lsn=20)
+            self.assertEqual(lsn, 20)
+            for name, data in files_before.items():
+                with open(os.path.join(directory, name), "rb") as f:
+                    self.assertEqual(f.read(), data, name)
+
+class TestSnapshotCatalog(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+
+    def test_old_snapshots_are_deleted(self):
+        catalog = SnapshotCatalog("db", keep=2, storage=self.storage)
+        for lsn in (10, 20, 30):
+            catalog.take([lsn % 2] * 32, lsn, lsn - 5)
+        self.assertEqual(catalog.snapshots, [(20, 15), (30, 25)])
+        self.assertFalse(self.storage.exists("db.ckpt.10"))
+        self.assertEqual(catalog.nearest(28), (20, 15))
+        self.assertEqual(catalog.nearest(29), (30, 25))  # Holds the entries before LSN 30
+        self.assertIsNone(catalog.nearest(18))
+        reloaded = SnapshotCatalog("db", storage=self.storage)
+        reloaded.load()
+        self.assertEqual(reloaded.snapshots, catalog.snapshots)
+        self.assertEqual(reloaded.read(30), [0] * 32)
+
+    def test_cycle_marks(self):
+        catalog = SnapshotCatalog("db", storage=self.storage)
+        for cycle, lsn in ((1, 4), (2, 4), (3, 9), (4, 12)):
+            catalog.mark_cycle(cycle, lsn)
+        self.assertEqual(catalog.cycles, {1: [1, 3, 4]})  # Cycle 2 wrote nothing
+        self.assertEqual(catalog.cycle_end(2), 4)
+        self.assertIsNone(catalog.cycle_end(0))
+        catalog.mark_cycle(2, 15)  # The cycle count started again: a new run
+        reloaded = SnapshotCatalog("db", storage=self.storage)
+        reloaded.load()
+        self.assertEqual((reloaded.cycles, reloaded.cycle_lsns), ({1: [1, 3, 4], 2: [2]}, {1: [4, 9, 12], 2: [15]}))
+        self.assertEqual((reloaded.cycle_end(3), reloaded.cycle_end(3, run=1)), (15, 9))
+        self.assertEqual(reloaded.run, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import time
+import unittest
+from db_handler import DBHandler
+from lock_manager import LockManager
+from profiler import Profiler
+from recovery_manager import RecoveryManager
+from storage import MemoryStorage
+from transaction_manager import TransactionManager
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.db_file = "test_profiler_db"
+        self.csv_file = "test_profiler.csv"
+        self.profiler = Profiler()
+        self.db_handler = DBHandler(db_file=self.db_file)
+        self.lock_manager = LockManager(timeout_cycles=5)
+        self.profiler.instrument_modules(db_handler=self.db_handler, lock_manager=self.lock_manager)
+
+    def test_calls_are_counted_per_component(self):
+        self.profiler.begin_cycle(0)
+        self.lock_manager.acquire_lock(1, 0, "exclusive")
+        self.db_handler.update_buffer(0, 1)
+        self.lock_manager.release_locks(1)
+        self.profiler.end_cycle()
+
+        self.assertEqual(self.profiler.call_counts["acquire_lock"], 1)
+        self.assertEqual(self.profiler.call_counts["update_buffer"], 1)
+        self.assertEqual(self.profiler.call_counts["release_locks"], 1)
+        self.assertEqual(len(self.profiler.cycles), 1)
+        cycle, wall_ns, breakdown = self.profiler.cycles[0]
+        self.assertEqual(cycle, 0)
+        self.assertLessEqual(sum(breakdown.values()), wall_ns)
+
+    def test_transaction_writes_are_timed_as_buffer_updates(self):
+        recovery_manager = RecoveryManager(self.db_handler, storage=MemoryStorage())
+        transaction_manager = TransactionManager(self.lock_manager, recovery_manager, self.db_handler)
+        transaction_manager.start_transaction(1)
+        transaction_manager.submit_operation(1, 4, "F")
+        transaction_manager.rollback_transaction(1)
+        self.assertEqual(self.profiler.call_counts["update_buffer"], 2)  # The write and its undo
+        self.assertEqual(self.db_handler.buffer[4], 0)
+
+    def test_nested_calls_are_timed_exclusively(self):
+        class Component:
+            def inner(self):
+                time.sleep(0.02)
+
+            def outer(self):
+                self.inner()
+
+        component = Component()
+        self.profiler.instrument(component, "inner")
+        self.profiler.instrument(component, "outer")
+        start = time.perf_counter_ns()
+        component.outer()
+        outer_inclusive_ns = time.perf_counter_ns() - start
+
+        inner_ns, outer_ns = self.profiler.total_ns["inner"], self.profiler.total_ns["outer"]
+        self.assertGreaterEqual(inner_ns, 20_000_000)
+        self.assertLess(outer_ns, inner_ns)  # The sleep is charged to inner only
+        self.assertGreaterEqual(outer_inclusive_ns, inner_ns + outer_ns)
+
+    def test_report_and_csv(self):
+        self.profiler.begin_cycle(0)
+        self.lock_manager.acquire_lock(1, 0, "shared")
+        self.profiler.end_cycle()
+        self.assertIn("acquire_lock", self.profiler.report())
+
+        self.profiler.write_cycles_csv(self.csv_file)
+        with open(self.csv_file, "r") as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], "cycle,wall_ns,acquire_lock")
+        self.assertTrue(rows[1].startswith("1,"))
+
+    def tearDown(self):
+        for file in [self.db_file, self.csv_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,8 +8,9 @@ class TestRecoveryManager(unittest.TestCase):
     def setUp(self):
         self.db_handler = DBHandler(db_file="test_db")
         self.recovery_manager = RecoveryManager(self.db_handler, log_file="test_log")
-        if os.path.exists(self.recovery_manager.log_file):
-            os.remove(self.recovery_manager.log_file)
+        for file in [self.recovery_manager.log_file, self.recovery_manager.index.index_file]:
+            if os.path.exists(file):
+                os.remove(file)
 
     def test_write_log(self):
         self.recovery_manager.write_log(1, operation="S")
@@ -40,6 +41,118 @@ class TestRecoveryManager(unittest.TestCase):
         self.recovery_manager.apply_logs()
         self.assertEqual(self.db_handler.buffer[0], 1)
 
+    def test_uncommitted_writes_are_undone(self):
+        """Writes of transactions without a commit entry are reverted even if they reached the database."""
+        self.db_handler.buffer[0] = 1  # Flushed while transaction 1 was still active
+        self.db_handler.buffer[1] = 1
+        self.recovery_manager.write_log(1, operation="S")
+        self.recovery_manager.write_log(1, data_id=0, old_value=0, operation="F")
+        self.recovery_manager.write_log(2, operation="S")
+        self.recovery_manager.write_log(2, data_id=1, old_value=0, operation="F")
+        self.recovery_manager.write_log(2, operation="C")
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 0)
+        self.assertEqual(self.db_handler.buffer[1], 1)
+        self.assertEqual(self.recovery_manager.last_transaction_id, 2)
+
+    def test_torn_tail_is_discarded(self):
+        self.recovery_manager.write_log(1, data_id=0, old_value=0, operation="F")
+        with open(self.recovery_manager.log_file, "a") as f:
+            f.write("1,C")  # Commit entry cut short by a crash
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 0)
+        self.recovery_manager.write_log(2, operation="S")
+        with open(self.recovery_manager.log_file, "r") as f:
+            self.assertEqual(f.read().splitlines(), ["1,0,0,F", "1,0,1,U", "1,R,2", "2,S"])
+
+    def test_iter_log_seeks_by_lsn(self):
+        recovery_manager = RecoveryManager(self.db_handler, log_file="test_log", index_interval=4)
+        for transaction_id in range(1, 11):
+            recovery_manager.write_log(transaction_id, operation="S")
+            recovery_manager.write_log(transaction_id, data_id=transaction_id, old_value=0, operation="F")
+        self.assertEqual(recovery_manager.index.lsns, [1, 5, 9, 13, 17])
+        records = list(recovery_manager.iter_log(start_lsn=14))
+        self.assertEqual([record.lsn for record in records], [14, 15, 16, 17, 18, 19, 20])
+        self.assertEqual(records[0].transaction_id, 7)
+        self.assertEqual(recovery_manager.record_at(20).data_id, 10)
+        self.assertIsNone(recovery_manager.record_at(21))
+
+    def test_iter_transaction_uses_index(self):
+        for transaction_id in (1, 2):
+            self.recovery_manager.write_log(transaction_id, operation="S")
+        self.recovery_manager.write_log(2, data_id=3, old_value=0, operation="F")
+        self.recovery_manager.write_log(1, operation="R")
+        self.recovery_manager.write_log(2, operation="C")
+        self.assertEqual(self.recovery_manager.index.transaction_starts[2], (2, 4))
+        self.assertEqual([record.operation for record in self.recovery_manager.iter_transaction(2)],
+                         ["S", "F", "C"])
+
+    def test_index_survives_restart_and_detects_staleness(self):
+        for transaction_id in range(1, 6):
+            self.recovery_manager.write_log(transaction_id, operation="S")
+        restarted = RecoveryManager(self.db_handler, log_file="test_log")
+        restarted.write_log(6, operation="S")
+        self.assertEqual(restarted.record_at(6).transaction_id, 6)
+
+        os.remove(self.recovery_manager.log_file)  # The index now points past the end of the log
+        fresh = RecoveryManager(self.db_handler, log_file="test_log")
+        self.assertEqual(fresh.write_log(1, operation="S"), 1)
+
+    def test_interrupted_rollback_is_completed(self):
+        self.db_handler.buffer = [0] * 32
+        start_lsn = self.recovery_manager.write_log(1, operation="S")
+        first_lsn = self.recovery_manager.write_log(1, data_id=0, old_value=0, operation="F", prev_lsn=start_lsn)
+        last_lsn = self.recovery_manager.write_log(1, data_id=1, old_value=0, operation="F", prev_lsn=first_lsn)
+        self.recovery_manager.write_log(1, data_id=1, old_value=1, operation="U", prev_lsn=first_lsn)
+        self.assertEqual(self.recovery_manager.record_at(last_lsn + 1).prev_lsn, first_lsn)
+        self.db_handler.buffer[0] = 1  # The crash hit after the compensation of data_id 1
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[:2], [0, 0])
+
+    def test_committed_compensation_is_redone(self):
+        self.db_handler.buffer = [0] * 32
+        self.recovery_manager.write_log(1, data_id=0, old_value=0, operation="F")
+        self.recovery_manager.write_log(1, data_id=0, old_value=1, operation="U")
+        self.recovery_manager.write_log(1, data_id=2, old_value=0, operation="F")
+        self.recovery_manager.write_log(1, operation="C")
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[:3], [0, 0, 1])
+
+    def test_released_compensated_write_is_not_replayed_over_later_commit(self):
+        self.db_handler.buffer = [0] * 32
+        write = self.recovery_manager.write_log
+        write(1, operation="S")
+        write(1, data_id=0, old_value=0, operation="F", prev_lsn=1)
+        write(1, data_id=0, old_value=1, operation="U", prev_lsn=1)  # Rollback to a savepoint releases data_id 0
+        write(2, operation="S")
+        write(2, data_id=0, old_value=0, operation="F", prev_lsn=4)
+        write(2, operation="C", prev_lsn=5)
+        write(1, operation="C", prev_lsn=3)
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 1)
+
+    def test_restart_undo_is_logged(self):
+        self.db_handler.buffer = [0] * 32
+        self.recovery_manager.write_log(1, operation="S")
+        self.recovery_manager.write_log(1, data_id=0, old_value=0, operation="F", prev_lsn=1)
+        self.recovery_manager.apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 0)
+        self.assertEqual([record.operation for record in self.recovery_manager.iter_transaction(1)],
+                         ["S", "F", "U", "R"])
+
+        # Data reused after the restart must not be undone by the next recovery
+        self.recovery_manager.write_log(2, operation="S")
+        self.recovery_manager.write_log(2, data_id=0, old_value=0, operation="F", prev_lsn=5)
+        self.recovery_manager.write_log(2, operation="C", prev_lsn=6)
+        RecoveryManager(self.db_handler, log_file="test_log").apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 1)
+
+    def tearDown(self):
+        # Clean up test files
+        for file in ["test_log", "test_log.idx"]:
+            if os.path.exists(file):
+                os.remove(file)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,138 @@
+import random
+import socket
+import threading
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from main import initialize_modules, simulation_loop
+from replication import LogShipper, ReplicationError, Standby
+from storage import MemoryStorage
+
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.primary_storage = MemoryStorage()
+        self.standby_storage = MemoryStorage()
+        self.modules = initialize_modules(5, storage=self.primary_storage)
+        self.recovery_manager = self.modules[1]
+        self.standby_errors = []
+
+    def start_standby(self, synchronous=False):
+        """Connect a standby on a thread to the primary; returns (standby, shipper, thread)."""
+        standby = Standby(storage=self.standby_storage)
+        primary_end, standby_end = socket.socketpair()
+        thread = threading.Thread(target=self.serve, args=(standby, standby_end), daemon=True)
+        thread.start()
+        shipper = LogShipper(self.recovery_manager, primary_end, synchronous=synchronous)
+        shipper.attach()
+        return standby, shipper, thread
+
+    def serve(self, standby, connection):
+        try:
+            standby.serve(connection)
+        except ReplicationError as e:
+            self.standby_errors.append(e)
+
+    def run_simulation(self, cycles, seed):
+        random.seed(seed)
+        with redirect_stdout(StringIO()):
+            return simulation_loop(*self.modules, cycles, 3, 0.7, 0.5, 0.2, cycle_delay=0, savepoint_interval=2)
+
+    def test_promoted_standby_matches_recovered_primary(self):
+        standby, shipper, thread = self.start_standby()
+        stats = self.run_simulation(150, seed=4)
+        shipper.close()
+        thread.join()
+        self.assertEqual(len(shipper.lag_samples), stats["committed"])
+
+        promoted = standby.promote(5)
+        recovered = initialize_modules(5, storage=self.primary_storage)[0]
+        self.assertEqual(promoted[0].buffer, recovered.buffer)
+        self.assertGreater(promoted[1].last_transaction_id, 0)
+        with self.assertRaises(ReplicationError):
+            standby.apply_entry(standby.next_lsn, "1,S")
+
+    def test_deferred_write_sets_are_shipped(self):
+        self.modules = initialize_modules(5, storage=self.primary_storage, deferred=True)
+        self.recovery_manager = self.modules[1]
+        standby, shipper, thread = self.start_standby(synchronous=True)
+        self.run_simulation(100, seed=6)
+        shipper.close()
+        thread.join()
+        commits = [record for record in self.recovery_manager.iter_log() if record.operation in ("C", "M")]
+        self.assertEqual((len(shipper.lag_samples), shipper.acked_lsn), (len(commits), commits[-1].lsn))
+        self.assertEqual(standby.promote(5)[0].buffer, initialize_modules(5, storage=self.primary_storage)[0].buffer)
+
+    def test_restarted_standby_catches_up(self):
+        self.run_simulation(40, seed=1)  # Backlog written before any standby connects
+        standby, shipper, thread = self.start_standby()
+        shipper.close()
+        thread.join()
+        self.assertEqual(standby.next_lsn, self.recovery_manager.next_lsn)
+
+        resume_lsn = standby.next_lsn
+        self.run_simulation(40, seed=2)
+        standby, shipper, thread = self.start_standby()  # Same files: continues from its next LSN
+        shipper.close()
+        thread.join()
+        self.assertEqual(standby.next_lsn, self.recovery_manager.next_lsn)
+        self.assertEqual(shipper.shipped, self.recovery_manager.next_lsn - resume_lsn)
+
+    def test_synchronous_commit_waits_for_the_standby(self):
+        standby, shipper, thread = self.start_standby(synchronous=True)
+        self.recovery_manager.write_log(1, operation="S")
+        self.recovery_manager.write_log(1, data_id=7, old_value=0, operation="F", prev_lsn=1)
+        commit_lsn = self.recovery_manager.write_log(1, operation="C", prev_lsn=2)
+        self.assertEqual(shipper.acked_lsn, commit_lsn)
+        self.assertEqual(standby.db_handler.buffer[7], 1)
+        shipper.close()
+        thread.join()
+
+    def test_new_standby_catches_up_from_archived_segments(self):
+        self.modules = initialize_modules(5, segment_size=1024, storage=self.primary_storage, archive="zlib")
+        self.recovery_manager = self.modules[1]
+        self.run_simulation(150, seed=2)
+        self.recovery_manager.wal.wait_for_archive()
+        self.assertGreater(self.recovery_manager.wal.first_lsn, 1)
+        standby, shipper, thread = self.start_standby()
+        shipper.close()
+        thread.join()
+        self.assertEqual((standby.next_lsn, self.standby_errors), (self.recovery_manager.next_lsn, []))
+
+    def test_gap_is_rejected(self):
+        standby = Standby(storage=self.standby_storage)
+        with self.assertRaises(ReplicationError):
+            standby.apply_entry(standby.next_lsn + 1, "1,S")
+
+    def test_standby_reports_an_entry_it_cannot_apply(self):
+        standby = Standby(storage=self.standby_storage)
+        primary_end, standby_end = socket.socketpair()
+        thread = threading.Thread(target=self.serve, args=(standby, standby_end), daemon=True)
+        thread.start()
+        with primary_end, primary_end.makefile("rwb") as stream:
+            self.assertEqual(stream.readline(), b"HELLO 1\n")
+            stream.write(b"3 1,S\n")  # Gap: the standby expects LSN 1
+            stream.flush()
+            self.assertTrue(stream.readline().startswith(b"ERROR Gap in the shipped log"))
+            self.assertEqual(stream.readline(), b"")  # Then the standby closes the connection
+        thread.join()
+        self.assertEqual(len(self.standby_errors), 1)
+
+    def test_standby_behind_the_released_log_is_refused(self):
+        self.modules = initialize_modules(5, segment_size=1024, storage=self.primary_storage)
+        self.recovery_manager = self.modules[1]
+        self.run_simulation(150, seed=2)
+        self.assertGreater(self.recovery_manager.wal.first_lsn, 1)
+        standby = Standby(storage=self.standby_storage)
+        primary_end, standby_end = socket.socketpair()
+        thread = threading.Thread(target=self.serve, args=(standby, standby_end), daemon=True)
+        thread.start()
+        with self.assertRaises(ReplicationError):
+            LogShipper(self.recovery_manager, primary_end).attach()
+        thread.join()
+        self.assertEqual(len(self.standby_errors), 1)
+        self.assertIn("refused", str(self.standby_errors[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -73,6 +73,18 @@ class TestSimulationLoop(unittest.TestCase):
         self.assertEqual(self.db_handler.buffer, [0] * 32, "Database should remain unchanged when no transactions "
                                                            "start.")
 
+    def test_simulation_returns_stats(self):
+        """
+        Test that the simulation loop reports what happened to every transaction it started.
+        """
+        stats = simulation_loop(
+            self.db_handler, self.recovery_manager, self.lock_manager, self.transaction_manager,
+            30, 3, 0.7, 0.5, 0.2, cycle_delay=0
+        )
+        self.assertEqual(stats["cycles"], 30)
+        self.assertEqual(stats["started"], stats["committed"] + stats["rolled_back"] + stats["deadlock_aborts"] +
+                         stats["active_at_end"])
+
     def test_simulation_all_rollbacks(self):
         """
         Test the simulation where all transactions rollback.
@@ -113,7 +125,7 @@ class TestSimulationLoop(unittest.TestCase):
 
     def tearDown(self):
         # Clean up test files
-        for file in [self.db_file, self.log_file, "test_adbsim.log"]:
+        for file in [self.db_file, self.log_file, self.log_file + ".idx", "test_adbsim.log"]:
             if os.path.exists(file):
                 os.remove(file)
 
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from crash_injection import CRASH_POINTS, run_crash_trial
+from db_handler import DBHandler
+from logging_config import get_logger, setup_logging, shutdown_logging
+from recovery_manager import RecoveryManager
+from storage import FileStorage, LatencyStorage, MemoryStorage, make_storage
+
+
+class TestMemoryStorage(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+
+    def test_text_and_binary_files(self):
+        with self.storage.open("data/file", "w") as f:
+            f.write("first\n")
+        with self.storage.open("data/file", "a") as f:
+            f.write("second\n")
+        with self.storage.open("data/file", "r") as f:
+            self.assertEqual(f.readlines(), ["first\n", "second\n"])
+        with self.storage.open("data/file", "rb+") as f:
+            f.seek(2)
+            f.write(b"R")
+            f.seek(0)
+            self.assertEqual(f.read(5), b"fiRst")
+            f.truncate(3)
+        self.assertEqual(self.storage.size("data/./file"), 3)
+
+    def test_missing_files(self):
+        self.assertFalse(self.storage.exists("missing"))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open("missing", "r")
+        with self.assertRaises(FileNotFoundError):
+            self.storage.remove("missing")
+
+    def test_allocate_reads_as_zeros(self):
+        with self.storage.open("segment", "wb") as f:
+            self.storage.allocate(f, 16)
+        with self.storage.open("segment", "rb") as f:
+            self.assertEqual(f.read(), bytes(16))
+
+    def test_replace_keeps_open_files(self):
+        with self.storage.open("old", "w") as f:
+            f.write("old")
+        with self.storage.open("new", "w") as f:
+            f.write("new")
+        reader = self.storage.open("old", "r")
+        self.storage.replace("new", "old")
+        self.assertEqual(reader.read(), "old")
+        reader.close()
+        self.assertFalse(self.storage.exists("new"))
+        with self.storage.open("old", "r") as f:
+            self.assertEqual(f.read(), "new")
+
+    def test_simulation_without_files(self):
+        db_handler = DBHandler(db_file="db", storage=self.storage)
+        recovery_manager = RecoveryManager(db_handler, log_file="log", segment_size=64)
+        recovery_manager.write_log(1, operation="S")
+        recovery_manager.write_log(1, data_id=3, old_value=0, operation="F")
+        recovery_manager.write_log(1, operation="C")
+        restarted = DBHandler(db_file="db", storage=self.storage)
+        RecoveryManager(restarted, log_file="log", segment_size=64).apply_logs()
+        self.assertEqual(restarted.buffer[3], 1)
+        self.assertTrue(self.storage.exists("db"))
+        self.assertFalse(os.path.exists("log.manifest"))
+
+    def test_crash_recovery_in_memory(self):
+        for point in CRASH_POINTS:
+            with self.subTest(point=point):
+                result = run_crash_trial("crash", point, 3, seed=5, cycles=60, storage=MemoryStorage())
+                self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_logging_to_memory(self):
+        shutdown_logging()
+        try:
+            setup_logging("adbsim.log", storage=self.storage)
+            get_logger("TestMemoryLogging").info("kept in memory")
+        finally:
+            shutdown_logging()
+        with self.storage.open("adbsim.log", "r") as f:
+            self.assertIn("kept in memory", f.read())
+
+
+class TestStorageSelection(unittest.TestCase):
+    def test_make_storage(self):
+        self.assertIsInstance(make_storage("file"), FileStorage)
+        self.assertIsInstance(make_storage("memory"), MemoryStorage)
+        slow = make_storage("memory", sync_latency=0.001)
+        self.assertIsInstance(slow, LatencyStorage)
+        self.assertIsInstance(slow.storage, MemoryStorage)
+        with self.assertRaises(ValueError):
+            make_storage("tape")
+
+    def test_file_storage_root(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FileStorage(os.path.join(directory, "run"))
+            db_handler = DBHandler(db_file="db", storage=storage)
+            db_handler.write_database()
+            self.assertTrue(os.path.exists(os.path.join(directory, "run", "db")))
+
+    def test_commit_syncs_are_delayed(self):
+        storage = LatencyStorage(MemoryStorage(), sync_latency=0.01)
+        recovery_manager = RecoveryManager(DBHandler(storage=storage))
+        recovery_manager.write_log(1, operation="S")
+        recovery_manager.write_log(1, operation="C")
+        self.assertEqual(storage.sync_count, 1)  # Only the commit entry is forced to disk
+        self.assertGreaterEqual(storage.sync_seconds, 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
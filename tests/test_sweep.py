@@ -0,0 +1,82 @@
+import csv
+import json
+import logging
+import os
+import tempfile
+import unittest
+from logging_config import hot_path_logging_enabled, set_hot_path_logging
+from sweep import RESULT_COLUMNS, parameter_grid, run_point, run_sweep, write_csv, write_json
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.point = {"cycles": 60, "trans_size": 3, "start_prob": 0.7, "write_prob": 0.5, "rollback_prob": 0.2,
+                      "timeout": 5}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parameter_grid(self):
+        grid = parameter_grid([10, 20], [3], [0.7], [0.5, 0.9], [0.2], [5])
+        self.assertEqual(len(grid), 2)  # write_prob 0.9 + rollback_prob 0.2 is rejected
+        self.assertEqual({point["cycles"] for point in grid}, {10, 20})
+        self.assertEqual(grid[0]["write_prob"], 0.5)
+
+    def test_run_point_is_isolated(self):
+        directory = os.path.join(self.temp_dir.name, "run")
+        row = run_point(self.point, seed=3, directory=directory)
+        self.assertTrue(os.path.exists(os.path.join(directory, "db")))
+        self.assertTrue(os.path.exists(os.path.join(directory, "log")))
+        self.assertEqual(row["cycles"], 60)
+        self.assertEqual(row["started"], row["committed"] + row["rolled_back"] + row["deadlock_aborts"] +
+                         row["active_at_end"])
+        self.assertGreater(row["log_entries"], row["started"])
+
+    def test_sweep_is_reproducible(self):
+        points = parameter_grid([40], [2, 4], [0.7], [0.5], [0.2], [5])
+        rows = run_sweep(points, repeats=2, seed=10, workers=2)
+        self.assertEqual([(row["trans_size"], row["repeat"], row["seed"]) for row in rows],
+                         [(2, 0, 10), (2, 1, 11), (4, 0, 12), (4, 1, 13)])
+        expected = run_point(points[1], seed=12)
+        self.assertEqual(rows[2]["committed"], expected["committed"])
+        self.assertEqual(rows[2]["log_entries"], expected["log_entries"])
+
+    def test_in_process_memory_sweep(self):
+        rows = run_sweep([self.point], repeats=2, seed=3, workers=0, storage="memory", sync_latency=0.0)
+        expected = run_point(self.point, seed=4)
+        self.assertEqual(rows[1]["committed"], expected["committed"])
+        self.assertEqual(rows[1]["log_entries"], expected["log_entries"])
+        self.assertGreaterEqual(rows[1]["syncs"], rows[1]["committed"])
+
+    def test_in_process_run_restores_the_callers_logging(self):
+        root_logger = logging.getLogger()
+        handler = logging.NullHandler()
+        root_logger.addHandler(handler)
+        default = hot_path_logging_enabled("DBHandler")
+        set_hot_path_logging(not default, "LockManager")
+        try:
+            run_sweep([self.point], workers=0, storage="memory", log_level=logging.INFO)
+            self.assertIn(handler, root_logger.handlers)
+            self.assertEqual(hot_path_logging_enabled("LockManager"), not default)
+            self.assertEqual(hot_path_logging_enabled("DBHandler"), default)
+        finally:
+            root_logger.removeHandler(handler)
+            set_hot_path_logging(default)
+
+    def test_outputs(self):
+        rows = run_sweep([self.point], workers=1)
+        csv_path = os.path.join(self.temp_dir.name, "results.csv")
+        json_path = os.path.join(self.temp_dir.name, "results.json")
+        write_csv(rows, csv_path)
+        write_json(rows, json_path)
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            self.assertEqual(tuple(reader.fieldnames), RESULT_COLUMNS)
+            self.assertEqual(int(next(reader)["committed"]), rows[0]["committed"])
+        with open(json_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@ from db_handler import DBHandler
 from transaction_manager import TransactionManager
 from lock_manager import LockManager
 from recovery_manager import RecoveryManager
+from storage import MemoryStorage
 
 
 class TestTransactionManager(unittest.TestCase):
@@ -45,8 +46,11 @@ class TestTransactionManager(unittest.TestCase):
         self.transaction_manager.start_transaction(2)
         self.transaction_manager.submit_operation(1, 0, "F")
         self.transaction_manager.submit_operation(2, 1, "F")
-        self.assertEqual(len(self.transaction_manager.transactions[1]["operations"]), 1)
-        self.assertEqual(len(self.transaction_manager.transactions[2]["operations"]), 1)
+        for transaction_id, data_id in ((1, 0), (2, 1)):
+            transaction = self.transaction_manager.transactions[transaction_id]
+            record = self.recovery_manager.record_at(transaction["last_lsn"])
+            self.assertEqual((record.transaction_id, record.data_id, record.operation), (transaction_id, data_id, "F"))
+            self.assertEqual(record.prev_lsn, transaction["first_lsn"])
 
     def test_blocked_transaction(self):
         """
@@ -59,6 +63,199 @@ class TestTransactionManager(unittest.TestCase):
         self.assertFalse(result)
         self.assertTrue(self.transaction_manager.transactions[2]["blocked"])
 
+    def test_blocked_transaction_is_unblocked_after_release(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.start_transaction(2)
+        self.transaction_manager.submit_operation(2, 0, "F")  # Blocked before any write of its own
+        self.transaction_manager.commit_transaction(1)
+        self.transaction_manager.unblock_transactions()
+        self.assertFalse(self.transaction_manager.transactions[2]["blocked"])
+        self.assertTrue(self.transaction_manager.submit_operation(2, 0, "F"))
+
+    def test_rollback_walks_the_log_chain(self):
+        self.db_handler.buffer = [0] * 32
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.start_transaction(2)
+        self.transaction_manager.submit_operation(2, 5, "F")
+        self.transaction_manager.submit_operation(1, 3, "F")
+        self.transaction_manager.rollback_transaction(1)
+        self.assertEqual(self.db_handler.buffer[:6], [0, 0, 0, 0, 0, 1])
+
+        entries = list(self.recovery_manager.iter_transaction(1))
+        self.assertEqual([(record.operation, record.data_id) for record in entries],
+                         [("S", None), ("F", 0), ("F", 3), ("U", 3), ("U", 0), ("R", None)])
+        self.assertEqual(entries[3].prev_lsn, entries[1].lsn)  # Compensation entries skip the undone write
+        self.assertEqual(entries[4].prev_lsn, entries[0].lsn)
+        self.assertEqual(entries[5].prev_lsn, entries[4].lsn)
+
+    def test_deadlock_victim_is_undone_before_its_locks_are_released(self):
+        self.db_handler.buffer = [0] * 32
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.start_transaction(2)
+        self.transaction_manager.submit_operation(2, 1, "F")
+        self.transaction_manager.submit_operation(1, 1, "F")  # Both wait for each other
+        self.transaction_manager.submit_operation(2, 0, "F")
+        for _ in range(5):
+            self.lock_manager.increment_cycle()
+
+        buffer_at_abort = []
+        rollback = self.transaction_manager.rollback_transaction
+
+        def observed_rollback(transaction_id):
+            result = rollback(transaction_id)
+            buffer_at_abort.append(list(self.db_handler.buffer[:2]))
+            return result
+
+        aborted = self.lock_manager.check_deadlocks(abort=observed_rollback)
+        self.assertEqual(sorted(aborted), [1, 2])
+        self.assertEqual(buffer_at_abort[-1], [0, 0])
+        self.assertEqual(self.lock_manager.locks, {})
+        self.assertEqual(self.transaction_manager.transactions[1]["state"], "rolled_back")
+
+    def test_rollback_to_savepoint(self):
+        self.db_handler.buffer = [0] * 32
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.assertTrue(self.transaction_manager.create_savepoint(1, "a"))
+        self.transaction_manager.submit_operation(1, 1, "F")
+        self.transaction_manager.create_savepoint(1, "b")
+        self.transaction_manager.submit_operation(1, 2, "F")
+        self.assertTrue(self.transaction_manager.rollback_to_savepoint(1, "a"))
+
+        self.assertEqual(self.db_handler.buffer[:3], [1, 0, 0])
+        self.assertEqual(self.lock_manager.locked_data_by_transaction[1], {0})
+        self.assertNotIn(1, self.lock_manager.locks)
+        self.assertEqual(list(self.transaction_manager.transactions[1]["savepoints"]), ["a"])
+        self.assertFalse(self.transaction_manager.rollback_to_savepoint(1, "b"))
+
+        self.transaction_manager.submit_operation(1, 3, "F")
+        self.transaction_manager.rollback_transaction(1)
+        self.assertEqual(self.db_handler.buffer[:4], [0, 0, 0, 0])
+        operations = [record.operation for record in self.recovery_manager.iter_transaction(1)]
+        self.assertEqual(operations, ["S", "F", "F", "F", "U", "U", "F", "U", "U", "R"])
+
+    def test_rollback_to_savepoint_unblocks(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.start_transaction(2)
+        self.transaction_manager.submit_operation(2, 1, "F")
+        self.transaction_manager.create_savepoint(2, "before_conflict")
+        self.transaction_manager.submit_operation(2, 2, "F")
+        self.assertFalse(self.transaction_manager.submit_operation(2, 0, "F"))  # Blocked by transaction 1
+        self.transaction_manager.rollback_to_savepoint(2, "before_conflict")
+
+        self.assertFalse(self.transaction_manager.transactions[2]["blocked"])
+        self.assertEqual(self.lock_manager.lock_queue[0], [])
+        self.assertEqual(self.lock_manager.locked_data_by_transaction[2], {1})
+        self.assertTrue(self.transaction_manager.submit_operation(2, 2, "F"))
+
+    def test_release_savepoint(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.create_savepoint(1, "a")
+        self.transaction_manager.create_savepoint(1, "b")
+        self.assertTrue(self.transaction_manager.release_savepoint(1, "a"))
+        self.assertEqual(self.transaction_manager.transactions[1]["savepoints"], {})
+        self.assertFalse(self.transaction_manager.release_savepoint(1, "a"))
+
+    def test_oldest_active_lsn(self):
+        self.assertIsNone(self.transaction_manager.oldest_active_lsn())
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.start_transaction(2)
+        second_lsn = self.transaction_manager.transactions[2]["first_lsn"]
+        self.transaction_manager.commit_transaction(1)
+        self.assertEqual(self.transaction_manager.oldest_active_lsn(), second_lsn)
+
+
+class TestDeferredTransactionManager(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.lock_manager = LockManager(timeout_cycles=5)
+        self.db_handler = DBHandler(storage=self.storage)
+        self.recovery_manager = RecoveryManager(self.db_handler, storage=self.storage)
+        self.transaction_manager = TransactionManager(self.lock_manager, self.recovery_manager, self.db_handler,
+                                                      deferred=True)
+
+    def log_entries(self):
+        return [(record.transaction_id, record.operation, record.items) for record in self.recovery_manager.iter_log()]
+
+    def test_commit_logs_one_entry_for_the_coalesced_write_set(self):
+        self.transaction_manager.start_transaction(1)
+        for data_id in (4, 2, 4, 7, 4, 7):
+            self.assertTrue(self.transaction_manager.submit_operation(1, data_id, "F"))
+        self.assertEqual(self.db_handler.buffer[:8], [0] * 8)  # Nothing reaches the buffer before the commit
+        self.assertEqual(self.transaction_manager.read_value(1, 4), 1)
+        self.assertEqual(self.transaction_manager.read_value(1, 7), 0)  # Written twice: back to the old value
+        self.assertEqual(self.log_entries(), [])
+
+        self.transaction_manager.commit_transaction(1)
+        self.assertEqual(self.log_entries(), [(1, "M", ((2, 0), (4, 0)))])
+        self.assertEqual(self.db_handler.buffer[:8], [0, 0, 1, 0, 1, 0, 0, 0])
+        self.assertEqual(self.lock_manager.locks, {})
+
+    def test_rollback_logs_only_its_end(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.start_transaction(2)
+        self.assertFalse(self.transaction_manager.submit_operation(2, 0, "F"))
+        self.assertIsNone(self.transaction_manager.oldest_active_lsn())
+        self.transaction_manager.rollback_transaction(1)
+        self.transaction_manager.unblock_transactions()
+        self.assertTrue(self.transaction_manager.submit_operation(2, 0, "F"))
+        self.transaction_manager.commit_transaction(2)
+        self.assertEqual(self.log_entries(), [(1, "R", None), (2, "M", ((0, 0),))])
+        self.assertEqual(self.db_handler.buffer[0], 1)
+
+    def test_rollback_to_savepoint_restores_the_write_set(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.create_savepoint(1, "a")
+        self.transaction_manager.submit_operation(1, 0, "F")
+        self.transaction_manager.submit_operation(1, 1, "F")
+        self.assertTrue(self.transaction_manager.rollback_to_savepoint(1, "a"))
+        self.assertEqual(self.transaction_manager.transactions[1]["writes"], {0: 1})
+        self.assertEqual(self.lock_manager.locked_data_by_transaction[1], {0})
+        self.transaction_manager.commit_transaction(1)
+        self.assertEqual(self.log_entries(), [(1, "M", ((0, 0),))])
+
+    def test_empty_write_set_logs_only_the_commit(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 3, "F")
+        self.transaction_manager.submit_operation(1, 3, "F")
+        self.transaction_manager.commit_transaction(1)
+        self.assertEqual(self.transaction_manager.transactions[1]["state"], "committed")
+        self.assertEqual(self.log_entries(), [(1, "C", None)])
+        self.assertEqual(self.db_handler.buffer[3], 0)
+
+    def test_transaction_ids_survive_a_restart_without_write_sets(self):
+        for transaction_id, end_transaction in ((1, self.transaction_manager.commit_transaction),
+                                                (2, self.transaction_manager.rollback_transaction)):
+            self.transaction_manager.start_transaction(transaction_id)
+            self.transaction_manager.submit_operation(transaction_id, transaction_id, "R")
+            end_transaction(transaction_id)
+
+        restarted = DBHandler(storage=self.storage)
+        restarted.read_database()
+        recovery_manager = RecoveryManager(restarted, storage=self.storage)
+        recovery_manager.apply_logs()
+        self.assertEqual(recovery_manager.last_transaction_id, 2)
+        self.assertEqual(restarted.buffer[:3], [0, 0, 0])
+
+    def test_recovery_redoes_committed_write_sets(self):
+        self.transaction_manager.start_transaction(1)
+        self.transaction_manager.submit_operation(1, 5, "F")
+        self.transaction_manager.submit_operation(1, 6, "F")
+        self.transaction_manager.commit_transaction(1)
+        self.transaction_manager.start_transaction(2)
+        self.transaction_manager.submit_operation(2, 6, "F")  # Never committed
+
+        restarted = DBHandler(storage=self.storage)
+        restarted.read_database()
+        RecoveryManager(restarted, storage=self.storage).apply_logs()
+        self.assertEqual(restarted.buffer[5:7], [1, 1])
+
 
 if __name__ == "__main__":
     unittest.main()
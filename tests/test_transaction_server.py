@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from load_generator import run_load
+from main import initialize_modules
+from recovery_manager import RecoveryManager
+from db_handler import DBHandler
+from storage import MemoryStorage
+from transaction_server import TransactionServer
+
+
+class TestTransactionServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.storage = MemoryStorage()
+        self.db_handler, self.recovery_manager, _, self.transaction_manager = modules = initialize_modules(
+            20, storage=self.storage)
+        self.server = TransactionServer(*modules, cycle_interval=0.005)
+        self.port = await self.server.start()
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for _, writer in self.clients:
+            writer.close()
+        await self.server.close()
+
+    async def connect(self):
+        client = await asyncio.open_connection("127.0.0.1", self.port)
+        self.clients.append(client)
+        return client
+
+    @staticmethod
+    async def request(client, *requests):
+        """Send requests in one write (pipelined) and return their responses."""
+        reader, writer = client
+        writer.write("".join(request + "\n" for request in requests).encode("ascii"))
+        await writer.drain()
+        return [(await asyncio.wait_for(reader.readline(), 2)).decode("ascii").strip() for _ in requests]
+
+    async def test_pipelined_transaction(self):
+        client = await self.connect()
+        responses = await self.request(client, "BEGIN", "WRITE 3", "READ 3", "SAVEPOINT a", "WRITE 4",
+                                       "ROLLBACK a", "COMMIT", "READ 3", "FETCH 3")
+        self.assertEqual(responses, ["OK 1", "OK 1", "OK 1", "OK", "OK 1", "OK", "OK", "ERR no open transaction",
+                                     "ERR unknown command 'FETCH'"])
+        self.assertEqual(self.db_handler.buffer[3:5], [1, 0])
+        self.assertEqual(self.transaction_manager.transactions, {})  # Finished transactions are forgotten
+
+        restarted = DBHandler(storage=self.storage)
+        RecoveryManager(restarted).apply_logs()
+        self.assertEqual(restarted.buffer[3:5], [1, 0])
+
+    async def test_blocked_request_waits_for_commit(self):
+        first, second = await self.connect(), await self.connect()
+        self.assertEqual(await self.request(first, "BEGIN", "WRITE 5"), ["OK 1", "OK 1"])
+        await self.request(second, "BEGIN")
+        second[1].write(b"WRITE 5\n")
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.db_handler.buffer[5], 1)  # Still blocked behind the first transaction
+        self.assertEqual(await self.request(first, "COMMIT"), ["OK"])
+        self.assertEqual((await asyncio.wait_for(second[0].readline(), 2)).strip(), b"OK 0")
+        self.assertEqual(self.server.stats["blocked_requests"], 1)
+
+    async def test_deadlock_victim_is_aborted(self):
+        first, second = await self.connect(), await self.connect()
+        await self.request(first, "BEGIN", "WRITE 1")
+        await self.request(second, "BEGIN", "WRITE 2")
+        first[1].write(b"WRITE 2\n")
+        second[1].write(b"WRITE 1\n")
+        responses = [(await asyncio.wait_for(client[0].readline(), 2)).decode("ascii").strip()
+                     for client in (first, second)]
+        aborted = [response for response in responses if response.startswith("ABORTED")]
+        self.assertTrue(aborted)  # Both may time out in the same cycle
+        self.assertEqual(self.server.stats["deadlock_aborts"], len(aborted))
+        expected = 0 if len(aborted) == 2 else 1  # The survivor toggles the victim's undone item too
+        self.assertEqual(self.db_handler.buffer[1:3], [expected, expected])
+
+    async def test_close_aborts_waiting_sessions(self):
+        first, second = await self.connect(), await self.connect()
+        await self.request(first, "BEGIN", "WRITE 6")
+        await self.request(second, "BEGIN", "WRITE 8")
+        second[1].write(b"WRITE 6\n")
+        while not self.server.waiters:
+            await asyncio.sleep(0.005)
+        await asyncio.wait_for(self.server.close(), 2)
+        self.assertEqual(self.server.stats["rolled_back"], 2)
+        self.assertEqual(self.server.waiters, {})
+        self.assertEqual(self.server.lock_manager.locks, {})
+        self.assertEqual(self.transaction_manager.transactions, {})
+        self.assertEqual(self.db_handler.buffer[6:9], [0, 0, 0])
+
+    async def test_disconnect_rolls_back(self):
+        reader, writer = await self.connect()
+        await self.request((reader, writer), "BEGIN", "WRITE 7")
+        self.assertEqual(self.db_handler.buffer[7], 1)
+        writer.close()
+        for _ in range(100):
+            if self.server.stats["rolled_back"]:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.server.stats["rolled_back"], 1)
+        self.assertEqual(self.db_handler.buffer[7], 0)
+
+    async def test_load_generator(self):
+        for pipeline in (False, True):
+            with self.subTest(pipeline=pipeline):
+                result = await run_load("127.0.0.1", self.port, connections=4, transactions=15, pipeline=pipeline,
+                                        seed=2)
+                self.assertEqual(result.transactions, 60)
+                self.assertEqual(result.committed + result.rolled_back + result.aborted, 60)
+                self.assertLessEqual(result.latency_p50_ms, result.latency_p99_ms)
+        self.assertEqual(self.server.stats["started"], 120)
+        self.assertEqual(self.transaction_manager.transactions, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
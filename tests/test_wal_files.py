@@ -0,0 +1,195 @@
+import os
+import tempfile
+import unittest
+from crash_injection import CRASH_POINTS, run_crash_trial
+from db_handler import DBHandler
+from recovery_manager import RecoveryManager
+from wal_files import ARCHIVE_CODECS, SegmentedLog, manifest_segment_size
+
+
+class TestSegmentedLog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.temp_dir.name, "log")
+        self.db_handler = DBHandler(db_file=os.path.join(self.temp_dir.name, "db"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_recovery_manager(self, segment_size=64, archive=None):
+        return RecoveryManager(self.db_handler, log_file=self.log_file, index_interval=4, segment_size=segment_size,
+                               archive=archive)
+
+    def write_transactions(self, recovery_manager, count, first_id=1):
+        for transaction_id in range(first_id, first_id + count):
+            recovery_manager.write_log(transaction_id, operation="S")
+            recovery_manager.write_log(transaction_id, data_id=transaction_id % 32, old_value=0, operation="F")
+            recovery_manager.write_log(transaction_id, operation="C")
+
+    def test_segments_are_preallocated_and_switched(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 10)
+        wal = recovery_manager.wal
+        self.assertGreater(len(wal.active), 1)
+        for number, _, _ in wal.active:
+            self.assertEqual(os.path.getsize(wal.segment_path(number)), 64)
+        self.assertTrue(os.path.exists(wal.manifest_file))
+        self.assertFalse(os.path.exists(self.log_file))
+
+    def test_reads_across_segments(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 10)
+        forward = list(recovery_manager.iter_log())
+        self.assertEqual([record.lsn for record in forward], list(range(1, 31)))
+        self.assertEqual(list(recovery_manager.iter_log_reverse()), forward[::-1])
+        self.assertEqual(len(recovery_manager.read_log()), 30)
+        self.assertEqual([record.operation for record in recovery_manager.iter_transaction(7)], ["S", "F", "C"])
+        self.assertEqual(recovery_manager.record_at(20).transaction_id, 7)
+
+    def test_restart_continues_the_log(self):
+        self.write_transactions(self.make_recovery_manager(), 5)
+        restarted = self.make_recovery_manager()
+        self.write_transactions(restarted, 5, first_id=6)
+        self.assertEqual([record.lsn for record in restarted.iter_log()], list(range(1, 31)))
+        self.assertEqual(restarted.last_transaction_id, 10)
+
+    def test_torn_tail_is_zeroed(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 3)
+        recovery_manager._append_entry("4,S", recovery_manager.next_lsn)  # No newline: a torn entry
+        restarted = self.make_recovery_manager()
+        restarted.write_log(4, operation="S")
+        self.assertEqual([record.operation for record in restarted.iter_transaction(4)], ["S"])
+        self.assertEqual(restarted.next_lsn, 11)
+        current = restarted.wal.active[-1]
+        with open(restarted.wal.segment_path(current[0]), "rb") as f:
+            self.assertEqual(f.read()[current[2]:].strip(b"\0"), b"")
+
+    def test_checkpoint_recycles_segments(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 10)
+        segments_before = len(recovery_manager.wal.active)
+        self.assertTrue(recovery_manager.checkpoint())
+        wal = recovery_manager.wal
+        self.assertEqual(len(wal.active), 1)
+        self.assertEqual(len(wal.spares), min(segments_before - 1, wal.max_spare_segments))
+        for number in wal.spares:
+            with open(wal.segment_path(number), "rb") as f:
+                self.assertEqual(f.read().strip(b"\0"), b"")
+
+        spare = wal.spares[0]
+        self.write_transactions(recovery_manager, 5, first_id=11)
+        self.assertNotIn(spare, wal.spares)
+        self.assertFalse(os.path.exists(wal.segment_path(spare)))  # Renamed to a new segment number
+        self.assertEqual(recovery_manager.iter_log().__next__().lsn, wal.first_lsn)
+
+    def test_checkpoint_keeps_active_transactions(self):
+        recovery_manager = self.make_recovery_manager()
+        first_lsn = recovery_manager.write_log(99, operation="S")
+        self.write_transactions(recovery_manager, 10)
+        self.assertFalse(recovery_manager.checkpoint(first_lsn))
+        self.assertEqual([record.operation for record in recovery_manager.iter_transaction(99)], ["S"])
+
+    def test_transaction_ids_survive_released_segments(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 10)
+        recovery_manager.checkpoint()
+        restarted = self.make_recovery_manager()
+        restarted.apply_logs()
+        self.assertEqual(restarted.last_transaction_id, 10)
+
+    def test_transactions_finished_before_checkpoint_are_not_undone(self):
+        recovery_manager = self.make_recovery_manager()
+        recovery_manager.write_log(1, operation="S")
+        recovery_manager.write_log(1, data_id=0, old_value=0, operation="F")
+        self.write_transactions(recovery_manager, 4, first_id=2)  # Fill the first segment
+        recovery_manager.write_log(1, data_id=0, old_value=1, operation="F")
+        recovery_manager.write_log(1, operation="R")
+        self.db_handler.buffer = [0] * 32
+        for transaction_id in range(2, 6):
+            self.db_handler.buffer[transaction_id] = 1
+        self.db_handler.write_database()
+        self.assertTrue(recovery_manager.checkpoint())
+        self.assertGreater(recovery_manager.wal.first_lsn, 2)  # Transaction 1 now starts before the log
+
+        self.db_handler.read_database()
+        self.make_recovery_manager().apply_logs()
+        self.assertEqual(self.db_handler.buffer[0], 0)
+
+    def test_manifest_segment_size_wins(self):
+        self.write_transactions(self.make_recovery_manager(), 3)
+        wal = SegmentedLog(self.log_file, 4096)
+        wal.open()
+        self.assertEqual(wal.segment_size, 64)
+        self.assertEqual(manifest_segment_size(self.log_file), 64)
+        self.assertIsNone(manifest_segment_size(self.log_file + ".missing"))
+
+    def test_oversized_entry_is_rejected(self):
+        recovery_manager = self.make_recovery_manager(segment_size=8)
+        with self.assertRaises(ValueError):
+            recovery_manager.write_log(1, data_id=31, old_value=0, operation="F")
+
+    def test_crash_recovery_with_small_segments(self):
+        for point in CRASH_POINTS:
+            for crash_after in (2, 19):
+                with self.subTest(point=point, crash_after=crash_after):
+                    result = run_crash_trial(self.temp_dir.name, point, crash_after, seed=crash_after, cycles=80,
+                                             segment_size=1024)
+                    self.assertTrue(result.consistent, f"mismatched data IDs {result.mismatches}")
+
+    def test_released_segments_are_archived(self):
+        for codec, (suffix, _) in ARCHIVE_CODECS.items():
+            with self.subTest(codec=codec):
+                for name in os.listdir(self.temp_dir.name):
+                    os.remove(os.path.join(self.temp_dir.name, name))
+                recovery_manager = self.make_recovery_manager(archive=codec)
+                self.write_transactions(recovery_manager, 10)
+                self.assertTrue(recovery_manager.checkpoint())
+                wal = recovery_manager.wal
+                wal.wait_for_archive()
+                self.assertEqual(len(wal.active), 1)
+                self.assertEqual(wal.spares, [])
+                for number, _, _, archived_codec in wal.archived:
+                    self.assertEqual(archived_codec, codec)
+                    self.assertFalse(os.path.exists(wal.segment_path(number)))
+                    self.assertTrue(os.path.exists(wal.segment_path(number) + suffix))
+
+                self.write_transactions(recovery_manager, 2, first_id=11)
+                restarted = self.make_recovery_manager(archive=codec)
+                self.assertEqual([record.lsn for record in restarted.iter_history()], list(range(1, 37)))
+                self.assertEqual(restarted.iter_log().__next__().lsn, wal.first_lsn)
+                self.assertEqual(next(restarted.iter_history(20)).transaction_id, 7)
+                self.assertGreater(restarted.wal.archive_sizes()[0], 0)
+
+    def test_interrupted_archive_is_resumed(self):
+        recovery_manager = self.make_recovery_manager(archive="zlib")
+        recovery_manager.wal._compress_segment = lambda segment: None  # Stopped before compressing
+        self.write_transactions(recovery_manager, 10)
+        recovery_manager.checkpoint()
+        pending = recovery_manager.wal.archived
+        self.assertTrue(all(os.path.exists(recovery_manager.wal.segment_path(number)) for number, *_ in pending))
+
+        restarted = self.make_recovery_manager(archive="zlib")
+        restarted.apply_logs()
+        restarted.wal.wait_for_archive()
+        self.assertEqual([codec for *_, codec in restarted.wal.archived], ["zlib"] * len(pending))
+        self.assertEqual([record.lsn for record in restarted.iter_history()], list(range(1, 31)))
+
+    def test_history_without_archive_starts_at_oldest_entry(self):
+        recovery_manager = self.make_recovery_manager()
+        self.write_transactions(recovery_manager, 10)
+        recovery_manager.checkpoint()
+        self.assertEqual(next(recovery_manager.iter_history()).lsn, recovery_manager.wal.first_lsn)
+
+    def test_archive_compresses_repetitive_log(self):
+        recovery_manager = self.make_recovery_manager(segment_size=4096, archive="lzma")
+        self.write_transactions(recovery_manager, 600)
+        recovery_manager.checkpoint()
+        recovery_manager.wal.wait_for_archive()
+        data_size, stored_size = recovery_manager.wal.archive_sizes()
+        self.assertGreater(data_size, 3 * 4000)
+        self.assertLess(stored_size * 4, data_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
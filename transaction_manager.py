@@ -1,91 +1,236 @@
-from logging_config import get_logger
+from logging_config import get_logger, get_hot_path_logger
 
 
 class TransactionManager:
-    def __init__(self, lock_manager, recovery_manager, db_handler):
+    def __init__(self, lock_manager, recovery_manager, db_handler, deferred=False):
+        """
+        Initialize the TransactionManager.
+        - lock_manager, recovery_manager, db_handler: The modules the transactions run against.
+        - deferred: Keep each transaction's writes in a private write set and log them as one entry at commit.
+        """
         self.lock_manager = lock_manager
         self.recovery_manager = recovery_manager
         self.db_handler = db_handler
+        self.deferred = deferred
         self.transactions = {}
         self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
         self.logger.info("TransactionManager initialized.")
 
     def start_transaction(self, transaction_id):
         """Start a new transaction."""
         if transaction_id in self.transactions:
-            self.logger.warning(f"Transaction {transaction_id} already exists.")
+            self.logger.warning("Transaction %s already exists.", transaction_id)
             return False
-        self.transactions[transaction_id] = {"state": "active", "operations": [], "blocked": False}
-        self.recovery_manager.write_log(transaction_id, operation="S")
-        self.logger.info(f"Transaction {transaction_id} started.")
+        if self.deferred:
+            # Nothing is logged before the commit; writes holds {data_id: new value} of the write set
+            self.transactions[transaction_id] = {"state": "active", "blocked": False, "first_lsn": None,
+                                                 "last_lsn": None, "savepoints": {}, "writes": {}}
+            self.logger.info("Transaction %s started.", transaction_id)
+            return True
+        # first_lsn and last_lsn are the ends of the transaction's log chain; its writes are not kept in memory
+        first_lsn = self.recovery_manager.write_log(transaction_id, operation="S")
+        self.transactions[transaction_id] = {"state": "active", "blocked": False, "first_lsn": first_lsn,
+                                             "last_lsn": first_lsn, "savepoints": {}}
+        self.logger.info("Transaction %s started.", transaction_id)
         return True
 
     def submit_operation(self, transaction_id, data_id, operation):
         """
         Submit an operation for a transaction.
-        - operation: 'F' for write.
+        - operation: 'F' for write, 'R' for read (takes a shared lock; reads are not logged, the caller reads
+          the value with read_value once the lock is held).
+        Returns False if the transaction is blocked (the lock request stays pending) or cannot run.
         """
         if transaction_id not in self.transactions:
-            self.logger.warning(f"Transaction {transaction_id} not found.")
+            self.logger.warning("Transaction %s not found.", transaction_id)
             return False
 
         if self.transactions[transaction_id]["state"] != "active":
-            self.logger.warning(f"Transaction {transaction_id} is not active.")
+            self.logger.warning("Transaction %s is not active.", transaction_id)
             return False
 
         if self.transactions[transaction_id]["blocked"]:
-            self.logger.info(f"Transaction {transaction_id} is blocked.")
+            self.hot_logger.info("Transaction %s is blocked.", transaction_id)
             return False
 
         # Attempt to acquire a lock
         lock_type = "exclusive" if operation == "F" else "shared"
         if not self.lock_manager.acquire_lock(transaction_id, data_id, lock_type):
-            self.logger.info(f"Transaction {transaction_id} is blocked waiting for lock on {data_id}.")
+            self.hot_logger.info("Transaction %s is blocked waiting for lock on %s.", transaction_id, data_id)
             self.transactions[transaction_id]["blocked"] = True
+            self.transactions[transaction_id]["pending_lock"] = (data_id, lock_type)
             return False
 
         # Log and execute the operation
-        if operation == "F":
+        if operation == "F" and self.deferred:
+            writes = self.transactions[transaction_id]["writes"]
+            old_value = self.read_value(transaction_id, data_id)
+            new_value = 1 if old_value == 0 else 0
+            if new_value == self.db_handler.buffer[data_id]:
+                del writes[data_id]  # Toggled back: nothing left to write
+            else:
+                writes[data_id] = new_value
+            self.hot_logger.info("Transaction %s deferred write on %s: %s -> %s.",
+                                 transaction_id, data_id, old_value, new_value)
+        elif operation == "F":
             old_value = self.db_handler.buffer[data_id]
             # Toggle the value for simplicity
             new_value = 1 if old_value == 0 else 0
-            self.db_handler.buffer[data_id] = new_value
-            self.recovery_manager.write_log(transaction_id, data_id=data_id, old_value=old_value, operation="F")
-            self.logger.info(f"Transaction {transaction_id} performed write on {data_id}: {old_value} -> {new_value}.")
-
-            # Record operation in transaction
-            self.transactions[transaction_id]["operations"].append((data_id, operation, old_value, new_value))
+            # Log before updating the buffer: update_buffer may flush the database
+            self.transactions[transaction_id]["last_lsn"] = self.recovery_manager.write_log(
+                transaction_id, data_id=data_id, old_value=old_value, operation="F",
+                prev_lsn=self.transactions[transaction_id]["last_lsn"])
+            self.db_handler.update_buffer(data_id, new_value)
+            self.hot_logger.info("Transaction %s performed write on %s: %s -> %s.",
+                                 transaction_id, data_id, old_value, new_value)
 
         return True
 
+    def read_value(self, transaction_id, data_id):
+        """Return a data value as the transaction sees it (its own deferred write, if any, or the buffer)."""
+        transaction = self.transactions.get(transaction_id)
+        if transaction is not None and data_id in transaction.get("writes", ()):
+            return transaction["writes"][data_id]
+        return self.db_handler.buffer[data_id]
+
     def rollback_transaction(self, transaction_id):
-        """Rollback a transaction."""
+        """
+        Rollback a transaction.
+        Its writes are undone by walking its log chain backwards (see RecoveryManager.undo_transaction) while
+        it still holds its locks. A deferred-update transaction drops its write set and logs a lone 'R' entry.
+        """
         if transaction_id not in self.transactions or self.transactions[transaction_id]["state"] != "active":
-            self.logger.warning(f"Cannot rollback transaction {transaction_id}.")
+            self.logger.warning("Cannot rollback transaction %s.", transaction_id)
             return False
 
+        transaction = self.transactions[transaction_id]
+        if self.deferred:
+            transaction["writes"] = {}
+            transaction["state"] = "rolled_back"
+            transaction["last_lsn"] = self.recovery_manager.write_log(transaction_id, operation="R")
+            self.lock_manager.release_locks(transaction_id)
+            self.logger.info("Transaction %s rolled back.", transaction_id)
+            return True
+
         # Revert changes made by the transaction
-        for data_id, operation, old_value, new_value in reversed(self.transactions[transaction_id]["operations"]):
-            if operation == "F":
-                self.db_handler.buffer[data_id] = old_value
-                self.logger.info(f"Rolled back write on {data_id}: {new_value} -> {old_value}.")
+        transaction["last_lsn"] = self.recovery_manager.undo_transaction(transaction_id, transaction["last_lsn"])
 
-        self.transactions[transaction_id]["state"] = "rolled_back"
-        self.recovery_manager.write_log(transaction_id, operation="R")
+        transaction["state"] = "rolled_back"
+        self.recovery_manager.write_log(transaction_id, operation="R", prev_lsn=transaction["last_lsn"])
         self.lock_manager.release_locks(transaction_id)
-        self.logger.info(f"Transaction {transaction_id} rolled back.")
+        self.logger.info("Transaction %s rolled back.", transaction_id)
+        return True
+
+    def create_savepoint(self, transaction_id, name):
+        """
+        Mark the current point of a transaction so later writes can be rolled back on their own.
+        The savepoint is the transaction's newest log entry plus the set of data IDs it has locked so far.
+        Reusing a name moves the savepoint.
+        """
+        if transaction_id not in self.transactions or self.transactions[transaction_id]["state"] != "active":
+            self.logger.warning("Cannot create savepoint %s for transaction %s.", name, transaction_id)
+            return False
+
+        transaction = self.transactions[transaction_id]
+        transaction["savepoints"].pop(name, None)
+        transaction["savepoints"][name] = {
+            "lsn": transaction["last_lsn"],
+            "locks": frozenset(self.lock_manager.locked_data_by_transaction.get(transaction_id, ())),
+            "writes": dict(transaction["writes"]) if self.deferred else None
+        }
+        self.hot_logger.info("Transaction %s created savepoint %s at LSN %s.", transaction_id, name,
+                             transaction["last_lsn"])
+        return True
+
+    def rollback_to_savepoint(self, transaction_id, name):
+        """
+        Undo the writes a transaction made after a savepoint and keep the transaction running.
+        Locks taken after the savepoint are released: every write made under them has just been undone, so no
+        other transaction can observe that they were ever held. Locks held at the savepoint are kept, as
+        strict 2PL requires. A pending lock request is withdrawn, which unblocks the transaction.
+        Savepoints created after this one are discarded; this one stays and can be rolled back to again.
+        """
+        if transaction_id not in self.transactions or self.transactions[transaction_id]["state"] != "active":
+            self.logger.warning("Cannot rollback transaction %s to savepoint %s.", transaction_id, name)
+            return False
+        transaction = self.transactions[transaction_id]
+        if name not in transaction["savepoints"]:
+            self.logger.warning("Transaction %s has no savepoint %s.", transaction_id, name)
+            return False
+
+        savepoint = transaction["savepoints"][name]
+        if self.deferred:
+            transaction["writes"] = dict(savepoint["writes"])
+        else:
+            transaction["last_lsn"] = self.recovery_manager.undo_transaction(
+                transaction_id, transaction["last_lsn"], stop_lsn=savepoint["lsn"])
+        names = list(transaction["savepoints"])
+        for later_name in names[names.index(name) + 1:]:
+            del transaction["savepoints"][later_name]
+
+        self.lock_manager.withdraw_requests(transaction_id)
+        transaction["blocked"] = False
+        transaction.pop("pending_lock", None)
+        later_locks = self.lock_manager.locked_data_by_transaction.get(transaction_id, set()) - savepoint["locks"]
+        for data_id in sorted(later_locks):
+            self.lock_manager.release_lock(transaction_id, data_id)
+        self.logger.info("Transaction %s rolled back to savepoint %s, releasing %s locks.", transaction_id, name,
+                         len(later_locks))
+        return True
+
+    def release_savepoint(self, transaction_id, name):
+        """Forget a savepoint (and the ones created after it); the writes made since are kept."""
+        if transaction_id not in self.transactions or name not in self.transactions[transaction_id]["savepoints"]:
+            self.logger.warning("Transaction %s has no savepoint %s.", transaction_id, name)
+            return False
+        savepoints = self.transactions[transaction_id]["savepoints"]
+        names = list(savepoints)
+        for later_name in names[names.index(name):]:
+            del savepoints[later_name]
         return True
 
     def commit_transaction(self, transaction_id):
-        """Commit a transaction."""
+        """
+        Commit a transaction.
+        A deferred-update transaction logs its write set as one 'M' entry (a lone 'C' entry if it is empty),
+        then applies it to the buffer.
+        """
         if transaction_id not in self.transactions or self.transactions[transaction_id]["state"] != "active":
-            self.logger.warning(f"Cannot commit transaction {transaction_id}.")
+            self.logger.warning("Cannot commit transaction %s.", transaction_id)
             return False
 
+        if self.deferred:
+            transaction = self.transactions[transaction_id]
+            items = [(data_id, self.db_handler.buffer[data_id]) for data_id in sorted(transaction["writes"])]
+            if items:
+                transaction["last_lsn"] = self.recovery_manager.write_log(transaction_id, operation="M", items=items)
+                for data_id, new_value in sorted(transaction["writes"].items()):
+                    self.db_handler.update_buffer(data_id, new_value)
+            else:
+                transaction["last_lsn"] = self.recovery_manager.write_log(transaction_id, operation="C")
+            transaction["writes"] = {}
+            transaction["state"] = "committed"
+            self.lock_manager.release_locks(transaction_id)
+            self.logger.info("Transaction %s committed.", transaction_id)
+            return True
+
         self.transactions[transaction_id]["state"] = "committed"
-        self.recovery_manager.write_log(transaction_id, operation="C")
+        self.recovery_manager.write_log(transaction_id, operation="C",
+                                        prev_lsn=self.transactions[transaction_id]["last_lsn"])
         self.lock_manager.release_locks(transaction_id)
-        self.logger.info(f"Transaction {transaction_id} committed.")
+        self.logger.info("Transaction %s committed.", transaction_id)
+        return True
+
+    def forget_transaction(self, transaction_id):
+        """
+        Drop a finished transaction from the transaction table, so a long-running front end does not keep
+        every transaction it ever ran. Returns False if the transaction is unknown or still active.
+        """
+        transaction = self.transactions.get(transaction_id)
+        if transaction is None or transaction["state"] == "active":
+            return False
+        del self.transactions[transaction_id]
         return True
 
     def unblock_transactions(self):
@@ -94,11 +239,20 @@ class TransactionManager:
         """
         for transaction_id in self.transactions:
             if self.transactions[transaction_id]["blocked"] and self.transactions[transaction_id]["state"] == "active":
-                pending_ops = self.transactions[transaction_id]["operations"]
-                if pending_ops:
-                    last_op = pending_ops[-1]
-                    data_id = last_op[0]
-                    lock_type = "exclusive" if last_op[1] == "F" else "shared"
+                # Retry the request the transaction blocked on (the lock manager may already have granted it)
+                pending_lock = self.transactions[transaction_id].get("pending_lock")
+                if pending_lock:
+                    data_id, lock_type = pending_lock
                     if self.lock_manager.acquire_lock(transaction_id, data_id, lock_type):
+                        del self.transactions[transaction_id]["pending_lock"]
                         self.transactions[transaction_id]["blocked"] = False
-                        self.logger.info(f"Transaction {transaction_id} is unblocked.")
+                        self.logger.info("Transaction %s is unblocked.", transaction_id)
+
+    def oldest_active_lsn(self):
+        """
+        Return the LSN of the start entry of the oldest active transaction, or None if none is active.
+        Log entries before it are not needed to undo any active transaction.
+        """
+        first_lsns = [transaction["first_lsn"] for transaction in self.transactions.values()
+                      if transaction["state"] == "active" and transaction["first_lsn"] is not None]
+        return min(first_lsns) if first_lsns else None
@@ -0,0 +1,265 @@
+from logging_config import get_logger, get_hot_path_logger, setup_logging, set_hot_path_logging
+from main import end_cycle, initialize_modules
+from storage import STORAGE_BACKENDS, make_storage
+import argparse
+import asyncio
+import logging
+
+# Requests of the line protocol, one per line; every request gets exactly one response line, in request order,
+# so clients may pipeline requests. Responses are "OK [value]", "ERR <message>" or "ABORTED <transaction_id>"
+# (the transaction was rolled back as a deadlock victim while the request waited for a lock).
+# - BEGIN: start a transaction for the connection; responds with its ID.
+# - READ <data_id>: take a shared lock and respond with the value.
+# - WRITE <data_id>: take an exclusive lock, toggle the value and respond with the new value.
+# - SAVEPOINT <name>: create a savepoint.
+# - ROLLBACK [<name>]: roll back the transaction, or only to the given savepoint.
+# - COMMIT: commit the transaction.
+# - PING: respond "OK" without touching the database (to measure protocol overhead).
+COMMANDS = ("BEGIN", "READ", "WRITE", "SAVEPOINT", "ROLLBACK", "COMMIT", "PING")
+
+
+class Session:
+    def __init__(self, peer):
+        """
+        Initialize the Session, the state of one client connection.
+        - peer: Address of the client.
+        """
+        self.peer = peer
+        self.transaction_id = None  # The connection's open transaction, if any
+        self.requests = 0
+
+
+class TransactionServer:
+    def __init__(self, db_handler, recovery_manager, lock_manager, transaction_manager, cycle_interval=0.01):
+        """
+        Initialize the TransactionServer, an asyncio TCP front end to the transaction manager.
+        Every connection is a session running one transaction at a time. All requests run on the event loop
+        thread, so the lock, log and database modules are used exactly as in the simulation loop. A request
+        that has to wait for a lock suspends only its own session; a ticker closes a cycle every
+        cycle_interval seconds (see main.end_cycle), which retries blocked requests, rolls back deadlock
+        victims after the lock timeout and flushes the database.
+        - db_handler, recovery_manager, lock_manager, transaction_manager: Modules from initialize_modules.
+        - cycle_interval: Seconds between cycles; the lock timeout is counted in cycles.
+        """
+        self.db_handler = db_handler
+        self.recovery_manager = recovery_manager
+        self.lock_manager = lock_manager
+        self.transaction_manager = transaction_manager
+        self.cycle_interval = cycle_interval
+        self.last_transaction_id = recovery_manager.last_transaction_id  # IDs stay unique across restarts
+        self.waiters = {}  # {transaction_id: future resolved once its pending lock request is granted or aborted}
+        self.stats = dict.fromkeys(["connections", "requests", "started", "committed", "rolled_back",
+                                    "deadlock_aborts", "blocked_requests", "cycles"], 0)
+        self._server = None
+        self._ticker = None
+        self._writers = set()
+        self._sessions = set()  # Tasks serving the connected clients
+        self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening and ticking. Returns the port (a free one if port is 0)."""
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        self._ticker = asyncio.create_task(self.run_cycles())
+        port = self._server.sockets[0].getsockname()[1]
+        self.logger.info("Transaction server listening on %s:%s.", host, port)
+        return port
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stop listening and ticking and close every connection; open transactions are rolled back.
+        Sessions waiting for a lock are no longer resumed by cycles, so their transactions are aborted like
+        deadlock victims. Returns once every session has finished.
+        """
+        self._server.close()
+        for transaction_id in list(self.waiters):
+            self.transaction_manager.rollback_transaction(transaction_id)
+            self.stats["rolled_back"] += 1
+            self._resume(transaction_id, False)
+        self._ticker.cancel()
+        for writer in list(self._writers):
+            writer.close()
+        if self._sessions:
+            await asyncio.wait(list(self._sessions))
+        self.logger.info("Transaction server stopped: %s", self.stats)
+
+    async def run_cycles(self):
+        while True:
+            await asyncio.sleep(self.cycle_interval)
+            self.run_cycle()
+
+    def run_cycle(self):
+        """Close one cycle and resume the sessions whose lock requests were decided."""
+        for transaction_id in end_cycle(self.db_handler, self.recovery_manager, self.lock_manager,
+                                        self.transaction_manager):
+            self.stats["deadlock_aborts"] += 1
+            self._resume(transaction_id, False)
+        self.stats["cycles"] += 1
+        self._resume_unblocked()
+
+    async def handle_connection(self, reader, writer):
+        """Serve one client: answer its requests in order until it disconnects."""
+        session = Session(writer.get_extra_info("peername"))
+        self._writers.add(writer)
+        self._sessions.add(asyncio.current_task())
+        self.stats["connections"] += 1
+        self.logger.info("Client %s connected.", session.peer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.endswith(b"\n"):
+                    break  # Disconnected (a request without a newline is never answered)
+                response = await self.execute(session, line.decode("ascii", "replace"))
+                writer.write(response.encode("ascii") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._sessions.discard(asyncio.current_task())
+            if session.transaction_id is not None:
+                self.hot_logger.info("Client %s left transaction %s open; rolling it back.", session.peer,
+                                     session.transaction_id)
+                self._finish(session, self.transaction_manager.rollback_transaction, "rolled_back")
+            writer.close()
+            self.logger.info("Client %s disconnected after %s requests.", session.peer, session.requests)
+
+    async def execute(self, session, line):
+        """Run one request of a session. Returns the response line without its newline."""
+        session.requests += 1
+        self.stats["requests"] += 1
+        parts = line.split()
+        command = parts[0].upper() if parts else ""
+        if command not in COMMANDS:
+            return f"ERR unknown command {command!r}"
+        if command == "PING":
+            return "OK"
+        if command == "BEGIN":
+            if session.transaction_id is not None:
+                return f"ERR transaction {session.transaction_id} is still open"
+            self.last_transaction_id += 1
+            session.transaction_id = self.last_transaction_id
+            self.transaction_manager.start_transaction(session.transaction_id)
+            self.stats["started"] += 1
+            return f"OK {session.transaction_id}"
+        if session.transaction_id is None:
+            return "ERR no open transaction"
+
+        if command in ("READ", "WRITE"):
+            if len(parts) != 2 or not parts[1].isdigit() or int(parts[1]) >= len(self.db_handler.buffer):
+                return f"ERR {command} needs a data ID between 0 and {len(self.db_handler.buffer) - 1}"
+            return await self._operate(session, int(parts[1]), "F" if command == "WRITE" else "R")
+        if command == "SAVEPOINT":
+            if len(parts) != 2:
+                return "ERR SAVEPOINT needs a name"
+            self.transaction_manager.create_savepoint(session.transaction_id, parts[1])
+            return "OK"
+        if command == "ROLLBACK" and len(parts) == 2:
+            if not self.transaction_manager.rollback_to_savepoint(session.transaction_id, parts[1]):
+                return f"ERR no savepoint {parts[1]}"
+            self._resume_unblocked()
+            return "OK"
+        if command == "ROLLBACK":
+            self._finish(session, self.transaction_manager.rollback_transaction, "rolled_back")
+            return "OK"
+        self._finish(session, self.transaction_manager.commit_transaction, "committed")
+        return "OK"
+
+    async def _operate(self, session, data_id, operation):
+        """Submit a read or write, waiting for the lock if needed. Returns the response line."""
+        transaction_id = session.transaction_id
+        while not self.transaction_manager.submit_operation(transaction_id, data_id, operation):
+            transaction = self.transaction_manager.transactions[transaction_id]
+            if not transaction["blocked"]:
+                return f"ERR transaction {transaction_id} cannot run"
+            self.stats["blocked_requests"] += 1
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[transaction_id] = future
+            if not await future:
+                session.transaction_id = None
+                self.transaction_manager.forget_transaction(transaction_id)
+                self.hot_logger.info("Transaction %s of client %s aborted as a deadlock victim.", transaction_id,
+                                     session.peer)
+                return f"ABORTED {transaction_id}"
+        return f"OK {self.transaction_manager.read_value(transaction_id, data_id)}"
+
+    def _finish(self, session, end_transaction, outcome):
+        """Commit or roll back the session's transaction, then resume the sessions waiting for its locks."""
+        end_transaction(session.transaction_id)
+        self.transaction_manager.forget_transaction(session.transaction_id)
+        session.transaction_id = None
+        self.stats[outcome] += 1
+        self._resume_unblocked()
+
+    def _resume_unblocked(self):
+        """Resume the waiting sessions whose lock requests can now be granted."""
+        if not self.waiters:
+            return
+        self.transaction_manager.unblock_transactions()
+        for transaction_id in list(self.waiters):
+            if not self.transaction_manager.transactions[transaction_id]["blocked"]:
+                self._resume(transaction_id, True)
+
+    def _resume(self, transaction_id, granted):
+        future = self.waiters.pop(transaction_id, None)
+        if future is not None and not future.done():
+            future.set_result(granted)
+
+
+async def run_server(host, port, timeout, cycle_interval, storage, segment_size=None, deferred=False):
+    """Recover the database, then serve clients until cancelled."""
+    modules = initialize_modules(timeout, segment_size=segment_size, storage=storage, deferred=deferred)
+    server = TransactionServer(*modules, cycle_interval=cycle_interval)
+    bound_port = await server.start(host, port)
+    print(f"Listening on {host}:{bound_port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        print("Server statistics:", server.stats)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Serve transactions over TCP with a line protocol (see COMMANDS in transaction_server.py)."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=7430, help="Port to listen on (default: 7430).")
+    parser.add_argument("--timeout", type=int, default=5,
+                        help="Cycles a transaction may wait for a lock before it is aborted (default: 5).")
+    parser.add_argument("--cycle-interval", type=float, default=0.01, metavar="SECONDS",
+                        help="Seconds between cycles (default: 0.01).")
+    parser.add_argument("--storage", default="file", choices=STORAGE_BACKENDS,
+                        help="Keep the db, log and adbsim.log files on disk or in memory (default: file).")
+    parser.add_argument("--data-dir", metavar="DIR",
+                        help="Directory of the files with --storage file (default: the current directory).")
+    parser.add_argument("--fsync-latency", type=float, default=0.0, metavar="SECONDS",
+                        help="Add this delay to every fsync to model a slow disk (default: 0).")
+    parser.add_argument("--wal-segment-size", type=int, metavar="BYTES",
+                        help="Split the WAL into segments of this size (default: a single log file).")
+    parser.add_argument("--deferred-writes", action="store_true",
+                        help="Log each transaction's writes as one entry at commit (see TransactionManager).")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                        help="Minimum level written to adbsim.log (default: INFO).")
+
+    parsed_args = parser.parse_args()
+    if parsed_args.cycle_interval <= 0:
+        parser.error("cycle_interval must be positive.")
+    if parsed_args.data_dir and parsed_args.storage != "file":
+        parser.error("--data-dir requires --storage file.")
+    return parsed_args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    server_storage = make_storage(args.storage, root=args.data_dir, sync_latency=args.fsync_latency)
+    setup_logging(level=getattr(logging, args.log_level), use_queue=True, storage=server_storage)
+    set_hot_path_logging(args.log_level == "DEBUG")
+    try:
+        asyncio.run(run_server(args.host, args.port, args.timeout, args.cycle_interval, server_storage,
+                               segment_size=args.wal_segment_size, deferred=args.deferred_writes))
+    except KeyboardInterrupt:
+        pass
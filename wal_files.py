@@ -0,0 +1,438 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging_config import get_logger, get_hot_path_logger
+from storage import FileStorage
+import gzip
+import lzma
+import threading
+
+# Codecs for archived WAL segments: {name: (file name suffix, opener(binary file object, mode))}.
+# gzip is zlib's deflate stream with a header; unlike raw zlib it gives a seekable reader.
+ARCHIVE_CODECS = {
+    "zlib": (".gz", lambda f, mode: gzip.GzipFile(fileobj=f, mode=mode)),
+    "lzma": (".xz", lambda f, mode: lzma.LZMAFile(f, mode)),
+}
+
+
+@contextmanager
+def open_log_file(storage, path):
+    """
+    Open a log file or segment for binary reading. A segment that has been archived since its path was
+    listed is read from its compressed file, decompressed on the fly.
+    """
+    try:
+        f = storage.open(path, "rb")
+    except FileNotFoundError:
+        f = None
+    if f is not None:
+        with f:
+            yield f
+        return
+    for suffix, opener in ARCHIVE_CODECS.values():
+        if storage.exists(path + suffix):
+            with storage.open(path + suffix, "rb") as raw, opener(raw, "rb") as decompressed:
+                yield decompressed
+            return
+    raise FileNotFoundError(f"No such log file: {path!r}")
+
+
+def manifest_segment_size(log_file, storage=None):
+    """Return the segment size recorded in the manifest of a segmented log, or None if there is no manifest."""
+    storage = storage or FileStorage()
+    manifest_file = log_file + ".manifest"
+    if not storage.exists(manifest_file):
+        return None
+    with storage.open(manifest_file, "r") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if parts[0] == "segment_size":
+                return int(parts[1])
+    return None
+
+
+class SingleFileLog:
+    def __init__(self, log_file, storage=None):
+        """
+        Initialize the SingleFileLog, the WAL kept in one ever-growing file.
+        Logical offsets are plain byte offsets into the file.
+        - log_file: Path of the WAL log file.
+        - storage: Storage holding the file; defaults to the local filesystem.
+        """
+        self.log_file = log_file
+        self.storage = storage or FileStorage()
+        self.first_lsn = 1  # The file is never truncated at the front
+        self.start_offset = 0
+        self.last_transaction_id = 0  # Nothing is ever released, so the log itself holds the highest ID
+        self.checkpoint_lsn = 0  # No checkpoints: recovery replays the whole log
+        self.logger = get_logger(self.__class__.__name__)
+
+    def exists(self):
+        return self.storage.exists(self.log_file)
+
+    def spans(self, archived=False):
+        """
+        Return the readable parts of the log as (path, logical offset of its first byte, length).
+        - archived: Also return archived parts (a single file has none).
+        """
+        if not self.exists():
+            return []
+        return [(self.log_file, 0, self.storage.size(self.log_file))]
+
+    def archive_position(self, lsn):
+        """Nothing is archived from a single file. Returns None."""
+        return None
+
+    def wait_for_archive(self):
+        """Nothing is archived from a single file."""
+
+    def open(self, repair=True):
+        """Prepare for appending; nothing to do for a single file."""
+
+    def append(self, line, lsn, sync=False):
+        """
+        Append one formatted entry.
+        - line: The entry, including its trailing newline.
+        - lsn: LSN of the entry (unused; the file has no segment boundaries).
+        - sync: Force the entry to stable storage before returning.
+        Returns the logical offset of the entry.
+        """
+        data = line.encode("ascii")
+        with self.storage.open(self.log_file, "ab") as f:
+            f.write(data)
+            if sync:
+                self.storage.sync(f)
+            return f.tell() - len(data)
+
+    def sync(self):
+        """Force everything appended so far to stable storage."""
+        if self.exists():
+            with self.storage.open(self.log_file, "rb+") as f:
+                self.storage.sync(f)
+
+    def starts_entry(self, offset):
+        """Return whether the given logical offset is the start of an entry."""
+        if offset == 0:
+            return True
+        with self.storage.open(self.log_file, "rb") as f:
+            f.seek(offset - 1)
+            return f.read(1) == b"\n"
+
+    def truncate(self, end_offset):
+        """Discard everything after end_offset (a torn last entry)."""
+        with self.storage.open(self.log_file, "rb+") as f:
+            f.truncate(end_offset)
+
+    def release_before(self, lsn, checkpoint_lsn, last_transaction_id):
+        """Entries are never released from a single file. Returns False."""
+        return False
+
+
+class SegmentedLog:
+    def __init__(self, log_file, segment_size, max_spare_segments=2, storage=None, archive=None,
+                 archive_in_background=True):
+        """
+        Initialize the SegmentedLog, the WAL split into fixed-size, preallocated segment files.
+        Segments are named <log_file>.000001, <log_file>.000002, ...; <log_file>.manifest lists the active
+        segments with the LSN of their first entry, the spare segments kept for recycling and the archived
+        segments.
+        An entry never spans two segments, so the logical offset of a byte is
+        segment number * segment_size + offset within the segment.
+        Preallocated space reads as zero bytes, so the data in a segment ends at its first zero byte.
+        - log_file: Base path of the WAL.
+        - segment_size: Size in bytes of every segment.
+        - max_spare_segments: Released segments kept for reuse; further ones are deleted.
+        - storage: Storage holding the segments and the manifest; defaults to the local filesystem.
+        - archive: Codec (a key of ARCHIVE_CODECS) compressing released segments to
+          <segment>.gz or <segment>.xz instead of recycling them, so the log history stays readable for
+          replay. None recycles released segments.
+        - archive_in_background: Compress on a worker thread, so checkpoints do not wait for it.
+        """
+        if archive is not None and archive not in ARCHIVE_CODECS:
+            raise ValueError(f"Unknown archive codec {archive!r}; expected one of {tuple(ARCHIVE_CODECS)}.")
+        self.log_file = log_file
+        self.storage = storage or FileStorage()
+        self.manifest_file = log_file + ".manifest"
+        self.segment_size = segment_size
+        self.max_spare_segments = max_spare_segments
+        self.active = []  # [[segment number, first LSN, data length]], oldest first
+        self.spares = []  # Segment numbers of zeroed files waiting to be reused
+        self.archived = []  # [[segment number, first LSN, data length, codec or None while uncompressed]]
+        self.archive = archive
+        self.archive_in_background = archive_in_background
+        self._archiver = None  # Worker thread pool, started with the first background archive
+        self._archive_jobs = []
+        self._manifest_lock = threading.Lock()  # The archiver rewrites the manifest too
+        self.last_transaction_id = 0  # Highest transaction ID in released segments
+        self.checkpoint_lsn = 0  # Transactions that finished before this LSN are in the database file
+        self.logger = get_logger(self.__class__.__name__)
+        self.hot_logger = get_hot_path_logger(self.__class__.__name__)
+
+    @property
+    def first_lsn(self):
+        return self.active[0][1] if self.active else 1
+
+    @property
+    def start_offset(self):
+        return self.active[0][0] * self.segment_size if self.active else 0
+
+    def segment_path(self, segment_number):
+        return f"{self.log_file}.{segment_number:06d}"
+
+    def exists(self):
+        return self.storage.exists(self.manifest_file)
+
+    def spans(self, archived=False):
+        """
+        Return the readable parts of the log as (path, logical offset of its first byte, length).
+        - archived: Start with the archived segments; their paths are those of the uncompressed segments
+          (see open_log_file).
+        """
+        spans = [(self.segment_path(number), number * self.segment_size, length)
+                 for number, _, length, _ in self.archived] if archived else []
+        spans.extend((self.segment_path(number), number * self.segment_size, length)
+                     for number, _, length in self.active)
+        return spans
+
+    def archive_position(self, lsn):
+        """
+        Return (first LSN, logical offset) of the archived segment holding the given LSN, or of the oldest
+        archived segment if the entry is older than the archive. Returns None if nothing is archived.
+        """
+        position = None
+        for number, first_lsn, _, _ in self.archived:
+            if position is not None and first_lsn > lsn:
+                break
+            position = (first_lsn, number * self.segment_size)
+        return position
+
+    def open(self, repair=True):
+        """
+        Load the manifest and find where the data of the newest segment ends.
+        Creates the first segment if the log does not exist yet and finishes archiving the segments an
+        interrupted run released, unless repair is False: then nothing is written.
+        """
+        self.wait_for_archive()
+        self.active, self.spares, self.archived = [], [], []
+        if self.exists():
+            with self.storage.open(self.manifest_file, "r") as f:
+                for line in f:
+                    parts = line.strip().split(",")
+                    if parts[0] == "segment_size" and int(parts[1]) != self.segment_size:
+                        self.logger.warning("Log %s uses %s-byte segments; ignoring the configured %s.",
+                                            self.log_file, parts[1], self.segment_size)
+                        self.segment_size = int(parts[1])
+                    elif parts[0] == "last_transaction_id":
+                        self.last_transaction_id = int(parts[1])
+                    elif parts[0] == "checkpoint_lsn":
+                        self.checkpoint_lsn = int(parts[1])
+                    elif parts[0] == "active":
+                        self.active.append([int(parts[1]), int(parts[2]), int(parts[3]) if parts[3] else None])
+                    elif parts[0] == "spare" and self.storage.exists(self.segment_path(int(parts[1]))):
+                        self.spares.append(int(parts[1]))
+                    elif parts[0] == "archived":
+                        self.archived.append([int(parts[1]), int(parts[2]), int(parts[3]), parts[4] or None])
+        if repair:
+            for segment in self.archived:
+                path = self.segment_path(segment[0])
+                if segment[3] is not None and self.storage.exists(path):
+                    self.storage.remove(path)  # Stopped after archiving the segment but before removing it
+                elif segment[3] is None and self.archive:
+                    self._archive(segment)  # Stopped before the segment was archived
+            if not self.active:
+                self._start_segment(1, 1)
+        if self.active:
+            current = self.active[-1]
+            current[2] = self._find_data_end(self.segment_path(current[0]))
+
+    def append(self, line, lsn, sync=False):
+        """
+        Append one formatted entry, moving to a new segment when it does not fit in the current one.
+        - line: The entry, including its trailing newline.
+        - lsn: LSN of the entry (becomes the first LSN of a new segment).
+        - sync: Force the entry to stable storage before returning.
+        Returns the logical offset of the entry.
+        """
+        data = line.encode("ascii")
+        if len(data) > self.segment_size:
+            raise ValueError(f"Log entry of {len(data)} bytes does not fit in a {self.segment_size}-byte segment.")
+        current = self.active[-1]
+        if current[2] + len(data) > self.segment_size:
+            self._start_segment(current[0] + 1, lsn)
+            current = self.active[-1]
+        with self.storage.open(self.segment_path(current[0]), "rb+") as f:
+            f.seek(current[2])
+            f.write(data)
+            if sync:
+                self.storage.sync(f, data_only=True)
+        offset = current[0] * self.segment_size + current[2]
+        current[2] += len(data)
+        return offset
+
+    def sync(self):
+        """Force everything appended to the current segment to stable storage."""
+        if not self.active:
+            return
+        with self.storage.open(self.segment_path(self.active[-1][0]), "rb+") as f:
+            self.storage.sync(f, data_only=True)
+
+    def starts_entry(self, offset):
+        """Return whether the given logical offset is the start of an entry."""
+        number, local_offset = divmod(offset, self.segment_size)
+        if local_offset == 0:
+            return True
+        path = self.segment_path(number)
+        if not self.storage.exists(path):
+            return False
+        with self.storage.open(path, "rb") as f:
+            f.seek(local_offset - 1)
+            return f.read(1) == b"\n"
+
+    def truncate(self, end_offset):
+        """Zero out everything after end_offset (a torn last entry), keeping the space allocated."""
+        current = self.active[-1]
+        local_end = end_offset - current[0] * self.segment_size
+        if 0 <= local_end < current[2]:
+            with self.storage.open(self.segment_path(current[0]), "rb+") as f:
+                f.seek(local_end)
+                f.write(bytes(current[2] - local_end))
+            current[2] = local_end
+
+    def release_before(self, lsn, checkpoint_lsn, last_transaction_id):
+        """
+        Release the segments whose entries all have LSNs below the given one (the newest segment is always
+        kept). Released segments are archived if an archive codec is set; otherwise they are zeroed and kept
+        as spares, up to max_spare_segments.
+        - lsn: Oldest LSN still needed.
+        - checkpoint_lsn: LSN of the next entry when the database file was last written; recovery skips the
+          transactions that finished before it. Remembered in the manifest with the release.
+        - last_transaction_id: Highest transaction ID so far, remembered in the manifest because its
+          entries may be released.
+        Returns True if any segment was released.
+        """
+        released = []
+        while len(self.active) > 1 and self.active[1][1] <= lsn:
+            released.append(self.active.pop(0))
+        if not released:
+            return False
+
+        self.checkpoint_lsn = checkpoint_lsn
+        self.last_transaction_id = max(self.last_transaction_id, last_transaction_id)
+        if self.archive:
+            if self.archived and self.archived[-1][0] + 1 != released[0][0]:
+                self.logger.warning("Log segments before %s were recycled; the archive restarts there.",
+                                    released[0][0])
+                self.archived = []
+            self.archived.extend([number, first_lsn, length, None] for number, first_lsn, length in released)
+            self._write_manifest()
+            for segment in self.archived[-len(released):]:
+                self._archive(segment)
+            self.logger.info("Archiving log segments %s; %s active.", [segment[0] for segment in released],
+                             len(self.active))
+            return True
+
+        for number in (segment[0] for segment in released):
+            if len(self.spares) < self.max_spare_segments:
+                self._zero_fill(self.segment_path(number))
+                self.spares.append(number)
+            else:
+                self.storage.remove(self.segment_path(number))
+        self._write_manifest()
+        self.logger.info("Released log segments %s; %s active, %s spare.", [segment[0] for segment in released],
+                         len(self.active), len(self.spares))
+        return True
+
+    def wait_for_archive(self):
+        """Wait until the segments handed to the background archiver are compressed."""
+        jobs, self._archive_jobs = self._archive_jobs, []
+        for job in jobs:
+            job.result()
+
+    def archive_sizes(self):
+        """Return (bytes of log data archived, bytes the archive takes) over the compressed segments."""
+        data_size = stored_size = 0
+        for number, _, length, codec in self.archived:
+            if codec is not None:
+                data_size += length
+                stored_size += self.storage.size(self.segment_path(number) + ARCHIVE_CODECS[codec][0])
+        return data_size, stored_size
+
+    def _archive(self, segment):
+        """Compress a released segment, on the worker thread if archive_in_background is set."""
+        if not self.archive_in_background:
+            self._compress_segment(segment)
+            return
+        if self._archiver is None:
+            self._archiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wal-archiver")
+        self._archive_jobs = [job for job in self._archive_jobs if not job.done()]
+        self._archive_jobs.append(self._archiver.submit(self._compress_segment, segment))
+
+    def _compress_segment(self, segment):
+        """
+        Write the data of a released segment to its compressed file, record it in the manifest, then remove
+        the segment. Until the manifest is written the segment stays readable; a failed attempt is retried
+        the next time the log is opened.
+        """
+        number, _, length, _ = segment
+        path = self.segment_path(number)
+        suffix, opener = ARCHIVE_CODECS[self.archive]
+        temp_file = path + suffix + ".tmp"
+        try:
+            with self.storage.open(path, "rb") as source, self.storage.open(temp_file, "wb") as target:
+                with opener(target, "wb") as compressed:
+                    compressed.write(source.read(length))
+                self.storage.sync(target)
+            self.storage.replace(temp_file, path + suffix)
+            segment[3] = self.archive
+            self._write_manifest()
+            self.storage.remove(path)
+        except OSError as e:
+            self.logger.error("Could not archive log segment %s: %s", number, e)
+            return
+        self.hot_logger.info("Archived log segment %s (%s bytes of data, %s compressed).", number, length,
+                             self.storage.size(path + suffix))
+
+    def _start_segment(self, number, first_lsn):
+        """Seal the current segment and make a new one (a recycled spare if available) current."""
+        path = self.segment_path(number)
+        if self.spares:
+            self.storage.replace(self.segment_path(self.spares.pop(0)), path)
+            self.hot_logger.info("Recycled a spare segment as log segment %s.", number)
+        else:
+            with self.storage.open(path, "wb") as f:
+                self.storage.allocate(f, self.segment_size)
+            self.hot_logger.info("Preallocated log segment %s (%s bytes).", number, self.segment_size)
+        self.active.append([number, first_lsn, 0])
+        self._write_manifest()
+
+    def _zero_fill(self, path):
+        with self.storage.open(path, "rb+") as f:
+            f.write(bytes(self.segment_size))
+
+    def _find_data_end(self, path):
+        """Return the offset of the first zero byte of a segment (its size if there is none)."""
+        with self.storage.open(path, "rb") as f:
+            position = 0
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    return position
+                zero = chunk.find(b"\0")
+                if zero != -1:
+                    return position + zero
+                position += len(chunk)
+
+    def _write_manifest(self):
+        """Rewrite the manifest atomically; the length of the newest segment is left blank."""
+        with self._manifest_lock:
+            lines = [f"segment_size,{self.segment_size}\n", f"last_transaction_id,{self.last_transaction_id}\n",
+                     f"checkpoint_lsn,{self.checkpoint_lsn}\n"]
+            lines.extend(f"archived,{number},{first_lsn},{length},{codec or ''}\n"
+                         for number, first_lsn, length, codec in list(self.archived))
+            for position, (number, first_lsn, length) in enumerate(self.active):
+                sealed_length = "" if position == len(self.active) - 1 else length
+                lines.append(f"active,{number},{first_lsn},{sealed_length}\n")
+            lines.extend(f"spare,{number}\n" for number in self.spares)
+            temp_file = self.manifest_file + ".tmp"
+            with self.storage.open(temp_file, "w") as f:
+                f.writelines(lines)
+            self.storage.replace(temp_file, self.manifest_file)